@@ -1,3 +1,3 @@
-__all__ = ['fasta_io', 'fasta_logic']
+__all__ = ['fasta_io', 'fasta_logic', 'fasta_export', 'fasta_server', 'fasta_watch', 'fasta_key', 'fasta_kmers', 'fasta_distance', 'fasta_cli']
 __version__ = '0.2.5'
-from . import fasta_io, fasta_logic
+from . import fasta_io, fasta_logic, fasta_export, fasta_server, fasta_watch, fasta_key, fasta_kmers, fasta_distance
@@ -0,0 +1,309 @@
+''' Command line interface of fastachar
+
+Usage::
+
+    fastachar-cli serve [--host HOST] [--port PORT] [--workers N]
+                        [--max-alignments N] [--root DIR] [NAME=FILENAME ...]
+    fastachar-cli watch [--interval SECONDS] [--xlsx] CASEFILE [CASEFILE ...]
+    fastachar-cli windows [--widths W [W ...]] [--top K] [--species SPECIES ...]
+                          [--output FILENAME] FASTA
+    fastachar-cli classify (--reference FASTA | --key KEYFILE) [--save-key KEYFILE]
+                           [--output FILENAME] [--all-species] QUERIES
+    fastachar-cli screen (--reference FASTA | --kmers KMERFILE) [--save-kmers KMERFILE]
+                         [-k K] [--processes N] READS [READS ...]
+    fastachar-cli distances [--ignore-gaps] [--labels FILENAME] [--processes N]
+                            FASTA OUTPUT
+    fastachar-cli gaps [--ignore-gaps] [--processes N] [--output FILENAME] FASTA
+'''
+import argparse
+import logging
+import sys
+
+from . import (fasta_distance, fasta_export, fasta_io, fasta_key, fasta_kmers, fasta_logic,
+               fasta_server, fasta_watch)
+from .fasta_doc import ERRORS
+
+
+def add_hdr_fmt_arguments(parser):
+    '''
+    Add the options for parsing fasta headers to a parser
+
+    Notes
+    -----
+    Options that are not given default to those of 
+    :meth:`fastachar.fasta_io.Alignment.set_fasta_hdr_fmt`.
+    '''
+    parser.add_argument('--header-format',
+                        help='regular expression of the fasta headers, containing {ID} and {SPECIES}')
+    parser.add_argument('--id-regex', help='regular expression matching the IDs')
+    parser.add_argument('--species-regex', help='regular expression matching the species names')
+
+
+def get_hdr_fmt(args):
+    '''
+    Get the header format options as keywords of :meth:`fastachar.fasta_io.Alignment.set_fasta_hdr_fmt`
+    '''
+    hdr_fmt = dict(header_format=args.header_format, IDregex=args.id_regex, SPECIESregex=args.species_regex)
+    return dict((k, v) for k, v in hdr_fmt.items() if v is not None)
+
+
+def cmd_serve(args):
+    '''
+    Run the HTTP analysis service, see :mod:`fastachar.fasta_server`
+    '''
+    alignments = {}
+    for item in args.alignments:
+        name, sep, filename = item.partition("=")
+        if not sep or not name or not filename:
+            raise SystemExit("Alignments must be given as NAME=FILENAME ({}).".format(item))
+        alignments[name] = filename
+    fasta_server.serve(alignments, host=args.host, port=args.port,
+                       max_alignments=args.max_alignments, workers=args.workers,
+                       root=args.root, **get_hdr_fmt(args))
+    return 0
+
+
+def cmd_watch(args):
+    '''
+    Re-run case files when their fasta files change, see :mod:`fastachar.fasta_watch`
+    '''
+    formats = ('txt', 'xlsx') if args.xlsx else ('txt',)
+    try:
+        watcher = fasta_watch.Watcher(args.case_files, formats, args.interval)
+    except ValueError as e:
+        raise SystemExit(e.args[0])
+    watcher.run()
+    return 0
+
+
+def cmd_windows(args):
+    '''
+    Report the windows with the most MDCs per species, see
+    :meth:`fastachar.fasta_logic.SequenceLogic.scan_windows`
+    '''
+    alignment = fasta_io.Alignment()
+    alignment.set_fasta_hdr_fmt(**get_hdr_fmt(args))
+    error, arg = alignment.load(args.fasta)
+    if error:
+        raise SystemExit("{} {}".format(ERRORS.get(error, ERRORS[fasta_io.ERROR_UNKNOWN]), arg))
+    species = args.species or None
+    if species:
+        unknown = set(species) - set(alignment.get_species_list()[0])
+        if unknown:
+            raise SystemExit("Unknown species: {}".format(", ".join(sorted(unknown))))
+    logic = fasta_logic.SequenceLogic()
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        report = fasta_io.Report(args.fasta, output_filename=output)
+        for sp, set_A, windows in logic.iter_species_windows(alignment.sequences, args.widths, args.top,
+                                                             species, alignment.get_column_counts()):
+            report.report_windows("{} ({} sequences)".format(sp, len(set_A)), windows)
+        report.report_footer()
+    except ValueError as e:
+        raise SystemExit(e.args[0])
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+def cmd_classify(args):
+    '''
+    Compare query sequences with a diagnostic key, see :mod:`fastachar.fasta_key`
+    '''
+    if args.key:
+        key = fasta_key.DiagnosticKey.load(args.key)
+    else:
+        alignment = fasta_io.Alignment()
+        alignment.set_fasta_hdr_fmt(**get_hdr_fmt(args))
+        error, arg = alignment.load(args.reference)
+        if error:
+            raise SystemExit("{} {}".format(ERRORS.get(error, ERRORS[fasta_io.ERROR_UNKNOWN]), arg))
+        key = fasta_key.DiagnosticKey.from_sequences(alignment.sequences, args.method)
+    if args.save_key:
+        key.save(args.save_key)
+    identifications = key.iter_classify(fasta_key.iter_query_sequences(args.queries))
+    try:
+        if args.output:
+            fasta_export.Export(args.format).export_identifications(args.output, identifications, args.all_species)
+            return 0
+        for sequence, matches in identifications:
+            consistent = [r for r in matches if r.is_consistent]
+            if consistent:
+                species = ", ".join(["%s (%d of %d, %d missing)"%(r.species, r.matches, r.n_diagnostic, r.missing)
+                                     for r in consistent])
+            else:
+                species = "no consistent species"
+            print("{}: {}".format(sequence.ID, species))
+    except ValueError as e:
+        raise SystemExit(e.args[0])
+    return 0
+
+
+def cmd_screen(args):
+    '''
+    Count diagnostic k-mers per species in files of reads, see :mod:`fastachar.fasta_kmers`
+    '''
+    if args.kmers:
+        screener = fasta_kmers.KmerScreener.load(args.kmers)
+    else:
+        alignment = fasta_io.Alignment()
+        alignment.set_fasta_hdr_fmt(**get_hdr_fmt(args))
+        error, arg = alignment.load(args.reference)
+        if error:
+            raise SystemExit("{} {}".format(ERRORS.get(error, ERRORS[fasta_io.ERROR_UNKNOWN]), arg))
+        screener = fasta_kmers.KmerScreener.from_sequences(alignment.sequences, args.k, args.method)
+    if args.save_kmers:
+        screener.save(args.save_kmers)
+    for fn in args.reads:
+        try:
+            n_reads, results = screener.screen(fn, args.processes)
+        except (ImportError, OSError) as e:
+            raise SystemExit("{}: {}".format(fn, e))
+        print("{}: {} reads".format(fn, n_reads))
+        for r in sorted(results, key=lambda r: (-r.reads, r.species)):
+            print("%40s: %8d reads %10d k-mers"%(r.species, r.reads, r.hits))
+    return 0
+
+
+def cmd_distances(args):
+    '''
+    Write the matrix of pairwise distances, see :mod:`fastachar.fasta_distance`
+    '''
+    alignment = fasta_io.Alignment()
+    alignment.set_fasta_hdr_fmt(**get_hdr_fmt(args))
+    error, arg = alignment.load(args.fasta)
+    if error:
+        raise SystemExit("{} {}".format(ERRORS.get(error, ERRORS[fasta_io.ERROR_UNKNOWN]), arg))
+    engine = fasta_distance.DistanceEngine(alignment.sequences, args.ignore_gaps)
+    engine.write_matrix(args.output, args.block_size, args.processes)
+    if args.labels:
+        with open(args.labels, 'w') as fp:
+            for s in alignment.sequences:
+                fp.write("{}\t{}\n".format(s.ID, s.species))
+    return 0
+
+
+def cmd_gaps(args):
+    '''
+    Report the barcode gap per species, see
+    :meth:`fastachar.fasta_distance.DistanceEngine.compute_barcode_gaps`
+    '''
+    alignment = fasta_io.Alignment()
+    alignment.set_fasta_hdr_fmt(**get_hdr_fmt(args))
+    error, arg = alignment.load(args.fasta)
+    if error:
+        raise SystemExit("{} {}".format(ERRORS.get(error, ERRORS[fasta_io.ERROR_UNKNOWN]), arg))
+    engine = fasta_distance.DistanceEngine(alignment.sequences, args.ignore_gaps)
+    results = engine.compute_barcode_gaps(args.block_size, args.processes)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        report = fasta_io.Report(args.fasta, output_filename=output)
+        report.report_barcode_gaps(args.fasta, results)
+        report.report_footer()
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+def create_parser():
+    '''
+    Create the argument parser
+
+    Returns
+    -------
+    :class:`argparse.ArgumentParser`
+    '''
+    parser = argparse.ArgumentParser(prog='fastachar-cli', description='Compare sets of DNA sequences.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print progress messages')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    p = subparsers.add_parser('serve', help='run a local HTTP analysis service')
+    p.add_argument('alignments', nargs='*', metavar='NAME=FILENAME',
+                   help='alignments to register at start up')
+    p.add_argument('--host', default='127.0.0.1', help='host name or address to listen on')
+    p.add_argument('--port', type=int, default=8000, help='port to listen on')
+    p.add_argument('--workers', type=int, default=4, help='number of worker threads')
+    p.add_argument('--max-alignments', type=int, default=4,
+                   help='maximum number of alignments kept in memory')
+    p.add_argument('--root', metavar='DIR',
+                   help='directory of fasta files that clients may register (default: none)')
+    add_hdr_fmt_arguments(p)
+    p.set_defaults(func=cmd_serve)
+    p = subparsers.add_parser('watch', help='re-run case files when their fasta files change')
+    p.add_argument('case_files', nargs='+', metavar='CASEFILE', help='case files (.fc)')
+    p.add_argument('--interval', type=float, default=2., help='polling interval in seconds')
+    p.add_argument('--xlsx', action='store_true', help='write xlsx reports as well')
+    p.set_defaults(func=cmd_watch)
+    p = subparsers.add_parser('windows', help='find the windows with the most MDCs per species')
+    p.add_argument('fasta', metavar='FASTA', help='fasta file')
+    p.add_argument('--widths', type=int, nargs='+', default=[100], metavar='W',
+                   help='widths of the windows in positions')
+    p.add_argument('--top', type=int, default=5, metavar='K',
+                   help='number of non-overlapping windows per width and species')
+    p.add_argument('--species', nargs='+', metavar='SPECIES',
+                   help='species to scan, each against all other sequences (default: all species)')
+    p.add_argument('--output', metavar='FILENAME', help='write the report to a file instead of stdout')
+    add_hdr_fmt_arguments(p)
+    p.set_defaults(func=cmd_windows)
+    p = subparsers.add_parser('classify', help='compare query sequences with a diagnostic key')
+    p.add_argument('queries', metavar='QUERIES', help='fasta file of query sequences, aligned to the reference')
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument('--reference', metavar='FASTA', help='reference alignment to compile the key from')
+    group.add_argument('--key', metavar='KEYFILE', help='compiled key')
+    p.add_argument('--save-key', metavar='KEYFILE', help='save the compiled key')
+    p.add_argument('--method', choices=['MDC', 'potential_MDC_only'], default='MDC',
+                   help='method with which the key is compiled')
+    p.add_argument('--output', metavar='FILENAME',
+                   help='write matches, conflicts and missing data per query and species to a table')
+    p.add_argument('--format', choices=['csv', 'tsv', 'jsonl', 'parquet'],
+                   help='format of the table (default: from the extension)')
+    p.add_argument('--all-species', action='store_true',
+                   help='write all species to the table, not only those with matches')
+    add_hdr_fmt_arguments(p)
+    p.set_defaults(func=cmd_classify)
+    p = subparsers.add_parser('screen', help='count diagnostic k-mers per species in files of reads')
+    p.add_argument('reads', nargs='+', metavar='READS', help='fasta or fastq files of reads')
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument('--reference', metavar='FASTA', help='reference alignment to derive the k-mers from')
+    group.add_argument('--kmers', metavar='KMERFILE', help='saved k-mers')
+    p.add_argument('--save-kmers', metavar='KMERFILE', help='save the diagnostic k-mers')
+    p.add_argument('-k', type=int, default=21, help='length of the k-mers')
+    p.add_argument('--method', choices=['MDC', 'potential_MDC_only'], default='MDC',
+                   help='method with which the diagnostic positions are determined')
+    p.add_argument('--processes', type=int, help='number of worker processes (default: number of cpus)')
+    add_hdr_fmt_arguments(p)
+    p.set_defaults(func=cmd_screen)
+    p = subparsers.add_parser('distances', help='write the matrix of pairwise p-distances')
+    p.add_argument('fasta', metavar='FASTA', help='fasta file')
+    p.add_argument('output', metavar='OUTPUT', help='output file of float32 values, row by row')
+    p.add_argument('--ignore-gaps', action='store_true', help='do not compare positions with gaps')
+    p.add_argument('--labels', metavar='FILENAME', help='write the ID and species of each row to a file')
+    p.add_argument('--block-size', type=int, default=512, help='number of rows and columns of a tile')
+    p.add_argument('--processes', type=int, help='number of worker processes (default: number of cpus)')
+    add_hdr_fmt_arguments(p)
+    p.set_defaults(func=cmd_distances)
+    p = subparsers.add_parser('gaps', help='report the barcode gap per species')
+    p.add_argument('fasta', metavar='FASTA', help='fasta file')
+    p.add_argument('--ignore-gaps', action='store_true', help='do not compare positions with gaps')
+    p.add_argument('--block-size', type=int, default=512, help='number of rows and columns of a tile')
+    p.add_argument('--processes', type=int, help='number of worker processes (default: number of cpus)')
+    p.add_argument('--output', metavar='FILENAME', help='write the report to a file instead of stdout')
+    add_hdr_fmt_arguments(p)
+    p.set_defaults(func=cmd_gaps)
+    return parser
+
+
+def main(argv=None):
+    '''
+    Main function of the command line interface
+    '''
+    args = create_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(message)s")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+''' Module for computing pairwise distances between aligned sequences
+
+The distance between two sequences is the p-distance: the fraction of the
+positions compared on which the sequences differ. Positions on which either
+sequence is masked (see :class:`fastachar.fasta_logic.Sequence`) are not
+compared, so that masked ends are excluded pairwise. Following the set
+semantics of :class:`fastachar.fasta_logic.Char`, two characters differ if
+they have no nucleotide in common; for example, R and A do not differ. Gaps
+are a fifth state, unless they are ignored.
+
+Each sequence is represented by a bitset per nucleotide, with a bit per
+position, so that a pair of sequences is compared with a few operations on
+(long) integers. The distance matrix is computed in tiles by a pool of
+processes, and can be streamed to a file as single precision floats, so that
+large matrices never have to be held in memory. Likewise, the barcode gap
+of each species (its maximum intra- and minimum inter-species distance) is
+accumulated tile by tile.
+'''
+from array import array
+from collections import namedtuple
+import multiprocessing
+
+from .fasta_logic import BASES, BYTE_MASKS
+
+try:
+    popcount = int.bit_count
+except AttributeError: # python < 3.10
+    def popcount(x):
+        return bin(x).count("1")
+
+
+class BarcodeGapResult(namedtuple('BarcodeGapResult', 'species n_sequences max_intra min_inter nearest')):
+    ''' Intra- and inter-species distances of a species
+
+    Parameters
+    ----------
+    species : str
+        species name
+    n_sequences : int
+        number of sequences of the species
+    max_intra : float or None
+        maximum distance between two sequences of the species, None if the 
+        species has a single sequence.
+    min_inter : float or None
+        minimum distance between a sequence of the species and a sequence of
+        another species, None if there are no other species.
+    nearest : str or None
+        the species at the minimum distance (the nearest neighbour)
+    '''
+    __slots__ = ()
+
+    @property
+    def gap(self):
+        ''' barcode gap, the minimum inter- minus the maximum intra-species distance, 
+        or None if either is undefined '''
+        if self.max_intra is None or self.min_inter is None:
+            return None
+        return self.min_inter - self.max_intra
+
+
+class DistanceEngine(object):
+    '''
+    Pairwise p-distances of a list of aligned sequences
+
+    Parameters
+    ----------
+    sequences : list of :class:`fastachar.fasta_logic.Sequence`
+        aligned sequences
+    ignore_gaps : bool, optional
+        if True, positions where either sequence has a gap are not compared.
+
+    Attributes
+    ----------
+    bitsets : list of int
+        for each sequence, the concatenated bitsets of the nucleotides
+    unmasked : list of int
+        for each sequence, the bitset of the positions compared
+    ambiguous : list of bool
+        for each sequence, whether it has ambiguous characters
+    '''
+    def __init__(self, sequences, ignore_gaps=False):
+        self.sequences = sequences
+        self.length = len(sequences[0]) if sequences else 0
+        self.n_bases = len(BASES) - 1 if ignore_gaps else len(BASES)
+        tables = [bytes([49 if m & (1<<b) else 48 for m in BYTE_MASKS]) for b in range(self.n_bases)]
+        unambiguous = bytes([c for c in range(256) if BYTE_MASKS[c] & (BYTE_MASKS[c] - 1) == 0])
+        self.bitsets = []
+        self.unmasked = []
+        self.ambiguous = []
+        for s in sequences:
+            data = s.get_masked_bytes()[::-1]
+            planes = [int(data.translate(table), 2) for table in tables]
+            unmasked = 0
+            bitset = 0
+            for b, plane in enumerate(planes):
+                unmasked |= plane
+                bitset |= plane << (b * self.length)
+            self.bitsets.append(bitset)
+            self.unmasked.append(unmasked)
+            self.ambiguous.append(bool(data.translate(None, unambiguous)))
+
+    def get_data(self):
+        '''
+        Get the data needed to compute distances, see :func:`pairwise_distance`
+        '''
+        return self.bitsets, self.unmasked, self.ambiguous, self.length, self.n_bases
+
+    def distance(self, i, j):
+        '''
+        Compute the distance between two sequences
+
+        Parameters
+        ----------
+        i : int
+            index of the first sequence
+        j : int
+            index of the second sequence
+
+        Returns
+        -------
+        float
+            p-distance, or nan if there are no positions to compare.
+        '''
+        return pairwise_distance(self.get_data(), i, j)
+
+    def iter_tiles(self, block_size=512, processes=None):
+        '''
+        Compute the distance matrix in tiles
+
+        Parameters
+        ----------
+        block_size : int, optional
+            number of rows and columns of a tile
+        processes : int or None, optional
+            number of worker processes. If None, the number of cpus. If 1, the
+            tiles are computed in this process.
+
+        Yields
+        ------
+        tuple of (int, int, int, int, :class:`array.array`)
+            first row, first column, number of rows and number of columns of
+            a tile, and its distances (float32, row by row). Only the tiles on
+            and above the diagonal are computed; the matrix is symmetric.
+        '''
+        for tile in self.map_tiles(_distance_tile, self.get_data(), block_size, processes):
+            yield tile
+
+    def map_tiles(self, func, data, block_size=512, processes=None):
+        '''
+        Apply a function to all tiles on and above the diagonal
+
+        Parameters
+        ----------
+        func : callable
+            module level function called with a tile (first row, end row, 
+            first column, end column) and data
+        data : tuple
+            data passed to func, starting with the items of :meth:`get_data`
+        block_size : int, optional
+            number of rows and columns of a tile
+        processes : int or None, optional
+            number of worker processes. If None, the number of cpus. If 1, the
+            tiles are computed in this process.
+
+        Yields
+        ------
+        the results of func, in the order of the tiles.
+        '''
+        n = len(self.sequences)
+        tasks = [(i0, min(i0 + block_size, n), j0, min(j0 + block_size, n))
+                 for i0 in range(0, n, block_size) for j0 in range(i0, n, block_size)]
+        if processes == 1:
+            for task in tasks:
+                yield func(task, data)
+        else:
+            with multiprocessing.Pool(processes, _distance_init, (data,)) as pool:
+                for r in pool.imap(func, tasks):
+                    yield r
+
+    def compute_barcode_gaps(self, block_size=512, processes=None):
+        '''
+        Compute the maximum intra- and minimum inter-species distance of each species
+
+        Parameters
+        ----------
+        block_size : int, optional
+            number of rows and columns of a tile
+        processes : int or None, optional
+            number of worker processes
+
+        Returns
+        -------
+        list of :class:`BarcodeGapResult`
+            one per species, sorted by species name.
+
+        Notes
+        -----
+        The distances of each tile are reduced to per-species statistics by 
+        the worker processes, and the statistics of the tiles are merged, so
+        that the distance matrix is never held in memory. Pairs without 
+        positions to compare are skipped.
+        '''
+        species = sorted(set(s.species for s in self.sequences))
+        index = dict((sp, i) for i, sp in enumerate(species))
+        labels = [index[s.species] for s in self.sequences]
+        stats = {}
+        for tile_stats in self.map_tiles(_barcode_gap_tile, self.get_data() + (labels,), block_size, processes):
+            for sp, (max_intra, min_inter, nearest) in tile_stats.items():
+                _update_stats(stats, sp, max_intra, min_inter, nearest)
+        n_sequences = [0] * len(species)
+        for i in labels:
+            n_sequences[i] += 1
+        results = []
+        for i, sp in enumerate(species):
+            max_intra, min_inter, nearest = stats.get(i, (None, None, None))
+            results.append(BarcodeGapResult(sp, n_sequences[i], max_intra, min_inter,
+                                            None if nearest is None else species[nearest]))
+        return results
+
+    def write_matrix(self, fn, block_size=512, processes=None):
+        '''
+        Write the distance matrix to a file
+
+        Parameters
+        ----------
+        fn : str
+            filename
+        block_size : int, optional
+            number of rows and columns of a tile
+        processes : int or None, optional
+            number of worker processes
+
+        Notes
+        -----
+        The file contains the n x n matrix as single precision floats in
+        native byte order, row by row, in the order of the sequences (it can
+        be read with ``numpy.fromfile(fn, 'float32').reshape(n, n)``). Only a
+        tile is held in memory at a time.
+        '''
+        n = len(self.sequences)
+        with open(fn, 'w+b') as fp:
+            fp.truncate(n * n * 4)
+            for i0, j0, rows, cols, tile in self.iter_tiles(block_size, processes):
+                for r in range(rows):
+                    fp.seek(((i0 + r) * n + j0) * 4)
+                    tile[r*cols:(r+1)*cols].tofile(fp)
+                if i0 != j0:
+                    for c in range(cols):
+                        fp.seek(((j0 + c) * n + i0) * 4)
+                        tile[c::cols].tofile(fp)
+
+
+def pairwise_distance(data, i, j):
+    '''
+    Compute the p-distance between two sequences
+
+    Parameters
+    ----------
+    data : tuple
+        see :meth:`DistanceEngine.get_data`
+    i : int
+        index of the first sequence
+    j : int
+        index of the second sequence
+
+    Returns
+    -------
+    float
+    '''
+    bitsets, unmasked, ambiguous, length, n_bases = data
+    n = popcount(unmasked[i] & unmasked[j])
+    if not n:
+        return float('nan')
+    common = bitsets[i] & bitsets[j]
+    if ambiguous[i] and ambiguous[j]:
+        # Positions may share more than one nucleotide; count them once.
+        folded = 0
+        mask = (1 << length) - 1
+        for b in range(n_bases):
+            folded |= common >> (b * length)
+        common = folded & mask
+    return 1 - popcount(common) / n
+
+
+_distance_data = None
+
+
+def _distance_init(data):
+    global _distance_data
+    _distance_data = data
+
+
+def _distance_tile(task, data=None):
+    ''' Compute a tile of the distance matrix '''
+    data = data or _distance_data
+    bitsets, unmasked, ambiguous, _, _ = data
+    i0, i1, j0, j1 = task
+    nan = float('nan')
+    tile = array('f')
+    for i in range(i0, i1):
+        x_i, u_i = bitsets[i], unmasked[i]
+        row = []
+        for j in range(j0, j1):
+            if ambiguous[i] and ambiguous[j]:
+                row.append(pairwise_distance(data, i, j))
+                continue
+            n = popcount(u_i & unmasked[j])
+            row.append(1 - popcount(x_i & bitsets[j]) / n if n else nan)
+        tile.extend(row)
+    return i0, j0, i1 - i0, j1 - j0, tile
+
+
+def _update_stats(stats, sp, max_intra, min_inter, nearest):
+    ''' Merge the statistics of a species into stats '''
+    old = stats.get(sp)
+    if old is None:
+        stats[sp] = (max_intra, min_inter, nearest)
+        return
+    if old[0] is not None and (max_intra is None or old[0] > max_intra):
+        max_intra = old[0]
+    if old[1] is not None and (min_inter is None or old[1] <= min_inter):
+        min_inter, nearest = old[1], old[2]
+    stats[sp] = (max_intra, min_inter, nearest)
+
+
+def _barcode_gap_tile(task, data=None):
+    ''' Reduce a tile of the distance matrix to per-species statistics '''
+    data = data or _distance_data
+    bitsets, unmasked, ambiguous, _, _, labels = data
+    distance_data = data[:5]
+    i0, i1, j0, j1 = task
+    # per species: [maximum intra-species distance, minimum inter-species distance, nearest species]
+    stats = {}
+    for i in range(i0, i1):
+        x_i, u_i, sp_i = bitsets[i], unmasked[i], labels[i]
+        # On the diagonal tiles, only the pairs above the diagonal.
+        for j in range(max(j0, i + 1), j1):
+            if ambiguous[i] and ambiguous[j]:
+                d = pairwise_distance(distance_data, i, j)
+                if d != d:
+                    continue
+            else:
+                n = popcount(u_i & unmasked[j])
+                if not n:
+                    continue
+                d = 1 - popcount(x_i & bitsets[j]) / n
+            sp_j = labels[j]
+            if sp_i == sp_j:
+                s = stats.setdefault(sp_i, [None, None, None])
+                if s[0] is None or d > s[0]:
+                    s[0] = d
+            else:
+                for sp, other in ((sp_i, sp_j), (sp_j, sp_i)):
+                    s = stats.setdefault(sp, [None, None, None])
+                    if s[1] is None or d < s[1]:
+                        s[1], s[2] = d, other
+    return stats
@@ -0,0 +1,367 @@
+''' Module for exporting results in machine-readable, columnar formats
+
+The results of the comparisons (molecular diagnostic characters, non-unique
+characters and per-species summaries) are written as tables in tidy
+format, that is, one row per position and sequence (or species). The rows
+are written as soon as they are produced, so that the complete table is
+never held in memory.
+
+Supported formats are CSV, TSV, JSON Lines and, if pyarrow is installed,
+Parquet.
+
+Attributes
+----------
+MDC_FIELDS : list of tuple of (str, str)
+    names and types of the columns of a table with molecular diagnostic characters
+
+NUCS_FIELDS : list of tuple of (str, str)
+    names and types of the columns of a table with non-unique characters
+
+SUMMARY_FIELDS : list of tuple of (str, str)
+    names and types of the columns of a table with per-species summaries
+
+LEAVE_ONE_OUT_FIELDS : list of tuple of (str, str)
+    names and types of the columns of a table with the impact of leaving out single sequences
+
+KEY_FIELDS : list of tuple of (str, str)
+    names and types of the columns of a table with identifications of query sequences
+'''
+import csv
+import json
+import os
+
+from .fasta_logic import mask_to_bases
+
+
+MDC_FIELDS = [('position', 'int'), ('state_A', 'str'), ('state_B', 'str'),
+              ('set', 'str'), ('species', 'str'), ('ID', 'str'), ('char', 'str')]
+
+NUCS_FIELDS = [('position', 'int'), ('state', 'str'), ('potentially_unique', 'bool'),
+               ('species', 'str'), ('ID', 'str'), ('char', 'str')]
+
+SUMMARY_FIELDS = [('position', 'int'), ('set', 'str'), ('species', 'str'),
+                  ('n_sequences', 'int'), ('state', 'str')]
+
+LEAVE_ONE_OUT_FIELDS = [('set', 'str'), ('species', 'str'), ('ID', 'str'),
+                        ('position', 'int'), ('change', 'str')]
+
+KEY_FIELDS = [('query', 'str'), ('species', 'str'), ('n_diagnostic', 'int'),
+              ('matches', 'int'), ('conflicts', 'int'), ('missing', 'int')]
+
+
+class TableWriter(object):
+    '''
+    Base class for streaming table writers
+
+    Parameters
+    ----------
+    filename : str
+        name of the output file
+    fields : list of tuple of (str, str)
+        column names and their types ('int', 'str' or 'bool')
+
+    Notes
+    -----
+    Table writers can be used as context managers, which closes the
+    file on exit.
+    '''
+    def __init__(self, filename, fields):
+        self.filename = filename
+        self.fields = fields
+        self.names = [name for name, _ in fields]
+
+    def write(self, row):
+        '''
+        Write a single row
+
+        Parameters
+        ----------
+        row : tuple
+            values in the order of the fields.
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''
+        Flush and close the output file
+        '''
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *p):
+        self.close()
+
+
+class CSVWriter(TableWriter):
+    '''
+    Write tables as comma (or otherwise) separated values
+
+    Parameters
+    ----------
+    filename : str
+        name of the output file
+    fields : list of tuple of (str, str)
+        column names and their types
+    delimiter : str, optional
+        field delimiter, use '\\t' for TSV files
+    '''
+    def __init__(self, filename, fields, delimiter=','):
+        super().__init__(filename, fields)
+        self.fp = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.fp, delimiter=delimiter)
+        self.writer.writerow(self.names)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.fp.close()
+
+
+class JSONLinesWriter(TableWriter):
+    '''
+    Write tables as JSON Lines, one JSON object per row
+
+    Parameters
+    ----------
+    filename : str
+        name of the output file
+    fields : list of tuple of (str, str)
+        column names and their types
+    '''
+    def __init__(self, filename, fields):
+        super().__init__(filename, fields)
+        self.fp = open(filename, 'w')
+
+    def write(self, row):
+        self.fp.write(json.dumps(dict(zip(self.names, row))))
+        self.fp.write("\n")
+
+    def close(self):
+        self.fp.close()
+
+
+class ParquetWriter(TableWriter):
+    '''
+    Write tables in Apache Parquet format
+
+    Parameters
+    ----------
+    filename : str
+        name of the output file
+    fields : list of tuple of (str, str)
+        column names and their types
+    batch_size : int, optional
+        number of rows buffered before they are written as a row group
+
+    Notes
+    -----
+    This writer requires pyarrow, which is imported when the writer is
+    created. Memory use is bounded by batch_size.
+    '''
+    TYPES = dict(int='int64', str='string', bool='bool_')
+
+    def __init__(self, filename, fields, batch_size=65536):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('Writing parquet files requires pyarrow.')
+        self.pyarrow = pyarrow
+        super().__init__(filename, fields)
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, ParquetWriter.TYPES[t])())
+                                      for name, t in fields])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        self.batch_size = batch_size
+        self.columns = [[] for _ in fields]
+
+    def write(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write buffered rows as a row group
+        '''
+        if self.columns[0]:
+            table = self.pyarrow.Table.from_arrays(self.columns, schema=self.schema)
+            self.writer.write_table(table)
+            self.columns = [[] for _ in self.fields]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {'.csv': (CSVWriter, dict(delimiter=',')),
+           '.tsv': (CSVWriter, dict(delimiter='\t')),
+           '.jsonl': (JSONLinesWriter, dict()),
+           '.parquet': (ParquetWriter, dict())}
+
+
+def get_table_writer(filename, fields, fmt=None):
+    '''
+    Create a table writer for a file
+
+    Parameters
+    ----------
+    filename : str
+        name of the output file
+    fields : list of tuple of (str, str)
+        column names and their types
+    fmt : {None, 'csv', 'tsv', 'jsonl', 'parquet'}
+        output format. If None, the format is derived from the file name extension.
+
+    Returns
+    -------
+    :class:`TableWriter`
+        instance of a table writer
+    '''
+    ext = ".%s"%(fmt) if fmt else os.path.splitext(filename)[1].lower()
+    try:
+        writer_class, kwds = WRITERS[ext]
+    except KeyError:
+        raise ValueError('Unsupported output format ({}).'.format(ext))
+    return writer_class(filename, fields, **kwds)
+
+
+class Export(object):
+    '''
+    Class to export results as tables
+
+    Parameters
+    ----------
+    fmt : {None, 'csv', 'tsv', 'jsonl', 'parquet'}
+        output format. If None, the format is derived from the file name extension.
+    '''
+    def __init__(self, fmt=None):
+        self.fmt = fmt
+
+    def export_mdcs(self, filename, set_A, set_B, mdcs):
+        '''
+        Export molecular diagnostic characters
+
+        Parameters
+        ----------
+        filename : str
+            name of the output file
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+        mdcs : iterable of :class:`fastachar.fasta_logic.MDCResult`
+            molecular diagnostic characters as returned by
+            :meth:`fastachar.fasta_logic.SequenceLogic.compute_mdcs`
+
+        Notes
+        -----
+        For each position one row is written for every sequence in set A and set B.
+        '''
+        with get_table_writer(filename, MDC_FIELDS, self.fmt) as writer:
+            for mdc in mdcs:
+                j = mdc.position
+                s_a = mdc.a_state
+                s_b = mdc.b_state
+                for set_name, aset, values in (('A', set_A, mdc.a_values), ('B', set_B, mdc.b_values)):
+                    for s, c in zip(aset, values):
+                        writer.write((j+1, s_a, s_b, set_name, s.species, s.ID, c.strip()))
+
+    def export_nucs(self, filename, aset, nucs):
+        '''
+        Export non-unique characters
+
+        Parameters
+        ----------
+        filename : str
+            name of the output file
+        aset : list of :class:`fastachar.fasta_logic.Sequence`
+            list of sequences
+        nucs : iterable of :class:`fastachar.fasta_logic.SiteResult`
+            non-unique characters as returned by
+            :meth:`fastachar.fasta_logic.SequenceLogic.list_non_unique_characters_in_set`
+        '''
+        with get_table_writer(filename, NUCS_FIELDS, self.fmt) as writer:
+            for nuc in nucs:
+                s_state = nuc.state
+                potentially_unique = nuc.is_potentially_unique
+                for s, c in zip(aset, nuc.values):
+                    writer.write((nuc.position+1, s_state, potentially_unique, s.species, s.ID, c.strip()))
+
+    def export_species_summary(self, filename, set_A, set_B, mdcs):
+        '''
+        Export the per-species states on the positions of molecular diagnostic characters
+
+        Parameters
+        ----------
+        filename : str
+            name of the output file
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+        mdcs : iterable of :class:`fastachar.fasta_logic.MDCResult`
+            molecular diagnostic characters
+        '''
+        groups = []
+        for set_name, aset in (('A', set_A), ('B', set_B)):
+            species = {}
+            for s in aset:
+                species.setdefault(s.species, []).append(s)
+            for sp in sorted(species):
+                groups.append((set_name, sp, species[sp]))
+        with get_table_writer(filename, SUMMARY_FIELDS, self.fmt) as writer:
+            for mdc in mdcs:
+                j = mdc.position
+                for set_name, sp, sequences in groups:
+                    mask = 0
+                    for s in sequences:
+                        if not s[j].is_masked:
+                            mask |= s[j]._mask
+                    writer.write((j+1, set_name, sp, len(sequences), "/".join(mask_to_bases(mask))))
+
+    def export_leave_one_out(self, filename, results):
+        '''
+        Export the impact of leaving out single sequences on the molecular diagnostic characters
+
+        Parameters
+        ----------
+        filename : str
+            name of the output file
+        results : iterable of :class:`fastachar.fasta_logic.LeaveOneOutResult`
+            results as returned by
+            :meth:`fastachar.fasta_logic.SequenceLogic.iter_leave_one_out`
+
+        Notes
+        -----
+        One row is written for each sequence and position that changes, with
+        change 'lost' or 'gained'. This is the sparse form of the sequence by 
+        position impact table.
+        '''
+        with get_table_writer(filename, LEAVE_ONE_OUT_FIELDS, self.fmt) as writer:
+            for r in results:
+                changes = sorted([(j, 'lost') for j in r.lost] + [(j, 'gained') for j in r.gained])
+                for j, change in changes:
+                    writer.write((r.set_name, r.sequence.species, r.sequence.ID, j+1, change))
+
+    def export_identifications(self, filename, identifications, all_species=False):
+        '''
+        Export the comparison of query sequences with a diagnostic key
+
+        Parameters
+        ----------
+        filename : str
+            name of the output file
+        identifications : iterable of tuple of (:class:`fastachar.fasta_logic.Sequence`, list of :class:`fastachar.fasta_key.KeyMatch`)
+            results as returned by :meth:`fastachar.fasta_key.DiagnosticKey.iter_classify`
+        all_species : bool, optional
+            if False, only the species with at least one match are written.
+        '''
+        with get_table_writer(filename, KEY_FIELDS, self.fmt) as writer:
+            for sequence, matches in identifications:
+                for r in matches:
+                    if all_species or r.matches:
+                        writer.write((sequence.ID, r.species, r.n_diagnostic, r.matches, r.conflicts, r.missing))
@@ -1,13 +1,31 @@
+from array import array
+from bisect import bisect_right
 from collections import defaultdict
+import gzip
+import io
 from itertools import zip_longest
 import logging
+import mmap
+import multiprocessing
+from operator import is_
 import os
 import re
+import shutil
+import struct
 import sys
+import tempfile
+from xml.sax.saxutils import escape
+import zipfile
+import zlib
 
 import xlwt
 
-from .fasta_logic import Sequence, State
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .fasta_logic import ColumnCounts, Haplotype, Partition, Sequence, SetAccumulator, State
 
 OK = 0b0000
 ERROR_FILE_NOT_FOUND = 0b0001
@@ -20,15 +38,190 @@ ERROR_UNKNOWN      = 0b1111
 
 logger = logging.getLogger()
 
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def get_compression(fn):
+    '''
+    Determine the compression of a file from its first bytes
+
+    Parameters
+    ----------
+    fn : str
+        filename
+
+    Returns
+    -------
+    {None, 'gzip', 'bgzip', 'zstd'}
+        compression method, None for uncompressed files.
+    '''
+    with open(fn, 'rb') as fp:
+        magic = fp.read(18)
+    if magic.startswith(GZIP_MAGIC):
+        # BGZF blocks are gzip members with a 'BC' extra subfield.
+        if len(magic) >= 14 and magic[3] & 4 and magic[12:14] == b'BC':
+            return 'bgzip'
+        return 'gzip'
+    if magic.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def open_fasta(fn):
+    '''
+    Open a, possibly compressed, fasta file for reading text
+
+    Parameters
+    ----------
+    fn : str
+        filename
+
+    Returns
+    -------
+    file object
+        text stream, decompressed on the fly if the file is gzip, bgzip or
+        zstd compressed.
+
+    Raises
+    ------
+    ImportError
+        if the file is zstd compressed and the zstandard package is not installed.
+    '''
+    compression = get_compression(fn)
+    if compression in ('gzip', 'bgzip'):
+        return gzip.open(fn, 'rt')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('Error: reading zstd compressed files requires the zstandard package.\n')
+        fp = open(fn, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(fp, closefd=True))
+    return open(fn)
+
+
+class BGZFReader(object):
+    '''
+    Random access to the decompressed data of a bgzip (BGZF) compressed file
+
+    Parameters
+    ----------
+    fn : str
+        filename
+
+    Attributes
+    ----------
+    size : int
+        size of the decompressed data
+
+    Notes
+    -----
+    On initialisation only the block headers are read to build an index of 
+    the compressed and decompressed offsets of all blocks. Reading a range of
+    the decompressed data decompresses only the blocks that overlap with it.
+    '''
+    def __init__(self, fn):
+        self.fn = fn
+        self.block_offsets = array('q')
+        self.data_offsets = array('q')
+        offset = 0
+        size = 0
+        with open(fn, 'rb') as fp:
+            while True:
+                header = fp.read(18)
+                if len(header) < 18:
+                    break
+                if header[:2] != GZIP_MAGIC or header[12:14] != b'BC':
+                    raise ValueError('Invalid BGZF block at offset %d.'%(offset))
+                block_size = struct.unpack('<H', header[16:18])[0] + 1
+                fp.seek(offset + block_size - 4)
+                isize = struct.unpack('<I', fp.read(4))[0]
+                self.block_offsets.append(offset)
+                self.data_offsets.append(size)
+                offset += block_size
+                size += isize
+                fp.seek(offset)
+        self.size = size
+        self.block_offsets.append(offset)
+        self.data_offsets.append(size)
+
+    def read(self, start, end):
+        '''
+        Read a range of the decompressed data
+
+        Parameters
+        ----------
+        start : int
+            offset in the decompressed data
+        end : int
+            end offset (exclusive) in the decompressed data
+
+        Returns
+        -------
+        bytes
+        '''
+        start = max(start, 0)
+        end = min(end, self.size)
+        if start >= end:
+            return b''
+        first = bisect_right(self.data_offsets, start) - 1
+        last = bisect_right(self.data_offsets, end - 1) - 1
+        with open(self.fn, 'rb') as fp:
+            fp.seek(self.block_offsets[first])
+            raw = fp.read(self.block_offsets[last+1] - self.block_offsets[first])
+        data = []
+        pos = 0
+        for i in range(first, last+1):
+            n = self.block_offsets[i+1] - self.block_offsets[i]
+            data.append(zlib.decompress(raw[pos:pos+n], 31))
+            pos += n
+        data = b"".join(data)
+        offset = start - self.data_offsets[first]
+        return data[offset:offset + end - start]
+
+    def find(self, sub, start):
+        '''
+        Find the first occurrence of sub in the decompressed data
+
+        Parameters
+        ----------
+        sub : bytes
+            bytes to find
+        start : int
+            offset in the decompressed data to start searching
+
+        Returns
+        -------
+        int
+            offset of sub, or -1 if not found.
+        '''
+        step = 1<<16
+        while start < self.size:
+            data = self.read(start, start + step + len(sub))
+            i = data.find(sub)
+            if i != -1:
+                return start + i
+            start += step
+        return -1
+
 class Alignment(object):
     ''' 
     Class to hold sequences 
+
+    Attributes
+    ----------
+    sequences : list of :class:`fastachar.fasta_logic.Sequence`
+        the sequences of the alignment
+    partitions : list of :class:`fastachar.fasta_logic.Partition`
+        the loci of a concatenated (multi-locus) alignment. Empty if the
+        alignment is not partitioned.
     '''
     def __init__(self, sequences=None):
         if sequences is None:
             self.sequences = []
         else:
             self.sequences = sequences
+        self._column_counts = None
+        self.partitions = []
         self.set_fasta_hdr_fmt()
         
     def set_fasta_hdr_fmt(self,header_format = "{ID}[_ ]{SPECIES}",
@@ -122,30 +315,298 @@ class Alignment(object):
             arg = fn
             return error, arg
         # File can be opened...
-        data = ""
+        try:
+            for hdr, data, cnt in self.read_records(fn):
+                error, arg = self.__add_sequence(sequences, hdr, data, cnt)
+                if error: # end loop when there is an issue.
+                    break
+        except ImportError as e:
+            error = ERROR_FILE_INVALID
+            arg = e.args[0]
+        except (EOFError, OSError, zlib.error) as e:
+            error = ERROR_FILE_INVALID
+            arg = "Error: could not decompress file (%s)\n"%(e)
+        if not error and not self.are_sequences_of_equal_lengths(sequences):
+            error = ERROR_UNEQUAL_SEQS
+        self.sequences = sequences
+        self._column_counts = None
+        self.partitions = []
+        return error, arg
+
+    def read_records(self, fn):
+        '''
+        Read the records of a fasta file one at a time
+
+        Parameters
+        ----------
+        fn : str
+            filename of file to open
+
+        Yields
+        ------
+        tuple of (str, str, int)
+            header, sequence characters and the line number used in error messages.
+        '''
+        data = []
         hdr = ""
-        with open(fn) as f:
+        cnt = 0
+        with open_fasta(fn) as f:
             for cnt, line in enumerate(f):
                 if not line.startswith(">"):
-                    data += line.strip()
+                    data.append(line.strip())
                     continue
                 if hdr: # if a header has been read, then process the sequence.
-                    error, arg = self.__add_sequence(sequences, hdr, data, cnt)
-                    if error: # end loop when there is an issue.
-                        break
+                    yield hdr, "".join(data), cnt
                 hdr = line.strip() # new header read, reset data.
-                data=""
-        if not error: # process the last seqence too.
-            error, arg = self.__add_sequence(sequences, hdr, data, cnt)
+                data = []
+        yield hdr, "".join(data), cnt # the last sequence too.
+
+    def find_chunks(self, fn, chunk_size=1<<26):
+        '''
+        Split a fasta file into chunks at record boundaries
+
+        Parameters
+        ----------
+        fn : str or :class:`BGZFReader`
+            filename of file to split, or reader of a bgzip compressed file
+        chunk_size : int, optional
+            approximate size of the chunks in bytes
+
+        Returns
+        -------
+        list of tuple of (int, int)
+            start and end offsets of the chunks. Each chunk, except possibly the 
+            first, starts with a fasta header. For bgzip compressed files the
+            offsets refer to the decompressed data.
+        '''
+        if isinstance(fn, BGZFReader):
+            return _split_chunks(fn.size, fn.find, chunk_size)
+        with open(fn, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if not size:
+                return [(0, 0)]
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _split_chunks(size, mm.find, chunk_size)
+
+    def load_parallel(self, fn, processes=None, chunk_size=1<<26):
+        ''' 
+        Load sequence data from file, using multiple processes
+
+        Parameters
+        ----------
+        fn : str
+            filename of file to open
+        processes : int or None, optional
+            number of worker processes. If None, the number of cpus.
+        chunk_size : int, optional
+            approximate size in bytes of the chunks parsed by each process
+
+        Returns
+        -------
+        errorcode : int
+            errocode indicating what went wrong if something did go wrong
+            Returns 0 if OK, otherwise see error codes above.
+
+        arg : string
+            Error message
+
+        Notes
+        -----
+        The file is memory mapped and split into chunks at record boundaries
+        (see :meth:`find_chunks`). The chunks are parsed in a process pool,
+        and the sequences are collected in the order of the file. The results,
+        including the error messages, are the same as those of :meth:`load`.
+
+        Bgzip compressed files are split in the same way, using the block index
+        of :class:`BGZFReader`; each process decompresses only the blocks of 
+        its own chunk. Gzip and zstd compressed files do not allow random 
+        access and are loaded with :meth:`load`.
+        '''
+        if not os.path.exists(fn):
+            return ERROR_FILE_NOT_FOUND, fn
+        compression = get_compression(fn)
+        if compression in ('gzip', 'zstd'):
+            # No random access into the compressed stream.
+            return self.load(fn)
+        source = BGZFReader(fn) if compression == 'bgzip' else fn
+        chunks = self.find_chunks(source, chunk_size)
+        hdr_fmt = (self.pattern_dict['HEADER'], self.pattern_dict['ID'], self.pattern_dict['SPECIES'])
+        tasks = [(source, start, end, i == len(chunks)-1, hdr_fmt) for i, (start, end) in enumerate(chunks)]
+        sequences = []
+        error = OK
+        arg = ''
+        line_offset = 0
+        with multiprocessing.Pool(processes) as pool:
+            for records, n_lines, failed in pool.imap(_parse_chunk, tasks):
+                sequences += [Sequence.from_encoded(*r) for r in records]
+                if failed:
+                    hdr, data, cnt = failed
+                    error, arg, _ = self.make_sequence(hdr, data, cnt + line_offset)
+                    break
+                line_offset += n_lines
         if not error and not self.are_sequences_of_equal_lengths(sequences):
             error = ERROR_UNEQUAL_SEQS
         self.sequences = sequences
+        self._column_counts = None
+        self.partitions = []
         return error, arg
 
+    def load_partitioned(self, filenames, names=None):
+        '''
+        Load and concatenate the alignments of several loci
 
-    def __add_sequence(self, sequences, hdr, data, cnt):
+        Parameters
+        ----------
+        filenames : list of str
+            filenames of the fasta files, one per locus
+        names : list of str or None, optional
+            names of the partitions. If None, the file names without extension.
+
+        Returns
+        -------
+        errorcode : int
+            errocode indicating what went wrong if something did go wrong
+            Returns 0 if OK, otherwise see error codes above.
+
+        arg : string
+            Error message
+
+        Notes
+        -----
+        The records of the files are joined on their ID, in the order in which
+        the IDs first appear. A specimen that is missing from a file is filled
+        with gaps, which are masked, for that locus. The masked ends of each 
+        sequence are determined per locus. The partitions are stored in 
+        :attr:`partitions`.
+        '''
+        if names is None:
+            names = [os.path.basename(fn).split(".")[0] for fn in filenames]
+        records = {}
+        partitions = []
+        length = 0
+        for fn, name in zip(filenames, names):
+            alignment = Alignment()
+            alignment.pattern_dict, alignment.regex_dict = self.pattern_dict, self.regex_dict
+            error, arg = alignment.load(fn)
+            if error:
+                if error != ERROR_FILE_NOT_FOUND or arg != fn:
+                    arg = "File: %s\n%s"%(fn, arg)
+                return error, arg
+            partition = Partition(name, length, length + len(alignment.sequences[0]))
+            for s in alignment.sequences:
+                species, loci = records.setdefault(s.ID, (s.species, {}))
+                if species != s.species:
+                    return ERROR_FILE_INVALID, "Error: species of ID %s differs between files (%s, %s).\nFile: %s\n"%(s.ID, species, s.species, fn)
+                if len(partitions) in loci:
+                    return ERROR_FILE_INVALID, "Error: duplicate ID (%s).\nFile: %s\n"%(s.ID, fn)
+                loci[len(partitions)] = s
+            partitions.append(partition)
+            length = partition.end
+        sequences = []
+        for ID, (species, loci) in records.items():
+            encoded = []
+            spans = []
+            for i, p in enumerate(partitions):
+                try:
+                    s = loci[i]
+                except KeyError:
+                    encoded.append(b'-'*len(p))
+                    spans.append((p.start, p.end))
+                else:
+                    encoded.append(s.encoded)
+                    spans += [(p.start + start, p.start + end) for start, end in s.masked_spans]
+            sequences.append(Sequence.from_encoded(ID, species, b"".join(encoded), spans))
+        self.sequences = sequences
+        self._column_counts = None
+        self.partitions = partitions
+        return OK, ''
+
+    def load_partition_definition(self, fn):
+        '''
+        Partition the loaded alignment using a partition definition file
+
+        Parameters
+        ----------
+        fn : str
+            filename of the partition definition
+
+        Returns
+        -------
+        errorcode : int
+            errocode indicating what went wrong if something did go wrong
+            Returns 0 if OK, otherwise see error codes above.
+
+        arg : string
+            Error message
+
+        Notes
+        -----
+        Each line of the definition file defines one partition by its name and
+        its first and last position (one based), as in the RAxML partition 
+        files (``DNA, COI = 1-658``) or nexus charsets (``charset COI = 1-658;``).
+        Empty lines, comments (#) and nexus block statements are ignored. 
+
+        The partitions must not overlap. The masked ends of the sequences
+        are determined per partition.
+        '''
+        if not os.path.exists(fn):
+            return ERROR_FILE_NOT_FOUND, fn
+        regex = re.compile(r"^\s*(?:charset\s+|\w+\s*,\s*)?(\S+?)\s*=\s*(\d+)\s*-\s*(\d+)\s*;?\s*$", re.IGNORECASE)
+        length = len(self.sequences[0]) if self.sequences else 0
+        partitions = []
+        with open(fn) as fp:
+            for cnt, line in enumerate(fp):
+                if not line.strip() or line.strip().startswith("#") or line.strip().lower() in ("begin sets;", "end;"):
+                    continue
+                m = regex.match(line)
+                if not m:
+                    return ERROR_FILE_INVALID, "Error: Invalid partition definition.\nOffending line: %d\n"%(cnt+1)
+                name, first, last = m.group(1), int(m.group(2)), int(m.group(3))
+                if not 1 <= first <= last <= length:
+                    return ERROR_FILE_INVALID, "Error: Partition %s out of range (1-%d).\nOffending line: %d\n"%(name, length, cnt+1)
+                partitions.append(Partition(name, first-1, last))
+        partitions.sort(key=lambda p: p.start)
+        for p, q in zip(partitions, partitions[1:]):
+            if q.start < p.end:
+                return ERROR_FILE_INVALID, "Error: Partitions %s and %s overlap.\n"%(p.name, q.name)
+        boundaries = sorted(set([0, length] + [p.start for p in partitions] + [p.end for p in partitions]))
+        sequences = []
+        for s in self.sequences:
+            chars = s.sequence_chars
+            spans = []
+            for start, end in zip(boundaries[:-1], boundaries[1:]):
+                spans += [(start + i, start + j) for i, j in s.get_masked_spans(chars[start:end])]
+            sequences.append(Sequence.from_encoded(s.ID, s.species, s.encoded, spans))
+        self.sequences = sequences
+        self._column_counts = None
+        self.partitions = partitions
+        return OK, ''
+
+    def make_sequence(self, hdr, data, cnt):
+        '''
+        Create a sequence from a fasta record
+
+        Parameters
+        ----------
+        hdr : str
+            fasta header
+        data : str
+            sequence characters
+        cnt : int
+            line number used in error messages
+
+        Returns
+        -------
+        errorcode : int
+            errocode indicating what went wrong if something did go wrong
+        arg : string
+            Error message
+        sequence : :class:`fastachar.fasta_logic.Sequence` or None
+            the sequence, None if an error occurred.
+        '''
+        sequence = None
         try:
-            sequences.append(Sequence(*self.parse_hdr(hdr), data))
+            sequence = Sequence(*self.parse_hdr(hdr), data)
         except ValueError as e:
             error = ERROR_FILE_INVALID
             arg = "Error: %s\nOffending line: %d\n"%(e.args[0], cnt-1)
@@ -155,9 +616,67 @@ class Alignment(object):
         else:
             error = OK
             arg = ""
+        return error, arg, sequence
+
+    def __add_sequence(self, sequences, hdr, data, cnt):
+        error, arg, sequence = self.make_sequence(hdr, data, cnt)
+        if not error:
+            sequences.append(sequence)
         return error, arg
-            
-    
+
+    def reduce_file(self, fn, regex, regex_B=None):
+        '''
+        Reduce a fasta file into per-column accumulators, one sequence at a time.
+
+        Parameters
+        ----------
+        fn : str
+            filename of file to open
+        regex : str
+            regular expression matching the species names of set A
+        regex_B : str or None, optional
+            regular expression matching the species names of set B. If None, 
+            all sequences not in set A are in set B. 
+
+        Returns
+        -------
+        errorcode : int
+            errocode indicating what went wrong if something did go wrong
+        arg : string
+            Error message
+        acc_A : :class:`fastachar.fasta_logic.SetAccumulator` or None
+            accumulator of set A
+        acc_B : :class:`fastachar.fasta_logic.SetAccumulator` or None
+            accumulator of set B
+
+        Notes
+        -----
+        The sequences are not stored, so that the memory required depends on the
+        number of positions and species only, and not on the number of sequences.
+        Use :meth:`fastachar.fasta_logic.SequenceLogic.iter_mdcs_from_accumulators` and
+        :meth:`fastachar.fasta_logic.SequenceLogic.iter_variable_sites_from_accumulator` to
+        compute the results.
+        '''
+        if not os.path.exists(fn):
+            return ERROR_FILE_NOT_FOUND, fn, None, None
+        c = re.compile(regex)
+        c_B = re.compile(regex_B) if regex_B is not None else None
+        acc_A = acc_B = None
+        for hdr, data, cnt in self.read_records(fn):
+            error, arg, sequence = self.make_sequence(hdr, data, cnt)
+            if error:
+                return error, arg, None, None
+            if acc_A is None:
+                acc_A = SetAccumulator(len(sequence))
+                acc_B = SetAccumulator(len(sequence))
+            elif len(sequence) != acc_A.length:
+                return ERROR_UNEQUAL_SEQS, '', None, None
+            if c.match(sequence.species):
+                acc_A.add(sequence)
+            elif c_B is None or c_B.match(sequence.species):
+                acc_B.add(sequence)
+        return OK, '', acc_A, acc_B
+
     def parse_hdr(self, hdr, **kwds):
         ''' 
         Parse the header string of the sequence 
@@ -185,7 +704,7 @@ class Alignment(object):
         regex_dict = kwds.get('regex_dict', self.regex_dict)
             
         #>WBET042_Lyrodus_pedicellatus_Brittany_France
-        if hdr[0] != ">" or len(hdr)==1:
+        if len(hdr) < 2 or hdr[0] != ">":
             raise ValueError("Invalid header/file.")
         s = hdr[1:]
         # Test whether we have a header with an ID. If not, create one of the form ID001. If yes, strip it from the species name.
@@ -349,6 +868,280 @@ class Alignment(object):
         group = [i for i in self.sequences if i.species in itemlist]
         return group
 
+    def get_column_counts(self):
+        '''
+        Get the per-column, per-nucleotide counts of all sequences
+
+        Returns
+        -------
+        :class:`fastachar.fasta_logic.ColumnCounts`
+            counts of the whole alignment
+
+        Notes
+        -----
+        The counts are computed once and cached until the sequences change.
+        The cache is cleared when the sequences are loaded, and the sequences
+        counted are kept, so that sequences assigned, added or replaced in
+        self.sequences are detected as well.
+        '''
+        if self._column_counts is not None:
+            counted, counts = self._column_counts
+            if len(counted) == len(self.sequences) and all(map(is_, counted, self.sequences)):
+                return counts
+        self._column_counts = list(self.sequences), ColumnCounts.from_sequences(self.sequences)
+        return self._column_counts[1]
+
+    def get_haplotypes(self, sequences=None):
+        '''
+        Collapse identical sequences of the same species into haplotypes
+
+        Parameters
+        ----------
+        sequences : list of :class:`fastachar.fasta_logic.Sequence` or None
+            sequences to collapse. If None, all sequences of the alignment.
+
+        Returns
+        -------
+        list of :class:`fastachar.fasta_logic.Haplotype`
+            haplotypes in order of their first occurrence.
+
+        Notes
+        -----
+        The molecular diagnostic characters and non-unique characters of a set
+        of haplotypes are the same as those of the set of sequences. Since each 
+        haplotype is evaluated once, the work is reduced by the redundancy of
+        the sequences.
+        '''
+        if sequences is None:
+            sequences = self.sequences
+        groups = {}
+        for s in sequences:
+            groups.setdefault((s.species, s.encoded), []).append(s)
+        return [Haplotype(members) for members in groups.values()]
+
+
+def _split_chunks(size, find, chunk_size):
+    '''
+    Split data into chunks at record boundaries (helper of :meth:`Alignment.find_chunks`)
+    '''
+    chunks = []
+    start = 0
+    while start < size:
+        i = find(b'\n>', start + chunk_size)
+        end = size if i == -1 else i + 1
+        chunks.append((start, end))
+        start = end
+    return chunks or [(0, 0)]
+
+
+def _parse_chunk(task):
+    '''
+    Parse a chunk of a fasta file (worker of :meth:`Alignment.load_parallel`)
+
+    Parameters
+    ----------
+    task : tuple
+        filename (or :class:`BGZFReader`), start and end offset, whether this
+        is the last chunk, and the header format, ID and species regular expressions.
+
+    Returns
+    -------
+    records : list of tuple of (str, str, bytes, list)
+        ID, species, encoded characters and masked spans of each sequence
+    n_lines : int
+        number of lines in the chunk
+    failed : tuple of (str, str, int) or None
+        header, sequence characters and chunk line number of the first
+        record that could not be parsed.
+    '''
+    fn, start, end, is_last, hdr_fmt = task
+    alignment = Alignment()
+    alignment.set_fasta_hdr_fmt(*hdr_fmt)
+    if isinstance(fn, BGZFReader):
+        text = fn.read(start, end).decode()
+    else:
+        with open(fn, 'rb') as fp:
+            fp.seek(start)
+            text = fp.read(end - start).decode()
+    lines = text.split("\n")
+    if text.endswith("\n"):
+        lines.pop()
+    n_lines = len(lines)
+    records = []
+    data = []
+    hdr = ""
+
+    def add(hdr, data, cnt):
+        error, arg, sequence = alignment.make_sequence(hdr, "".join(data), cnt)
+        if error:
+            return hdr, "".join(data), cnt
+        records.append((sequence.ID, sequence.species, sequence.encoded, sequence.masked_spans))
+        return None
+
+    for cnt, line in enumerate(lines):
+        if not line.startswith(">"):
+            data.append(line.strip())
+            continue
+        if hdr:
+            failed = add(hdr, data, cnt)
+            if failed:
+                return records, n_lines, failed
+        hdr = line.strip()
+        data = []
+    # The last record of a chunk is terminated by the first header of the next
+    # chunk, or by the end of the file.
+    failed = None
+    if is_last:
+        failed = add(hdr, data, max(0, n_lines - 1))
+    elif hdr:
+        failed = add(hdr, data, n_lines)
+    return records, n_lines, failed
+
+
+class Case(object):
+    '''
+    Class to hold the information for case files
+    
+    Attributes
+    ----------
+    data : dict
+         dictionary containing all information to write to file.
+    '''
+    LIST_KWDS = "species setA setB".split()
+    
+    def __init__(self):
+        self.clear()
+        
+    def clear(self):
+        ''' 
+        Clear :attr:`data`
+        '''
+        self.data = {}
+        
+    def populate(self, filename,
+                 species,
+                 setA,
+                 setB,
+                 operation,
+                 regex_header_format,
+                 regex_id,
+                 regex_species):
+        '''
+        Write the case information into data dictionary
+        
+        Parameters
+        ----------
+        filename : str
+            Name of input fasta file
+        species : list of str
+            Names of all species read
+        setA : list of :class:`fastachar.fasta_logic.Sequence`
+            list of sequences in list A
+        setB : list of :class:`fastachar.fasta_logic.Sequence`
+            list of sequences in list B
+        operation : int
+            operation of comparison
+        regex_header_format : str
+            regular expression for the header format
+        regex_id : str
+            regular expression for matching the ID or lab codes
+        regex_species : str
+            regular expression for matching the name of the species.
+        '''
+        self.data = dict(filename=filename,
+                         species=species,
+                         setA=setA,
+                         setB=setB,
+                         operation=operation,
+                         regex_header_format=regex_header_format,
+                         regex_id=regex_id,
+                         regex_species=regex_species)
+
+    def parse_line(self, line):
+        '''
+        Parse a line read from the case file
+        
+        Parameters
+        ----------
+        line : str
+            header string
+        
+        Returns
+        -------
+        kwd : str
+            attribute of the configuration
+        value : str or list of str
+            the value of the attribute
+        '''
+        kwd, value = line.split("=")
+        kwd=kwd.strip()
+        value=value.strip()
+        if kwd in Case.LIST_KWDS:
+            if value:
+                value=[i.strip() for i in value.split(",")]
+            else:
+                value = []
+            value.sort()
+        return kwd, value
+    
+    def load(self, filename):
+        '''
+        Load a case file
+        
+        Parameters
+        ----------
+        filename : str
+            name of cae file
+
+        Returns
+        -------
+        error: int
+            error code
+        arg : str
+            error message
+        '''
+        if not os.path.exists(filename):
+            error = ERROR_FILE_NOT_FOUND
+            arg = filename
+            return error, arg
+        # file exists, now open it.
+        error = OK
+        arg = ''
+        lineno = 0
+        with open(filename,'r') as fp:
+            while True:
+                line = fp.readline()
+                lineno+=1
+                if not line:
+                    break
+                try:
+                    kwd, value = self.parse_line(line)
+                except ValueError:
+                    error = ERROR_CASE
+                    arg = "{} (line no: {}".format(line, lineno)
+                else:
+                    self.data[kwd]=value
+        return error, arg
+    
+    def save(self, filename):
+        '''
+        Save a case file
+
+        Parameters
+        ----------
+        filename : str
+             Name of the case file
+        '''
+        with open(filename,'w') as fp:
+            fp.write("filename = {}\n".format(self.data['filename']))
+            fp.write("species = {}\n".format(" , ".join(self.data['species'])))
+            fp.write("setA = {}\n".format(" , ".join(self.data['setA'])))
+            fp.write("setB = {}\n".format(" , ".join(self.data['setB'])))
+            fp.write("operation = {}\n".format(self.data['operation']))
+            fp.write("regex_header_format = {}\n".format(self.data['regex_header_format']))
+            fp.write("regex_id = {}\n".format(self.data['regex_id']))
+            fp.write("regex_species = {}\n".format(self.data['regex_species']))
+
 
 class Report(object):
     '''
@@ -362,9 +1155,13 @@ class Report(object):
     output_filename : str or None, optional
         name of output filename. If not None, then output is sent to stdout.
 
-    reportxls : :class:`ReportXLS` or None, optional
+    reportxls : :class:`ReportXLS`, :class:`ReportXLSX` or None, optional
         instance of an excel worksheet object
 
+    expand_haplotypes : bool, optional
+        if True, haplotypes (see :meth:`Alignment.get_haplotypes`) are reported
+        per sequence. Otherwise a single line is written per haplotype.
+
     Attributes
     ----------
     filename : str, optional
@@ -373,14 +1170,17 @@ class Report(object):
     output_filename : str or None, optional
         name of output filename. If not None, then output is sent to stdout.
 
-    reportxls : :class:`ReportXLS` or None, optional
+    reportxls : :class:`ReportXLS`, :class:`ReportXLSX` or None, optional
         instance of an excel worksheet object
 
+    expand_haplotypes : bool
+        if True, haplotypes are reported per sequence.
     '''
-    def __init__(self, filename=None, output_filename=None, reportxls = None):
+    def __init__(self, filename=None, output_filename=None, reportxls = None, expand_haplotypes=True):
         self.filename = filename or "noname"
         self.output_filename = output_filename or sys.stdout
         self.reportxls = reportxls
+        self.expand_haplotypes = expand_haplotypes
         try:
             self.reportxls.filename = self.filename
         except AttributeError:
@@ -402,6 +1202,8 @@ class Report(object):
         method : str
             Description of operation method
         '''
+        if self.expand_haplotypes:
+            set_A, set_B = Haplotype.expand(set_A), Haplotype.expand(set_B)
         try:
             self.reportxls.report_header(set_A, set_B, method)
         except AttributeError:
@@ -445,8 +1247,8 @@ class Report(object):
             Sequence list A
         set_B : list of :class:`fastachar.fasta_logic.Sequence`
             Sequence list B
-        mdcs : list of tuples of (int, :class:`fastachar.fasta_logic.State`)
-            list of position and State tuples, i.e. molecular diagnostic characters
+        mdcs : list of :class:`fastachar.fasta_logic.MDCResult`
+            list of molecular diagnostic characters
         method : str
             short description of operation method.
         '''
@@ -454,6 +1256,10 @@ class Report(object):
             other_set_name = set_name.replace('A','B')
         else:
             other_set_name = set_name.replace('B','A')
+        if self.expand_haplotypes and (Haplotype.has_haplotypes(set_A) or Haplotype.has_haplotypes(set_B)):
+            a_weights, b_weights = Haplotype.weights(set_A), Haplotype.weights(set_B)
+            mdcs = [mdc.expand(a_weights, b_weights) for mdc in mdcs]
+            set_A, set_B = Haplotype.expand(set_A), Haplotype.expand(set_B)
         try:
             self.reportxls.report_mdcs(set_name, set_A, set_B, mdcs, method)
         except AttributeError:
@@ -463,7 +1269,7 @@ class Report(object):
         if mdcs:
             if method == 'potential_MDC_only': # we need to list ALL characters for each position in A,
                                                # so we need to compute how much space to reserve.
-                n_chars = len(mdcs[0][1]._value)
+                n_chars = len(mdcs[0].a_chars)
                 marker_position = max(24, 10 + 2*n_chars)
                 filling = " "*(marker_position-23)
                 modifier = 'potential '
@@ -484,14 +1290,14 @@ class Report(object):
                 w.write("%d "%((i+1)%10))
             w.write("\n")
             w.write("-"*80+"\n")
-            for (j, state_a, state_b) in mdcs:
+            for mdc in mdcs:
                 if method == "potential_MDC_only":
-                    s = "%8d: %s"%(j+1, " ".join(state_a._value))
+                    s = "%8d: %s"%(mdc.position+1, " ".join(mdc.a_values))
                     filling = " "*max(0, marker_position - len(s))
                     w.write("{}{}|  ".format(s,filling))
                 else:
-                    w.write("%8d: %s            |  "%(j+1, state_a._value[0]))
-                w.write("%s\n"%(" ".join(state_b._value)))
+                    w.write("%8d: %s            |  "%(mdc.position+1, mdc.a_values[0]))
+                w.write("%s\n"%(" ".join(mdc.b_values)))
             a = len(mdcs)
             b = len(set_A[0].data)
             f = a/b*100
@@ -510,9 +1316,13 @@ class Report(object):
             Name of the set 
         set_A : list of :class:`fastachar.fasta_logic.Sequence`
             list of sequences
-        nucs : list of tuples of (int, :class:`fastachar.fasta_logic.State`)
-            list of position and State tuples
+        nucs : list of :class:`fastachar.fasta_logic.SiteResult`
+            list of non-unique characters
         '''
+        if self.expand_haplotypes and Haplotype.has_haplotypes(set_A):
+            weights = Haplotype.weights(set_A)
+            nucs = [nuc.expand(weights) for nuc in nucs]
+            set_A = Haplotype.expand(set_A)
         try:
             self.reportxls.report_nucs(set_name, nucs)
         except IOError:
@@ -525,13 +1335,13 @@ class Report(object):
             w.write("position:  chars\n")
             w.write("-"*80)
             w.write("\n")
-            for j, state_a in nucs:
-                if len(state_a.intersection_of_subsets())==1:
+            for nuc in nucs:
+                if nuc.is_potentially_unique:
                     prefix='*'
                     count+=1
                 else:
                     prefix=' '
-                w.write("%s%5d %s\n"%(prefix,j+1, " ".join(state_a._value)))
+                w.write("%s%5d %s\n"%(prefix, nuc.position+1, " ".join(nuc.values)))
             w.write("\n")
             a = len(nucs)
             b = len(set_A[0].data)
@@ -543,13 +1353,319 @@ class Report(object):
 
         else:
             w.write("All sequences within {} are identical.\n".format(set_name))
-            
 
-class MyWorkbook(xlwt.Workbook):
-    def __init__(self, *p, **kw):
-        super().__init__(*p, *kw)
+    def report_compound_mdcs(self, set_name, set_A, set_B, cdcs):
+        '''
+        Write combinations of positions that separate the sets
 
-    def remove_all_sheets(self):
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+        cdcs : list of :class:`fastachar.fasta_logic.CompoundMDCResult`
+            compound diagnostic characters, see 
+            :meth:`fastachar.fasta_logic.SequenceLogic.compute_compound_mdcs`
+        '''
+        if 'A' in set_name:
+            other_set_name = set_name.replace('A','B')
+        else:
+            other_set_name = set_name.replace('B','A')
+        try:
+            self.reportxls.report_compound_mdcs(set_name, cdcs)
+        except AttributeError:
+            pass
+        w = self.output_filename
+        if cdcs:
+            w.write("\nThe species in {} are separated from {} by the following combinations\n".format(set_name, other_set_name))
+            w.write("of positions (compound diagnostic characters):\n\n")
+            w.write("positions                : characters in {}\n".format(set_name))
+            w.write("-"*80+"\n")
+            for cdc in cdcs:
+                positions = " + ".join(["%d"%(j+1) for j in cdc.positions])
+                w.write("%-25s: %s\n"%(positions, " + ".join(cdc.a_states)))
+            w.write("\n%d combinations found.\n"%(len(cdcs)))
+        else:
+            w.write("\n{} has no compound diagnostic characters\n".format(set_name))
+
+    def report_soft_mdcs(self, set_name, soft_mdcs, min_a_frequency, max_b_frequency):
+        '''
+        Write frequency-threshold ("soft") molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        soft_mdcs : list of :class:`fastachar.fasta_logic.SoftMDCResult`
+            soft MDCs, see :meth:`fastachar.fasta_logic.SequenceLogic.compute_soft_mdcs`
+        min_a_frequency : float
+            minimum frequency of the nucleotide in set A that was applied
+        max_b_frequency : float
+            maximum frequency of the nucleotide in set B that was applied
+        '''
+        if 'A' in set_name:
+            other_set_name = set_name.replace('A','B')
+        else:
+            other_set_name = set_name.replace('B','A')
+        try:
+            self.reportxls.report_soft_mdcs(set_name, soft_mdcs, min_a_frequency, max_b_frequency)
+        except AttributeError:
+            pass
+        w = self.output_filename
+        w.write("\nSoft MDCs of {}: nucleotides with a frequency of at least {:.1f}% in {}\n".format(set_name, min_a_frequency*100, set_name))
+        w.write("and at most {:.1f}% in {}:\n\n".format(max_b_frequency*100, other_set_name))
+        if soft_mdcs:
+            w.write("position : nucleotide   freq A    freq B  support\n")
+            w.write("-"*80+"\n")
+            for r in soft_mdcs:
+                w.write("%8d : %10s  %7.1f%%  %7.1f%%  %7.3f\n"%(r.position+1, r.a_state, r.a_frequency*100,
+                                                               r.b_frequency*100, r.support))
+            w.write("\n%d soft MDCs found.\n"%(len(soft_mdcs)))
+        else:
+            w.write("{} has no soft MDCs\n".format(set_name))
+
+    def report_leave_one_out(self, set_name, results):
+        '''
+        Write the molecular diagnostic characters that change when single sequences are left out
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        results : list of :class:`fastachar.fasta_logic.LeaveOneOutResult`
+            see :meth:`fastachar.fasta_logic.SequenceLogic.compute_leave_one_out`
+        '''
+        try:
+            self.reportxls.report_leave_one_out(set_name, results)
+        except AttributeError:
+            pass
+        w = self.output_filename
+        results = [r for r in results if r.n_changes]
+        if not results:
+            w.write("\nNone of the MDCs of {} depends on a single sequence.\n".format(set_name))
+            return
+        w.write("\nMDCs of {} that are lost (-) or gained (+) when a single sequence is left out:\n\n".format(set_name))
+        w.write("set  sequence                                : positions\n")
+        w.write("-"*80+"\n")
+        for r in results:
+            positions = ["-%d"%(j+1) for j in r.lost] + ["+%d"%(j+1) for j in r.gained]
+            w.write(" %s   %-40s: %s\n"%(r.set_name, "%s (%s)"%(r.sequence.species, r.sequence.ID),
+                                        " ".join(positions)))
+        w.write("\n%d sequences affect the MDCs.\n"%(len(results)))
+
+    def report_mdc_stability(self, set_name, results, n_replicates, scheme):
+        '''
+        Write the resampling stability of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        results : list of :class:`fastachar.fasta_logic.StabilityResult`
+            see :meth:`fastachar.fasta_logic.SequenceLogic.compute_mdc_stability`
+        n_replicates : int
+            number of replicates
+        scheme : str
+            resampling scheme, "bootstrap" or "jackknife"
+        '''
+        try:
+            self.reportxls.report_mdc_stability(set_name, results, n_replicates, scheme)
+        except AttributeError:
+            pass
+        w = self.output_filename
+        if not results:
+            w.write("\n{} has no MDCs in any of {} {} replicates.\n".format(set_name, n_replicates, scheme))
+            return
+        w.write("\nStability of the MDCs of {} in {} {} replicates:\n\n".format(set_name, n_replicates, scheme))
+        w.write("position : frequency  MDC of all sequences\n")
+        w.write("-"*80+"\n")
+        for r in results:
+            w.write("%8d : %8.1f%%  %s\n"%(r.position+1, r.frequency*100, "yes" if r.is_mdc else "no"))
+        n_mdcs = len([r for r in results if r.is_mdc])
+        n_stable = len([r for r in results if r.is_mdc and r.frequency >= 0.95])
+        w.write("\n%d of %d MDCs are found in at least 95%% of the replicates.\n"%(n_stable, n_mdcs))
+
+    def report_permutation_test(self, set_name, result, method):
+        '''
+        Write the empirical p-value of the number of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        result : :class:`fastachar.fasta_logic.PermutationResult`
+            see :meth:`fastachar.fasta_logic.SequenceLogic.compute_mdc_permutation_test`
+        method : str
+            short description of operation method.
+        '''
+        try:
+            self.reportxls.report_permutation_test(set_name, result, method)
+        except AttributeError:
+            pass
+        modifier = 'potential ' if method == 'potential_MDC_only' else ''
+        w = self.output_filename
+        w.write("\n\nPermutation test ({} permutations of the species labels):\n".format(len(result.null)))
+        w.write("%d %sMDCs in %s, %.1f on average (%d-%d) under the null hypothesis, p = %.4g\n"%(
+            result.observed, modifier, set_name, result.mean, min(result.null, default=0),
+            max(result.null, default=0), result.p_value))
+
+    def report_barcode_gaps(self, set_name, results):
+        '''
+        Write the maximum intra- and minimum inter-species distances per species
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A and B for example)
+        results : list of :class:`fastachar.fasta_distance.BarcodeGapResult`
+            see :meth:`fastachar.fasta_distance.DistanceEngine.compute_barcode_gaps`
+        '''
+        try:
+            self.reportxls.report_barcode_gaps(set_name, results)
+        except AttributeError:
+            pass
+        fmt = lambda d: "%8s"%("-") if d is None else "%8.4f"%(d)
+        w = self.output_filename
+        w.write("\nBarcode gap per species of {} (p-distances):\n\n".format(set_name))
+        w.write("%-40s %5s %9s %9s %8s  %s\n"%("species", "n", "max intra", "min inter", "gap", "nearest species"))
+        w.write("-"*100+"\n")
+        for r in results:
+            w.write("%-40s %5d %9s %9s %8s  %s\n"%(r.species, r.n_sequences, fmt(r.max_intra), fmt(r.min_inter),
+                                                   fmt(r.gap), r.nearest or "-"))
+        n_gap = len([r for r in results if r.gap is not None and r.gap > 0])
+        w.write("\n%d of %d species have a barcode gap.\n"%(n_gap, len(results)))
+
+    def report_windows(self, set_name, windows):
+        '''
+        Write the windows with the highest density of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A or a species name for example)
+        windows : dict of {int : list of :class:`fastachar.fasta_logic.WindowResult`}
+            windows per width, see :meth:`fastachar.fasta_logic.SequenceLogic.scan_windows`
+        '''
+        try:
+            self.reportxls.report_windows(set_name, windows)
+        except AttributeError:
+            pass
+        w = self.output_filename
+        for width, results in sorted(windows.items()):
+            if not results:
+                w.write("\n{} has no (potential) MDCs in windows of {} positions\n".format(set_name, width))
+                continue
+            w.write("\nWindows of {} positions with the most (potential) MDCs of {}:\n\n".format(width, set_name))
+            w.write("positions      :   MDCs  potential MDCs\n")
+            w.write("-"*80+"\n")
+            for r in results:
+                w.write("%6d - %6d : %6d  %14d\n"%(r.start+1, r.end, r.n_mdcs, r.n_potential))
+
+    def report_partition(self, partition):
+        '''
+        Write the heading of the results of a partition
+
+        Parameters
+        ----------
+        partition : :class:`fastachar.fasta_logic.Partition`
+            partition (locus) of a concatenated alignment
+        '''
+        try:
+            self.reportxls.report_partition(partition)
+        except AttributeError:
+            pass
+        w = self.output_filename
+        w.write("Partition {} (positions {}-{} of the alignment):\n".format(partition.name, partition.start+1, partition.end))
+        w.write("-"*80+"\n")
+
+    def report_partition_summary(self, set_name, groups, label):
+        '''
+        Write the number of results per partition and overall
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        groups : list of tuple of (:class:`fastachar.fasta_logic.Partition`, list)
+            partitions and their results
+        label : str
+            description of the results
+        '''
+        w = self.output_filename
+        w.write("Number of {} of {} per partition:\n\n".format(label, set_name))
+        a_total = b_total = 0
+        for partition, results in groups:
+            a, b = len(results), len(partition)
+            w.write("%20s: %6d of %6d characters (%.1f%%)\n"%(partition.name, a, b, a/b*100))
+            a_total += a
+            b_total += b
+        w.write("%20s: %6d of %6d characters (%.1f%%)\n"%("overall", a_total, b_total, a_total/max(1, b_total)*100))
+
+    def report_mdcs_by_partition(self, set_name, set_A, set_B, mdcs, method, partitions):
+        '''
+        Write results of molecular diagnostic characters, grouped by partition
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+        mdcs : list of :class:`fastachar.fasta_logic.MDCResult`
+            list of molecular diagnostic characters of the whole alignment
+        method : str
+            short description of operation method.
+        partitions : list of :class:`fastachar.fasta_logic.Partition`
+            partitions of the alignment, see :attr:`Alignment.partitions`
+
+        Notes
+        -----
+        Within each partition, positions are reported relative to the start of
+        the partition.
+        '''
+        groups = Partition.split(partitions, mdcs)
+        w = self.output_filename
+        for partition, p_mdcs in groups:
+            self.report_partition(partition)
+            self.report_mdcs(set_name, partition.slice(set_A), partition.slice(set_B), p_mdcs, method)
+            w.write("\n\n")
+        label = "potential MDCs" if method == "potential_MDC_only" else "MDCs"
+        self.report_partition_summary(set_name, groups, label)
+
+    def report_nucs_by_partition(self, set_name, set_A, nucs, partitions):
+        '''
+        Report non-unique characters in list of sequences, grouped by partition
+
+        Parameters
+        ----------
+        set_name : str
+            Name of the set 
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            list of sequences
+        nucs : list of :class:`fastachar.fasta_logic.SiteResult`
+            list of non-unique characters of the whole alignment
+        partitions : list of :class:`fastachar.fasta_logic.Partition`
+            partitions of the alignment, see :attr:`Alignment.partitions`
+        '''
+        groups = Partition.split(partitions, nucs)
+        w = self.output_filename
+        for partition, p_nucs in groups:
+            self.report_partition(partition)
+            self.report_nucs(set_name, partition.slice(set_A), p_nucs)
+            w.write("\n\n")
+        self.report_partition_summary(set_name, groups, "non-unique characters")
+            
+
+class MyWorkbook(xlwt.Workbook):
+    def __init__(self, *p, **kw):
+        super().__init__(*p, *kw)
+
+    def remove_all_sheets(self):
         self._Workbook__worksheet_idx_from_name.clear()
         self._Workbook__worksheets.clear()
         
@@ -631,6 +1747,10 @@ class ReportXLS(object):
             operation_str = "Determination POTENTIAL Molecular Diagnostic Characters"
         elif method == "nucs":
             operation_str = "Determination non-unique characters"
+        elif method == "MDC windows":
+            operation_str = "Windows with most Molecular Diagnostic Characters"
+        elif method == "barcode gap":
+            operation_str = "Determination barcode gap per species"
         else:
             raise ValueError('Unknown method supplied.')
         
@@ -676,15 +1796,15 @@ class ReportXLS(object):
             Sequence list A
         set_B : list of :class:`fastachar.fasta_logic.Sequence`
             Sequence list B
-        mdcs : list of tuples of (int, :class:`fastachar.fasta_logic.State`)
-            list of position and State tuples, i.e. molecular diagnostic characters
+        mdcs : list of :class:`fastachar.fasta_logic.MDCResult`
+            list of molecular diagnostic characters
         method : str
             description of operation method
         '''
 
         if method == "potential_MDC_only":
             if mdcs:
-                len_A = len(mdcs[0][1]._value)
+                len_A = len(mdcs[0].a_chars)
             else:
                 # No potential mdcs available. Say that and return.
                 len_A = 0
@@ -717,14 +1837,14 @@ class ReportXLS(object):
             formula = xlwt.Formula("B%d"%(5+i))
             self.sheet.write(n, 2 + len_A+i, formula)
         n+=1
-        for j, state_a, state_b in mdcs:
-            self.sheet.write(n, 1, "%d"%(j+1))
+        for mdc in mdcs:
+            self.sheet.write(n, 1, "%d"%(mdc.position+1))
             if method == "potential_MDC_only":
-                for i, _state in enumerate(state_a._value):
+                for i, _state in enumerate(mdc.a_values):
                     self.sheet.write(n, 2+i, _state)
             else:
-                self.sheet.write(n, 2, state_a._value[0])
-            for i, _state in enumerate(state_b._value):
+                self.sheet.write(n, 2, mdc.a_values[0])
+            for i, _state in enumerate(mdc.b_values):
                 self.sheet.write(n, 2+ len_A + i, _state)
             n+=1
         self.__row = n
@@ -746,16 +1866,11 @@ class ReportXLS(object):
             self.sheet.write(n, lenA+2+i, "Set B")
             self.sheet.write(n+1, lenA+2+i, "%s(%d)"%(_s, _n))
         n+=2
-        A={}
-        for sp in spA:
-            sequences = [_s for _s in set_A if _s.species==sp]
-            A[sp] = [State(c) for c in zip(*sequences)]
-        B={}
-        for sp in spB:
-            sequences = [_s for _s in set_B if _s.species==sp]
-            B[sp] = [State(c) for c in zip(*sequences)]
+        positions = [mdc.position for mdc in mdcs]
+        A = self.__species_states(set_A, spA, positions)
+        B = self.__species_states(set_B, spB, positions)
         for j, mdc in enumerate(mdcs):
-            position = mdc[0]
+            position = mdc.position
             self.sheet.write(n+j,1, "%d"%(position+1))# position
             for i, sp in enumerate(spA):
                 state = A[sp][position]
@@ -763,9 +1878,208 @@ class ReportXLS(object):
             for i, sp in enumerate(spB):
                 state = B[sp][position]
                 self.sheet.write(n+j,lenA+2+i, "%s"%(state.state))# set values
-        self.__row = n
+        self.__row = n + len(mdcs)
+
+    def __species_states(self, aset, species, positions):
+        # Only the states on the positions reported are needed.
+        states = {}
+        for sp in species:
+            sequences = [_s for _s in aset if _s.species==sp]
+            states[sp] = dict((j, State([_s[j] for _s in sequences])) for j in positions)
+        return states
                             
         
+    def report_compound_mdcs(self, set_name, cdcs):
+        '''
+        Write combinations of positions that separate the sets
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        cdcs : list of :class:`fastachar.fasta_logic.CompoundMDCResult`
+            compound diagnostic characters
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Compound diagnostic characters of {}:".format(set_name))
+        n+=1
+        self.sheet.write(n, 1, "Positions")
+        self.sheet.write(n, 2, "Characters")
+        n+=1
+        for cdc in cdcs:
+            self.sheet.write(n, 1, " + ".join(["%d"%(j+1) for j in cdc.positions]))
+            self.sheet.write(n, 2, " + ".join(cdc.a_states))
+            n+=1
+        self.__row = n
+
+    def report_soft_mdcs(self, set_name, soft_mdcs, min_a_frequency, max_b_frequency):
+        '''
+        Write frequency-threshold ("soft") molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        soft_mdcs : list of :class:`fastachar.fasta_logic.SoftMDCResult`
+            soft MDCs
+        min_a_frequency : float
+            minimum frequency of the nucleotide in set A that was applied
+        max_b_frequency : float
+            maximum frequency of the nucleotide in set B that was applied
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Soft MDCs of {} (at least {:.1f}% in list A, at most {:.1f}% in list B):".format(
+            set_name, min_a_frequency*100, max_b_frequency*100))
+        n+=1
+        for i, label in enumerate(["Position", "Nucleotide", "Frequency A", "Frequency B", "Support"]):
+            self.sheet.write(n, i+1, label)
+        n+=1
+        for r in soft_mdcs:
+            for i, value in enumerate([r.position+1, r.a_state, "%.3f"%(r.a_frequency), "%.3f"%(r.b_frequency),
+                                       "%.3f"%(r.support)]):
+                self.sheet.write(n, i+1, value)
+            n+=1
+        self.__row = n
+
+    def report_leave_one_out(self, set_name, results):
+        '''
+        Write the molecular diagnostic characters that change when single sequences are left out
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        results : list of :class:`fastachar.fasta_logic.LeaveOneOutResult`
+            impact of leaving out each sequence
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "MDCs of {} that change when a single sequence is left out:".format(set_name))
+        n+=1
+        for i, label in enumerate(["Set", "Species", "ID", "Position", "Change"]):
+            self.sheet.write(n, i+1, label)
+        n+=1
+        for r in results:
+            changes = sorted([(j, "lost") for j in r.lost] + [(j, "gained") for j in r.gained])
+            for j, change in changes:
+                for i, value in enumerate([r.set_name, r.sequence.species, r.sequence.ID, j+1, change]):
+                    self.sheet.write(n, i+1, value)
+                n+=1
+        self.__row = n
+
+    def report_mdc_stability(self, set_name, results, n_replicates, scheme):
+        '''
+        Write the resampling stability of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        results : list of :class:`fastachar.fasta_logic.StabilityResult`
+            stability per position
+        n_replicates : int
+            number of replicates
+        scheme : str
+            resampling scheme, "bootstrap" or "jackknife"
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Stability of the MDCs of {} in {} {} replicates:".format(set_name, n_replicates, scheme))
+        n+=1
+        for i, label in enumerate(["Position", "Frequency", "MDC of all sequences"]):
+            self.sheet.write(n, i+1, label)
+        n+=1
+        for r in results:
+            for i, value in enumerate([r.position+1, "%.3f"%(r.frequency), "yes" if r.is_mdc else "no"]):
+                self.sheet.write(n, i+1, value)
+            n+=1
+        self.__row = n
+
+    def report_permutation_test(self, set_name, result, method):
+        '''
+        Write the empirical p-value of the number of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        result : :class:`fastachar.fasta_logic.PermutationResult`
+            result of the permutation test
+        method : str
+            short description of operation method.
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Permutation test of {} ({} permutations):".format(set_name, len(result.null)))
+        n+=1
+        for label, value in (("Observed", "%d"%(result.observed)), ("Mean under null", "%.1f"%(result.mean)),
+                             ("Maximum under null", "%d"%(max(result.null, default=0))),
+                             ("p-value", "%.4g"%(result.p_value))):
+            self.sheet.write(n, 1, label)
+            self.sheet.write(n, 2, value)
+            n+=1
+        self.__row = n
+
+    def report_barcode_gaps(self, set_name, results):
+        '''
+        Write the maximum intra- and minimum inter-species distances per species
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A and B for example)
+        results : list of :class:`fastachar.fasta_distance.BarcodeGapResult`
+            see :meth:`fastachar.fasta_distance.DistanceEngine.compute_barcode_gaps`
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Barcode gap per species of {}:".format(set_name))
+        n+=1
+        for i, label in enumerate(["Species", "Sequences", "Max intra", "Min inter", "Gap", "Nearest species"]):
+            self.sheet.write(n, i+1, label)
+        n+=1
+        for r in results:
+            values = [r.species, r.n_sequences] + ["-" if d is None else round(d, 6) for d in (r.max_intra, r.min_inter, r.gap)] + [r.nearest or "-"]
+            for i, value in enumerate(values):
+                self.sheet.write(n, i+1, value)
+            n+=1
+        self.__row = n
+
+    def report_windows(self, set_name, windows):
+        '''
+        Write the windows with the highest density of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A or a species name for example)
+        windows : dict of {int : list of :class:`fastachar.fasta_logic.WindowResult`}
+            windows per width
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Windows with the most (potential) MDCs of {}:".format(set_name))
+        n+=1
+        for i, label in enumerate(["Width", "Start", "End", "MDCs", "Potential MDCs"]):
+            self.sheet.write(n, i+1, label)
+        n+=1
+        for width, results in sorted(windows.items()):
+            for r in results:
+                for i, value in enumerate([width, r.start+1, r.end, r.n_mdcs, r.n_potential]):
+                    self.sheet.write(n, i+1, value)
+                n+=1
+        self.__row = n
+
+    def report_partition(self, partition):
+        '''
+        Write the heading of the results of a partition
+
+        Parameters
+        ----------
+        partition : :class:`fastachar.fasta_logic.Partition`
+            partition (locus) of a concatenated alignment
+        '''
+        n = self.__row + 2
+        self.sheet.write(n, 0, "Partition:")
+        self.sheet.write(n, 1, partition.name)
+        self.sheet.write(n, 2, "positions %d-%d"%(partition.start+1, partition.end))
+        self.__row = n + 1
+
     def report_nucs(self, set_name, nucs):
         '''
         Report non-unique characters in list of sequences
@@ -776,8 +2090,8 @@ class ReportXLS(object):
             Name of the set 
         set_A : list of :class:`fastachar.fasta_logic.Sequence`
             list of sequences
-        nucs : list of tuples of (int, :class:`fastachar.fasta_logic.State`)
-            list of position and State tuples
+        nucs : list of :class:`fastachar.fasta_logic.SiteResult`
+            list of non-unique characters
         '''
         n = self.__row +2
         self.sheet.write(n, 0, "The non-unique characters of {} are:".format(set_name))
@@ -785,16 +2099,600 @@ class ReportXLS(object):
         self.sheet.write(n, 1, "Position")
         self.sheet.write(n, 2, "Chars")
         n+=1
-        for (j, state) in nucs:
-            if len(state)==0 or len(state.intersection_of_subsets())==0:
+        for nuc in nucs:
+            if not nuc.common_mask:
                 style = self.styles['default']
             else:
                 style = self.styles['alert']
-            self.sheet.write(n, 1, "%d"%(j+1), style)
-            for i, s in enumerate(state._value):
+            self.sheet.write(n, 1, "%d"%(nuc.position+1), style)
+            for i, s in enumerate(nuc.values):
                 self.sheet.write(n, 2+i, s, style)
             n+=1
+        self.__row = n
 
     
 
             
+
+
+class XLSXFormula(object):
+    '''
+    A formula to be written into a cell of a :class:`ReportXLSX` worksheet.
+
+    Parameters
+    ----------
+    expression : str
+        formula expression without the leading '=', for example "A5".
+    '''
+    def __init__(self, expression):
+        self.expression = expression
+
+
+class XLSXWorksheet(object):
+    '''
+    A worksheet of which the rows are streamed to a temporary file.
+
+    Parameters
+    ----------
+    name : str
+        name of the worksheet
+
+    Notes
+    -----
+    Rows must be written in increasing order. Every row is serialised as
+    soon as it is written, so that the memory footprint does not depend
+    on the size of the worksheet.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.fp = tempfile.TemporaryFile()
+        self.last_row = -1
+
+    @staticmethod
+    def column_letters(col):
+        '''
+        Convert a zero-based column number into spreadsheet column letters.
+
+        Parameters
+        ----------
+        col : int
+            zero-based column number
+
+        Returns
+        -------
+        str
+            column letters, such as A, Z, AA or XFD.
+        '''
+        s = ""
+        col += 1
+        while col:
+            col, r = divmod(col-1, 26)
+            s = chr(65+r) + s
+        return s
+
+    def write_row(self, n, cells, style=0):
+        '''
+        Write a single row
+
+        Parameters
+        ----------
+        n : int
+            zero-based row number
+        cells : iterable of tuple of (int, str or :class:`XLSXFormula`)
+            column number and value of each cell to write
+        style : int
+            index of the cell style (see :attr:`ReportXLSX.STYLES`)
+        '''
+        if n <= self.last_row:
+            raise ValueError('Rows must be written in increasing order.')
+        r = n + 1
+        s = ['<row r="%d">'%(r)]
+        s_attr = ' s="%d"'%(style) if style else ''
+        for col, value in sorted(cells, key=lambda x: x[0]):
+            ref = "%s%d"%(self.column_letters(col), r)
+            if isinstance(value, XLSXFormula):
+                s.append('<c r="%s"%s><f>%s</f></c>'%(ref, s_attr, escape(value.expression)))
+            else:
+                s.append('<c r="%s"%s t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>'%(ref, s_attr, escape(str(value))))
+        s.append('</row>')
+        self.fp.write("".join(s).encode('utf-8'))
+        self.last_row = n
+
+    def copy_to(self, fp):
+        '''
+        Copy the complete worksheet xml into file object fp
+
+        Parameters
+        ----------
+        fp : file object
+            file object opened for writing in binary mode
+        '''
+        fp.write(ReportXLSX.SHEET_HEAD)
+        self.fp.seek(0)
+        shutil.copyfileobj(self.fp, fp)
+        fp.write(ReportXLSX.SHEET_TAIL)
+
+    def close(self):
+        '''
+        Close and remove the temporary file
+        '''
+        self.fp.close()
+
+
+class ReportXLSX(object):
+    '''
+    A class to report results in Office Open XML (xlsx) format.
+
+    The layout of the worksheets is the same as that of :class:`ReportXLS`,
+    but the rows are streamed to disk as they are produced and the
+    workbook is assembled only when it is saved. Unlike the legacy xls
+    format, there is no practical limit on the number of columns (16384)
+    or rows (1048576).
+    '''
+    STYLES = dict(default=0, alert=1)
+
+    SHEET_HEAD = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                  b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                  b'<sheetData>')
+    SHEET_TAIL = b'</sheetData></worksheet>'
+
+    def __init__(self):
+        self.worksheets = []
+        self.sheet_idx = 0
+        self.__row = 0
+        self.styles = ReportXLSX.STYLES
+        self.filename = "noname"
+
+    def __create_sheet(self):
+        sheet_name = "worksheet%02d"%(self.sheet_idx)
+        self.sheet = XLSXWorksheet(sheet_name)
+        self.worksheets.append(self.sheet)
+        self.sheet_idx+=1
+
+    def clear(self):
+        '''
+        Remove all worksheets
+        '''
+        for sheet in self.worksheets:
+            sheet.close()
+        self.worksheets = []
+        self.sheet_idx = 0
+
+    def save(self, fn):
+        '''
+        Save to results file
+
+        Parameters
+        ----------
+        fn : str
+            name of the file to write the results into
+
+        Notes
+        -----
+        If the workbook has no data, nothing is saved.
+        '''
+        if not self.worksheets:
+            return
+        with zipfile.ZipFile(fn, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('[Content_Types].xml', self.__content_types())
+            zf.writestr('_rels/.rels',
+                        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+                        '</Relationships>')
+            zf.writestr('xl/workbook.xml', self.__workbook())
+            zf.writestr('xl/_rels/workbook.xml.rels', self.__workbook_rels())
+            zf.writestr('xl/styles.xml',
+                        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        '<fonts count="1"><font><sz val="10"/><name val="Arial"/></font></fonts>'
+                        '<fills count="3"><fill><patternFill patternType="none"/></fill>'
+                        '<fill><patternFill patternType="gray125"/></fill>'
+                        '<fill><patternFill patternType="solid"><fgColor rgb="FFFFFF00"/><bgColor indexed="64"/></patternFill></fill></fills>'
+                        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+                        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+                        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+                        '<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/></cellXfs>'
+                        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+                        '</styleSheet>')
+            for i, sheet in enumerate(self.worksheets):
+                with zf.open('xl/worksheets/sheet%d.xml'%(i+1), 'w') as fp:
+                    sheet.copy_to(fp)
+
+    def __content_types(self):
+        s = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+             '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+             '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+             '<Default Extension="xml" ContentType="application/xml"/>'
+             '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+             '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>']
+        for i in range(len(self.worksheets)):
+            s.append('<Override PartName="/xl/worksheets/sheet%d.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'%(i+1))
+        s.append('</Types>')
+        return "".join(s)
+
+    def __workbook(self):
+        s = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+             '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+             'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>']
+        for i, sheet in enumerate(self.worksheets):
+            s.append('<sheet name="%s" sheetId="%d" r:id="rId%d"/>'%(escape(sheet.name), i+1, i+1))
+        s.append('</sheets></workbook>')
+        return "".join(s)
+
+    def __workbook_rels(self):
+        s = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+             '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">']
+        for i in range(len(self.worksheets)):
+            s.append('<Relationship Id="rId%d" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet%d.xml"/>'%(i+1, i+1))
+        s.append('<Relationship Id="rId%d" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'%(len(self.worksheets)+1))
+        s.append('</Relationships>')
+        return "".join(s)
+
+    def report_header(self, set_A, set_B, method):
+        '''
+        Write header of the report
+
+        Parameters
+        ----------
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+
+        method : str
+            Description of operation method
+        '''
+        if method == 'MDC':
+            operation_str = "Determination Molecular Diagnostic Characters"
+        elif method == "potential_MDC_only":
+            operation_str = "Determination POTENTIAL Molecular Diagnostic Characters"
+        elif method == "nucs":
+            operation_str = "Determination non-unique characters"
+        elif method == "MDC windows":
+            operation_str = "Windows with most Molecular Diagnostic Characters"
+        elif method == "barcode gap":
+            operation_str = "Determination barcode gap per species"
+        else:
+            raise ValueError('Unknown method supplied.')
+
+        self.__create_sheet()
+        n = 0
+        self.sheet.write_row(n, [(0, "Filename:"), (1, self.filename)])
+        n+=1
+        self.sheet.write_row(n, [(0, "Operation:"), (1, operation_str)])
+        n+=2
+        self.sheet.write_row(n, [(0, "List A"), (1, "List B")])
+        n+=1
+        for a, b in zip_longest(set_A, set_B):
+            cells = []
+            if a:
+                cells.append((0, "%s (%s)"%(a.species, a.ID)))
+            if b:
+                cells.append((1, "%s (%s)"%(b.species, b.ID)))
+            self.sheet.write_row(n, cells)
+            n+=1
+        self.__row = n - 1
+
+    def report_footer(self):
+        '''
+        Report footer
+
+        Notes
+        -----
+        Not implemented.
+        '''
+        pass
+
+    def report_mdcs(self, set_name, set_A, set_B, mdcs, method):
+        '''
+        Write results of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+        mdcs : list of :class:`fastachar.fasta_logic.MDCResult`
+            list of molecular diagnostic characters
+        method : str
+            description of operation method
+        '''
+        if method == "potential_MDC_only":
+            if mdcs:
+                len_A = len(mdcs[0].a_chars)
+            else:
+                len_A = 0
+        else:
+            len_A = 1
+        n = self.__row + 3
+
+        if len_A == 0:
+            self.sheet.write_row(n, [(0, "No potential MDCs in {}:\n\n".format(set_name))])
+            self.__row = n
+            return
+
+        self.sheet.write_row(n, [(0, "Unique characters of {}:\n\n".format(set_name))])
+        n+=1
+        if method == "potential_MDC_only":
+            self.sheet.write_row(n, [(1, "Position"), (2, "Potential MDCs"),
+                                     (2+len_A, "Characters different in other species")])
+        else:
+            self.sheet.write_row(n, [(1, "Position"), (2, "MDCs"),
+                                     (3, "Characters different in other species")])
+        n+=1
+        if method == "potential_MDC_only":
+            cells = [(2+i, XLSXFormula("A%d"%(5+i))) for i in range(len(set_A))]
+        else:
+            cells = [(2, "List A")]
+        cells += [(2+len_A+i, XLSXFormula("B%d"%(5+i))) for i in range(len(set_B))]
+        self.sheet.write_row(n, cells)
+        n+=1
+        for mdc in mdcs:
+            cells = [(1, "%d"%(mdc.position+1))]
+            if method == "potential_MDC_only":
+                cells += [(2+i, _state) for i, _state in enumerate(mdc.a_values)]
+            else:
+                cells.append((2, mdc.a_values[0]))
+            cells += [(2+len_A+i, _state) for i, _state in enumerate(mdc.b_values)]
+            self.sheet.write_row(n, cells)
+            n+=1
+        self.__row = n - 1
+        self.report_mdcs_summary(set_A, set_B, mdcs, method)
+
+    def report_mdcs_summary(self, set_A, set_B, mdcs, method):
+        '''
+        Write the per-species states on the positions of the molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_A : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list A
+        set_B : list of :class:`fastachar.fasta_logic.Sequence`
+            Sequence list B
+        mdcs : list of :class:`fastachar.fasta_logic.MDCResult`
+            list of molecular diagnostic characters
+        method : str
+            description of operation method
+        '''
+        n = self.__row + 3
+        spA, nA = Alignment(set_A).get_species_list()
+        spB, nB = Alignment(set_B).get_species_list()
+        lenA = len(spA)
+        cells = [(1, "Position")]
+        cells += [(2+i, "Set A") for i in range(lenA)]
+        cells += [(lenA+2+i, "Set B") for i in range(len(spB))]
+        self.sheet.write_row(n, cells)
+        cells = [(2+i, "%s(%d)"%(_s, _n)) for i, (_s, _n) in enumerate(zip(spA, nA))]
+        cells += [(lenA+2+i, "%s(%d)"%(_s, _n)) for i, (_s, _n) in enumerate(zip(spB, nB))]
+        self.sheet.write_row(n+1, cells)
+        n+=2
+        positions = [mdc.position for mdc in mdcs]
+        A = self.__species_states(set_A, spA, positions)
+        B = self.__species_states(set_B, spB, positions)
+        for position in positions:
+            cells = [(1, "%d"%(position+1))]
+            cells += [(2+i, A[sp][position].state) for i, sp in enumerate(spA)]
+            cells += [(lenA+2+i, B[sp][position].state) for i, sp in enumerate(spB)]
+            self.sheet.write_row(n, cells)
+            n+=1
+        self.__row = n - 1
+
+    def __species_states(self, aset, species, positions):
+        states = {}
+        for sp in species:
+            sequences = [_s for _s in aset if _s.species==sp]
+            states[sp] = dict((j, State([_s[j] for _s in sequences])) for j in positions)
+        return states
+
+    def report_compound_mdcs(self, set_name, cdcs):
+        '''
+        Write combinations of positions that separate the sets
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        cdcs : list of :class:`fastachar.fasta_logic.CompoundMDCResult`
+            compound diagnostic characters
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Compound diagnostic characters of {}:".format(set_name))])
+        n+=1
+        self.sheet.write_row(n, [(1, "Positions"), (2, "Characters")])
+        n+=1
+        for cdc in cdcs:
+            self.sheet.write_row(n, [(1, " + ".join(["%d"%(j+1) for j in cdc.positions])),
+                                     (2, " + ".join(cdc.a_states))])
+            n+=1
+        self.__row = n - 1
+
+    def report_soft_mdcs(self, set_name, soft_mdcs, min_a_frequency, max_b_frequency):
+        '''
+        Write frequency-threshold ("soft") molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        soft_mdcs : list of :class:`fastachar.fasta_logic.SoftMDCResult`
+            soft MDCs
+        min_a_frequency : float
+            minimum frequency of the nucleotide in set A that was applied
+        max_b_frequency : float
+            maximum frequency of the nucleotide in set B that was applied
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Soft MDCs of {} (at least {:.1f}% in list A, at most {:.1f}% in list B):".format(
+            set_name, min_a_frequency*100, max_b_frequency*100))])
+        n+=1
+        self.sheet.write_row(n, list(enumerate(["Position", "Nucleotide", "Frequency A", "Frequency B", "Support"], 1)))
+        n+=1
+        for r in soft_mdcs:
+            self.sheet.write_row(n, list(enumerate([r.position+1, r.a_state, "%.3f"%(r.a_frequency),
+                                                    "%.3f"%(r.b_frequency), "%.3f"%(r.support)], 1)))
+            n+=1
+        self.__row = n - 1
+
+    def report_leave_one_out(self, set_name, results):
+        '''
+        Write the molecular diagnostic characters that change when single sequences are left out
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        results : list of :class:`fastachar.fasta_logic.LeaveOneOutResult`
+            impact of leaving out each sequence
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "MDCs of {} that change when a single sequence is left out:".format(set_name))])
+        n+=1
+        self.sheet.write_row(n, list(enumerate(["Set", "Species", "ID", "Position", "Change"], 1)))
+        n+=1
+        for r in results:
+            changes = sorted([(j, "lost") for j in r.lost] + [(j, "gained") for j in r.gained])
+            for j, change in changes:
+                self.sheet.write_row(n, list(enumerate([r.set_name, r.sequence.species, r.sequence.ID,
+                                                        j+1, change], 1)))
+                n+=1
+        self.__row = n - 1
+
+    def report_mdc_stability(self, set_name, results, n_replicates, scheme):
+        '''
+        Write the resampling stability of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        results : list of :class:`fastachar.fasta_logic.StabilityResult`
+            stability per position
+        n_replicates : int
+            number of replicates
+        scheme : str
+            resampling scheme, "bootstrap" or "jackknife"
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Stability of the MDCs of {} in {} {} replicates:".format(set_name, n_replicates, scheme))])
+        n+=1
+        self.sheet.write_row(n, list(enumerate(["Position", "Frequency", "MDC of all sequences"], 1)))
+        n+=1
+        for r in results:
+            self.sheet.write_row(n, list(enumerate([r.position+1, "%.3f"%(r.frequency),
+                                                    "yes" if r.is_mdc else "no"], 1)))
+            n+=1
+        self.__row = n - 1
+
+    def report_permutation_test(self, set_name, result, method):
+        '''
+        Write the empirical p-value of the number of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A for example)
+        result : :class:`fastachar.fasta_logic.PermutationResult`
+            result of the permutation test
+        method : str
+            short description of operation method.
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Permutation test of {} ({} permutations):".format(set_name, len(result.null)))])
+        n+=1
+        for label, value in (("Observed", "%d"%(result.observed)), ("Mean under null", "%.1f"%(result.mean)),
+                             ("Maximum under null", "%d"%(max(result.null, default=0))),
+                             ("p-value", "%.4g"%(result.p_value))):
+            self.sheet.write_row(n, [(1, label), (2, value)])
+            n+=1
+        self.__row = n - 1
+
+    def report_barcode_gaps(self, set_name, results):
+        '''
+        Write the maximum intra- and minimum inter-species distances per species
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A and B for example)
+        results : list of :class:`fastachar.fasta_distance.BarcodeGapResult`
+            see :meth:`fastachar.fasta_distance.DistanceEngine.compute_barcode_gaps`
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Barcode gap per species of {}:".format(set_name))])
+        n+=1
+        self.sheet.write_row(n, list(enumerate(["Species", "Sequences", "Max intra", "Min inter", "Gap", "Nearest species"], 1)))
+        n+=1
+        for r in results:
+            values = [r.species, r.n_sequences] + ["-" if d is None else round(d, 6) for d in (r.max_intra, r.min_inter, r.gap)] + [r.nearest or "-"]
+            self.sheet.write_row(n, list(enumerate(values, 1)))
+            n+=1
+        self.__row = n - 1
+
+    def report_windows(self, set_name, windows):
+        '''
+        Write the windows with the highest density of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_name : str
+            name of the set (List A or a species name for example)
+        windows : dict of {int : list of :class:`fastachar.fasta_logic.WindowResult`}
+            windows per width
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Windows with the most (potential) MDCs of {}:".format(set_name))])
+        n+=1
+        self.sheet.write_row(n, list(enumerate(["Width", "Start", "End", "MDCs", "Potential MDCs"], 1)))
+        n+=1
+        for width, results in sorted(windows.items()):
+            for r in results:
+                self.sheet.write_row(n, list(enumerate([width, r.start+1, r.end, r.n_mdcs, r.n_potential], 1)))
+                n+=1
+        self.__row = n - 1
+
+    def report_partition(self, partition):
+        '''
+        Write the heading of the results of a partition
+
+        Parameters
+        ----------
+        partition : :class:`fastachar.fasta_logic.Partition`
+            partition (locus) of a concatenated alignment
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "Partition:"), (1, partition.name),
+                                 (2, "positions %d-%d"%(partition.start+1, partition.end))])
+        self.__row = n
+
+    def report_nucs(self, set_name, nucs):
+        '''
+        Report non-unique characters in list of sequences
+
+        Parameters
+        ----------
+        set_name : str
+            Name of the set
+        nucs : list of :class:`fastachar.fasta_logic.SiteResult`
+            list of non-unique characters
+        '''
+        n = self.__row + 3
+        self.sheet.write_row(n, [(0, "The non-unique characters of {} are:".format(set_name))])
+        n+=1
+        self.sheet.write_row(n, [(1, "Position"), (2, "Chars")])
+        n+=1
+        for nuc in nucs:
+            if not nuc.common_mask:
+                style = self.styles['default']
+            else:
+                style = self.styles['alert']
+            cells = [(1, "%d"%(nuc.position+1))]
+            cells += [(2+i, s) for i, s in enumerate(nuc.values)]
+            self.sheet.write_row(n, cells, style)
+            n+=1
+        self.__row = n - 1
@@ -0,0 +1,267 @@
+''' Module for identifying query sequences with a compiled diagnostic key
+
+A :class:`DiagnosticKey` holds, for each species of a reference alignment,
+the positions of its molecular diagnostic characters and the nucleotides
+of the species on these positions. Query sequences, aligned to the
+reference, are compared with the key of every species. For each species,
+the diagnostic positions of a query are counted as
+
+* match: the nucleotides of the query and the species have a nucleotide
+  in common, following the set semantics of :class:`fastachar.fasta_logic.Char`
+  for ambiguity codes;
+* conflict: the nucleotides have nothing in common;
+* missing: the query is masked on the position (for example in the leading
+  and trailing gaps), or has a fully ambiguous character (N or X), which
+  is no evidence for any species.
+
+A key can be saved and loaded as a JSON file, so that it is compiled once
+for a reference alignment.
+'''
+from collections import namedtuple
+from operator import itemgetter
+import json
+
+from . import fasta_io, fasta_logic
+from .fasta_logic import BYTE_MASKS, Char, Sequence
+
+
+class KeyMatch(namedtuple('KeyMatch', 'species n_diagnostic matches conflicts missing')):
+    ''' Comparison of a query sequence with the key of a species
+
+    Parameters
+    ----------
+    species : str
+        species name
+    n_diagnostic : int
+        number of diagnostic positions of the species
+    matches : int
+        number of diagnostic positions where the query matches the species
+    conflicts : int
+        number of diagnostic positions where the query conflicts with the species
+    missing : int
+        number of diagnostic positions where the query is masked, or has N or X
+    '''
+    __slots__ = ()
+
+    @property
+    def is_consistent(self):
+        ''' True if the query matches on at least one position and has no conflicts '''
+        return self.matches > 0 and not self.conflicts
+
+
+class DiagnosticKey(object):
+    '''
+    Diagnostic positions and nucleotides of a number of species
+
+    Parameters
+    ----------
+    length : int
+        length of the aligned sequences
+    method : {"MDC", "potential_MDC_only"}, optional
+        method with which the key was compiled
+
+    Attributes
+    ----------
+    species : dict of {str : list of tuple of (int, int)}
+        for each species, the diagnostic positions (zero based) and the bit
+        mask of the nucleotides of the species on each position.
+
+    Notes
+    -----
+    For classification, the positions of a species are grouped by nucleotide
+    mask. The characters of a query on a group of positions are gathered and
+    translated into match, conflict and missing codes in one operation, and
+    counted.
+    '''
+    MATCH, CONFLICT, MISSING = b'+', b'x', b'.'
+    UNKNOWN = Char.MASKS['N']
+
+    def __init__(self, length, method="MDC"):
+        self.length = length
+        self.method = method
+        self.species = {}
+        self._groups = None
+
+    @classmethod
+    def from_sequences(cls, sequences, method="MDC", species=None):
+        '''
+        Compile a key from a reference alignment
+
+        Parameters
+        ----------
+        sequences : list of :class:`fastachar.fasta_logic.Sequence`
+            sequences of the reference alignment
+        method : {"MDC", "potential_MDC_only"}, optional
+            method of comparison
+        species : list of str or None, optional
+            species to include, each compared with all other sequences. If
+            None, all species are included.
+
+        Returns
+        -------
+        :class:`DiagnosticKey`
+        '''
+        self = cls(len(sequences[0]), method)
+        logic = fasta_logic.SequenceLogic()
+        total_counts = fasta_logic.ColumnCounts.from_sequences(sequences)
+        groups = {}
+        for s in sequences:
+            groups.setdefault(s.species, []).append(s)
+        for sp in (species if species is not None else sorted(groups)):
+            set_A = groups[sp]
+            set_B = [s for s in sequences if s.species != sp]
+            if not set_B:
+                continue
+            mdcs = logic.iter_mdcs_from_counts(set_A, set_B, total_counts, method)
+            self.add_species(sp, [(mdc.position, mdc.a_mask) for mdc in mdcs])
+        return self
+
+    def add_species(self, species, positions):
+        '''
+        Add (or replace) the diagnostic positions of a species
+
+        Parameters
+        ----------
+        species : str
+            species name
+        positions : list of tuple of (int, int)
+            positions (zero based) and nucleotide masks
+        '''
+        self.species[species] = sorted(positions)
+        self._groups = None
+
+    def get_groups(self):
+        '''
+        Get the positions of each species grouped by nucleotide mask
+
+        Returns
+        -------
+        list of tuple of (str, int, list of tuple of (callable, bytes))
+            species, number of positions, and for each nucleotide mask a
+            function that gathers the characters on its positions and the
+            translation table of the characters into codes.
+        '''
+        if self._groups is None:
+            tables = {}
+            self._groups = []
+            for sp, positions in sorted(self.species.items()):
+                by_mask = {}
+                for j, mask in positions:
+                    by_mask.setdefault(mask, []).append(j)
+                getters = []
+                for mask, js in sorted(by_mask.items()):
+                    if mask not in tables:
+                        tables[mask] = b"".join([self.MISSING if not m or m == self.UNKNOWN else
+                                                 self.MATCH if m & mask else self.CONFLICT
+                                                 for m in BYTE_MASKS])
+                    # itemgetter returns an int for a single position, and a tuple otherwise.
+                    getter = itemgetter(*js) if len(js) > 1 else (lambda data, j=js[0]: (data[j],))
+                    getters.append((getter, tables[mask]))
+                self._groups.append((sp, len(positions), getters))
+        return self._groups
+
+    def classify(self, sequence):
+        '''
+        Compare a query sequence with the key of every species
+
+        Parameters
+        ----------
+        sequence : :class:`fastachar.fasta_logic.Sequence`
+            query sequence, aligned to the reference
+
+        Returns
+        -------
+        list of :class:`KeyMatch`
+            one per species, ordered by decreasing number of matches minus
+            conflicts, and species name.
+        '''
+        if len(sequence) != self.length:
+            raise ValueError("Sequence {} has length {}, the key has length {}.".format(sequence.ID, len(sequence), self.length))
+        data = sequence.get_masked_bytes()
+        results = []
+        for sp, n, getters in self.get_groups():
+            codes = b"".join([bytes(getter(data)).translate(table) for getter, table in getters])
+            results.append(KeyMatch(sp, n, codes.count(self.MATCH), codes.count(self.CONFLICT),
+                                    codes.count(self.MISSING)))
+        results.sort(key=lambda r: (r.conflicts - r.matches, r.species))
+        return results
+
+    def iter_classify(self, sequences):
+        '''
+        Compare query sequences with the key of every species
+
+        Parameters
+        ----------
+        sequences : iterable of :class:`fastachar.fasta_logic.Sequence`
+            query sequences
+
+        Yields
+        ------
+        tuple of (:class:`fastachar.fasta_logic.Sequence`, list of :class:`KeyMatch`)
+            See :meth:`classify`.
+        '''
+        for sequence in sequences:
+            yield sequence, self.classify(sequence)
+
+    def save(self, fn):
+        '''
+        Save the key as a JSON file
+
+        Parameters
+        ----------
+        fn : str
+            filename
+        '''
+        with open(fn, 'w') as fp:
+            json.dump(dict(length=self.length, method=self.method,
+                           species=dict((sp, [list(p) for p in positions])
+                                        for sp, positions in self.species.items())), fp)
+
+    @classmethod
+    def load(cls, fn):
+        '''
+        Load a key from a JSON file
+
+        Parameters
+        ----------
+        fn : str
+            filename
+
+        Returns
+        -------
+        :class:`DiagnosticKey`
+        '''
+        with open(fn) as fp:
+            d = json.load(fp)
+        self = cls(d['length'], d['method'])
+        for sp, positions in d['species'].items():
+            self.add_species(sp, [tuple(p) for p in positions])
+        return self
+
+
+def iter_query_sequences(fn):
+    '''
+    Read query sequences from a (possibly compressed) fasta file
+
+    Parameters
+    ----------
+    fn : str
+        filename
+
+    Yields
+    ------
+    :class:`fastachar.fasta_logic.Sequence`
+        sequences, with the header (without the '>') as ID and an empty species name.
+
+    Notes
+    -----
+    The headers are not parsed, so that query sequences need not follow
+    the header format of the reference. Invalid characters raise a ValueError.
+    '''
+    for hdr, data, cnt in fasta_io.Alignment().read_records(fn):
+        if not hdr:
+            continue
+        try:
+            yield Sequence(hdr[1:].strip(), '', data)
+        except KeyError as e:
+            raise ValueError("Invalid character encountered ('%s')\nOffending line: %d"%(e.args[0], cnt))
@@ -0,0 +1,378 @@
+''' Module for detecting species in sequencing reads with diagnostic k-mers
+
+Diagnostic k-mers are the k-mers of the (ungapped) reference sequences of a
+species that span one of its molecular diagnostic characters, and that do
+not occur in any sequence of another species. Ambiguity codes in the
+reference are expanded into all k-mers they represent. K-mers are matched
+on both strands.
+
+A :class:`KmerScreener` counts the hits per species in large fasta or fastq
+files of reads, without aligning them. The reads are streamed and screened
+in batches by a pool of processes, so that the memory use does not depend
+on the size of the read file.
+'''
+from collections import namedtuple
+from itertools import islice, product
+import multiprocessing
+
+from . import fasta_io, fasta_key
+from .fasta_logic import Char
+
+COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+
+
+def reverse_complement(kmer):
+    '''
+    Get the reverse complement of a nucleotide string
+
+    Parameters
+    ----------
+    kmer : str
+        string of A, C, G and T
+
+    Returns
+    -------
+    str
+    '''
+    return kmer.translate(COMPLEMENT)[::-1]
+
+
+def expand_kmer(chars, max_expansions):
+    '''
+    Expand the ambiguity codes of a k-mer
+
+    Parameters
+    ----------
+    chars : str
+        k-mer, possibly with ambiguity codes
+    max_expansions : int
+        maximum number of k-mers
+
+    Returns
+    -------
+    list of str
+        the k-mers, or an empty list if there are more than max_expansions,
+        or if the k-mer contains masked characters (spaces).
+    '''
+    if all(c in 'ACGT' for c in chars):
+        return [chars]
+    if ' ' in chars:
+        return []
+    alternatives = [Char.IUPAC[c] for c in chars]
+    n = 1
+    for a in alternatives:
+        n *= len(a)
+    if n > max_expansions:
+        return []
+    return ["".join(p) for p in product(*alternatives)]
+
+
+class ScreenResult(namedtuple('ScreenResult', 'species reads hits')):
+    ''' Result of screening reads for the diagnostic k-mers of a species
+
+    Parameters
+    ----------
+    species : str
+        species name
+    reads : int
+        number of reads with diagnostic k-mers of this species only
+    hits : int
+        number of diagnostic k-mers of this species found in all reads
+    '''
+    __slots__ = ()
+
+
+class KmerScreener(object):
+    '''
+    Diagnostic k-mers of a number of species
+
+    Parameters
+    ----------
+    k : int, optional
+        length of the k-mers
+
+    Attributes
+    ----------
+    species : list of str
+        species names
+    kmers : dict of {str : int}
+        the diagnostic k-mers, in both orientations, and the index of their species
+    '''
+    def __init__(self, k=21):
+        self.k = k
+        self.species = []
+        self.kmers = {}
+
+    @classmethod
+    def from_sequences(cls, sequences, k=21, method="MDC", species=None, max_expansions=16):
+        '''
+        Derive the diagnostic k-mers from a reference alignment
+
+        Parameters
+        ----------
+        sequences : list of :class:`fastachar.fasta_logic.Sequence`
+            sequences of the reference alignment
+        k : int, optional
+            length of the k-mers
+        method : {"MDC", "potential_MDC_only"}, optional
+            method with which the diagnostic positions are determined
+        species : list of str or None, optional
+            species to include. If None, all species are included.
+        max_expansions : int, optional
+            maximum number of k-mers into which a window with ambiguity
+            codes is expanded. Windows with more expansions are skipped.
+
+        Returns
+        -------
+        :class:`KmerScreener`
+
+        Notes
+        -----
+        The diagnostic positions are those of a :class:`fastachar.fasta_key.DiagnosticKey`.
+        For a position where a sequence has a gap, the k-mers that contain the
+        nucleotides on both sides of the gap are taken. The candidate k-mers of
+        all species are collected first; the k-mers of all reference sequences
+        are then compared with these, so that only the candidates are held in
+        memory. A k-mer is identified with its reverse complement throughout.
+        '''
+        self = cls(k)
+        key = fasta_key.DiagnosticKey.from_sequences(sequences, method, species)
+        self.species = sorted(sp for sp, positions in key.species.items() if positions)
+        index = dict((sp, i) for i, sp in enumerate(self.species))
+        candidates = {}
+        for s in sequences:
+            i = index.get(s.species)
+            if i is None:
+                continue
+            chars, positions = self.get_ungapped(s)
+            data = s.get_masked_bytes()
+            starts = set()
+            for j, _ in key.species[s.species]:
+                u = positions[j]
+                # On a gap, u is the nucleotide following it, and the k-mer 
+                # must contain the nucleotide before it as well.
+                last = u - 1 if data[j] == 45 else u
+                starts.update(range(max(0, u - k + 1), min(last, len(chars) - k) + 1))
+            for start in starts:
+                for kmer in expand_kmer(chars[start:start+k], max_expansions):
+                    candidates[min(kmer, reverse_complement(kmer))] = i
+        for s in sequences:
+            i = index.get(s.species)
+            chars, _ = self.get_ungapped(s)
+            for start in range(len(chars) - k + 1):
+                for kmer in expand_kmer(chars[start:start+k], max_expansions):
+                    canonical = min(kmer, reverse_complement(kmer))
+                    if canonical in candidates and candidates[canonical] != i:
+                        candidates[canonical] = None
+        for kmer, i in candidates.items():
+            if i is not None:
+                self.kmers[kmer] = i
+                self.kmers[reverse_complement(kmer)] = i
+        return self
+
+    @staticmethod
+    def get_ungapped(sequence):
+        '''
+        Get the nucleotides of an aligned sequence, without gaps
+
+        Parameters
+        ----------
+        sequence : :class:`fastachar.fasta_logic.Sequence`
+            aligned sequence
+
+        Returns
+        -------
+        chars : str
+            the characters that are not gaps, with masked characters as spaces.
+        positions : list of int
+            for each alignment position, the index in chars of the first
+            character at or after the position.
+        '''
+        data = sequence.get_masked_bytes().decode('ascii')
+        positions = []
+        u = 0
+        for c in data:
+            positions.append(u)
+            if c != '-':
+                u += 1
+        return data.replace('-', ''), positions
+
+    def get_species_kmers(self, species):
+        '''
+        Get the diagnostic k-mers of a species, in one orientation
+
+        Parameters
+        ----------
+        species : str
+            species name
+
+        Returns
+        -------
+        list of str
+            sorted k-mers, each the smaller of the k-mer and its reverse complement.
+        '''
+        i = self.species.index(species)
+        return sorted(set(min(kmer, reverse_complement(kmer)) for kmer, j in self.kmers.items() if j == i))
+
+    def save(self, fn):
+        '''
+        Save the k-mers as a tab separated file of species and k-mer
+
+        Parameters
+        ----------
+        fn : str
+            filename
+        '''
+        with open(fn, 'w') as fp:
+            fp.write("#k\t%d\n"%(self.k))
+            for sp in self.species:
+                for kmer in self.get_species_kmers(sp):
+                    fp.write("%s\t%s\n"%(sp, kmer))
+
+    @classmethod
+    def load(cls, fn):
+        '''
+        Load k-mers saved with :meth:`save`
+
+        Parameters
+        ----------
+        fn : str
+            filename
+
+        Returns
+        -------
+        :class:`KmerScreener`
+        '''
+        with open(fn) as fp:
+            k = int(fp.readline().split("\t")[1])
+            self = cls(k)
+            index = {}
+            for line in fp:
+                sp, kmer = line.rstrip("\n").split("\t")
+                if sp not in index:
+                    index[sp] = len(self.species)
+                    self.species.append(sp)
+                self.kmers[kmer] = self.kmers[reverse_complement(kmer)] = index[sp]
+        return self
+
+    def screen(self, fn, processes=None, batch_size=10000):
+        '''
+        Count the diagnostic k-mers per species in a file of reads
+
+        Parameters
+        ----------
+        fn : str
+            filename of a (possibly compressed) fasta or fastq file
+        processes : int or None, optional
+            number of worker processes. If None, the number of cpus. If 1, the
+            reads are screened in this process.
+        batch_size : int, optional
+            number of reads per batch
+
+        Returns
+        -------
+        n_reads : int
+            number of reads screened
+        results : list of :class:`ScreenResult`
+            for each species, the number of reads with its k-mers only, and
+            the number of k-mers found.
+
+        Notes
+        -----
+        At most two batches per process are read ahead, so that the memory
+        use is bounded by the batch size.
+        '''
+        n = len(self.species)
+        reads = [0] * n
+        hits = [0] * n
+        n_reads = 0
+        data = (self.k, self.kmers, n)
+        with fasta_io.open_fasta(fn) as fp:
+            sequences = iter_reads(fp)
+            batches = iter(lambda: list(islice(sequences, batch_size)), [])
+            if processes == 1:
+                results = (_screen_batch(batch, data) for batch in batches)
+                for r in results:
+                    n_reads = self._add_counts(r, reads, hits, n_reads)
+            else:
+                with multiprocessing.Pool(processes, _screen_init, (data,)) as pool:
+                    n_ahead = 2 * (processes or multiprocessing.cpu_count())
+                    while True:
+                        round_ = list(islice(batches, n_ahead))
+                        if not round_:
+                            break
+                        for r in pool.map(_screen_batch, round_):
+                            n_reads = self._add_counts(r, reads, hits, n_reads)
+        return n_reads, [ScreenResult(sp, r, h) for sp, r, h in zip(self.species, reads, hits)]
+
+    @staticmethod
+    def _add_counts(result, reads, hits, n_reads):
+        r_reads, r_hits, r_n = result
+        for i in range(len(reads)):
+            reads[i] += r_reads[i]
+            hits[i] += r_hits[i]
+        return n_reads + r_n
+
+
+def iter_reads(fp):
+    '''
+    Yield the sequences of the reads in a fasta or fastq file
+
+    Parameters
+    ----------
+    fp : file object
+        text stream of the file
+
+    Yields
+    ------
+    str
+        sequence of a read, in upper case.
+
+    Notes
+    -----
+    The format is derived from the first character of the file: '@' for
+    fastq (four lines per read), otherwise fasta.
+    '''
+    first = fp.readline()
+    if first.startswith("@"):
+        while first:
+            yield fp.readline().strip().upper()
+            fp.readline()
+            fp.readline()
+            first = fp.readline()
+        return
+    data = []
+    for line in fp:
+        if line.startswith(">"):
+            yield "".join(data).upper()
+            data = []
+        else:
+            data.append(line.strip())
+    if first.startswith(">"):
+        yield "".join(data).upper()
+
+
+_screen_data = None
+
+
+def _screen_init(data):
+    global _screen_data
+    _screen_data = data
+
+
+def _screen_batch(batch, data=None):
+    ''' Count the diagnostic k-mers of a batch of reads '''
+    k, kmers, n = data or _screen_data
+    reads = [0] * n
+    hits = [0] * n
+    get = kmers.get
+    for read in batch:
+        found = set()
+        for start in range(len(read) - k + 1):
+            i = get(read[start:start+k])
+            if i is not None:
+                hits[i] += 1
+                found.add(i)
+        if len(found) == 1:
+            reads[found.pop()] += 1
+    return reads, hits, len(batch)
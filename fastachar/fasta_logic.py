@@ -1,5 +1,28 @@
-from collections import UserList, defaultdict
-import re
+from array import array
+from bisect import bisect_right
+from collections import Counter, UserList, defaultdict, namedtuple
+from itertools import accumulate, islice, product
+import multiprocessing
+import random
+import time
+
+BASES = 'ACGT-'
+''' Nucleotides (and gap) in the order of their bits in a character mask.'''
+
+def mask_to_bases(mask):
+    ''' Convert a character mask into the nucleotides it represents
+
+    Parameters
+    ----------
+    mask : int
+        bit mask with a bit set for each nucleotide, in the order of :data:`BASES`
+
+    Returns
+    -------
+    str
+        nucleotides, for example "AG" for mask 0b101.
+    '''
+    return "".join([b for i, b in enumerate(BASES) if mask & (1<<i)])
 
 class Char(set):
     ''' A character object representation a nucleotide in a sequence
@@ -18,6 +41,8 @@ class Char(set):
     ----------
     _value : str
         (non-expanded) character representation of nucleotide character.
+    _mask : int
+        bit mask of the expanded nucleotides, see :data:`BASES`
  
     Notes
     -----
@@ -49,17 +74,54 @@ class Char(set):
     IUPAC = {'A':'A', 'T':'T', 'C':'C', 'G':'G', 'Y':'CT', 'R':'AG', 'W':'AT',
              'S':'GC', 'K':'TG', 'M':'CA', 'D':'AGT', 'V':'AGC', 'H':'ACT', 'B':'CGT',
              'X':'ACTG', 'N':'ACTG', '-':'-'}
+    MASKS = dict((c, sum([1<<BASES.index(b) for b in v])) for c, v in IUPAC.items())
+    VALID = "".join(IUPAC.keys()).encode('ascii')
+    _flyweights = {}
 
     def __init__(self, c, masked):
         super().__init__(Char.IUPAC[c])
         self._value = c
         self._masked = masked
+        self._mask = Char.MASKS[c]
+
+    @classmethod
+    def get(cls, c, masked):
+        ''' Get the shared instance of a character
+
+        Parameters
+        ----------
+        c : str 
+             IUPAC character
+        masked : bool
+             whether the character is masked
+
+        Returns
+        -------
+        :class:`Char`
+            the single, shared instance for this combination of c and masked.
+
+        Notes
+        -----
+        The shared instances must not be modified.
+        '''
+        try:
+            return cls._flyweights[c, masked]
+        except KeyError:
+            char = cls._flyweights[c, masked] = cls(c, masked)
+            return char
 
     @property
     def is_masked(self):
         ''' Evaluates to True if this character is a masked character.'''
         return self._masked
     
+BYTE_MASKS = [0]*256
+''' Character masks indexed by the ascii code of the character. Masked characters
+(spaces) and invalid characters have mask 0.'''
+for _c, _m in Char.MASKS.items():
+    BYTE_MASKS[ord(_c)] = _m
+
+    
 class State(set):
     ''' The class' purpose is to hold a number of Char objects
         and treat these as a set.
@@ -95,6 +157,23 @@ class State(set):
         self._chars.append(s)
         super().update(s)
 
+    @classmethod
+    def from_chars(cls, chars):
+        ''' Create a State from a character string
+
+        Parameters
+        ----------
+        chars : bytes or str
+            characters, with a space for masked characters
+
+        Returns
+        -------
+        :class:`State`
+        '''
+        if isinstance(chars, bytes):
+            chars = chars.decode('ascii')
+        return cls([Char('N', True) if c == ' ' else Char(c, False) for c in chars])
+
     def intersection_of_subsets(self):
         return set.intersection(*self._chars)
     
@@ -107,6 +186,327 @@ class State(set):
         s = ["{}".format(_s) for _s in self]
         return "/".join(s)
 
+def expand_chars(chars, weights):
+    ''' Repeat each character according to its weight
+
+    Parameters
+    ----------
+    chars : bytes
+        characters
+    weights : list of int
+        number of repetitions of each character
+
+    Returns
+    -------
+    bytes
+    '''
+    return b"".join([chars[i:i+1]*w for i, w in enumerate(weights)])
+
+
+class SiteResult(namedtuple('SiteResult', 'position mask common_mask chars')):
+    ''' Compact, immutable result for a single position within a set of sequences
+
+    Parameters
+    ----------
+    position : int
+        position (zero based)
+    mask : int
+        bit mask of all nucleotides found on this position (union)
+    common_mask : int
+        bit mask of the nucleotides shared by all sequences (intersection)
+    chars : bytes
+        character of each sequence on this position, a space for masked characters.
+    '''
+    __slots__ = ()
+
+    @property
+    def values(self):
+        ''' characters of the sequences as a string '''
+        return self.chars.decode('ascii')
+
+    @property
+    def state(self):
+        ''' nucleotides found on this position, separated by "/" '''
+        return "/".join(mask_to_bases(self.mask))
+
+    @property
+    def is_unique(self):
+        ''' True if exactly one nucleotide is found on this position '''
+        return bin(self.mask).count('1') == 1
+
+    @property
+    def is_potentially_unique(self):
+        ''' True if all sequences share exactly one nucleotide on this position '''
+        return bin(self.common_mask).count('1') == 1
+
+    def expand(self, weights):
+        ''' Expand the characters of haplotypes into those of their sequences
+
+        Parameters
+        ----------
+        weights : list of int
+            number of sequences of each haplotype, see :meth:`Haplotype.weights`
+
+        Returns
+        -------
+        :class:`SiteResult`
+        '''
+        return self._replace(chars=expand_chars(self.chars, weights))
+
+    def as_state(self):
+        ''' Convert to a :class:`State` object
+
+        Returns
+        -------
+        :class:`State`
+        '''
+        return State.from_chars(self.chars)
+
+
+class MDCResult(namedtuple('MDCResult', 'position a_mask b_mask a_chars b_chars')):
+    ''' Compact, immutable result for a molecular diagnostic character
+
+    Parameters
+    ----------
+    position : int
+        position (zero based)
+    a_mask : int
+        bit mask of all nucleotides of the sequences in list A
+    b_mask : int
+        bit mask of all nucleotides of the sequences in list B
+    a_chars : bytes
+        character of each sequence in list A, a space for masked characters.
+    b_chars : bytes
+        character of each sequence in list B, a space for masked characters.
+    '''
+    __slots__ = ()
+
+    @property
+    def a_values(self):
+        ''' characters of the sequences in list A as a string '''
+        return self.a_chars.decode('ascii')
+
+    @property
+    def b_values(self):
+        ''' characters of the sequences in list B as a string '''
+        return self.b_chars.decode('ascii')
+
+    @property
+    def a_state(self):
+        ''' nucleotides of list A, separated by "/" '''
+        return "/".join(mask_to_bases(self.a_mask))
+
+    @property
+    def b_state(self):
+        ''' nucleotides of list B, separated by "/" '''
+        return "/".join(mask_to_bases(self.b_mask))
+
+    def expand(self, a_weights, b_weights):
+        ''' Expand the characters of haplotypes into those of their sequences
+
+        Parameters
+        ----------
+        a_weights : list of int
+            number of sequences of each haplotype in list A, see :meth:`Haplotype.weights`
+        b_weights : list of int
+            number of sequences of each haplotype in list B
+
+        Returns
+        -------
+        :class:`MDCResult`
+        '''
+        return self._replace(a_chars=expand_chars(self.a_chars, a_weights),
+                             b_chars=expand_chars(self.b_chars, b_weights))
+
+    def as_states(self):
+        ''' Convert to the tuple of position and :class:`State` objects
+
+        Returns
+        -------
+        tuple of (int, :class:`State`, :class:`State`)
+        '''
+        return self.position, State.from_chars(self.a_chars), State.from_chars(self.b_chars)
+
+
+class CompoundMDCResult(namedtuple('CompoundMDCResult', 'positions a_masks')):
+    ''' Result for a compound diagnostic character: a combination of positions
+
+    Parameters
+    ----------
+    positions : tuple of int
+        positions (zero based), in increasing order
+    a_masks : tuple of int
+        bit mask of all nucleotides of the sequences in list A on each position
+
+    Notes
+    -----
+    Every sequence in list B has, on at least one of the positions, a 
+    nucleotide that does not occur in list A. The joint states of list A
+    on these positions therefore never occur in list B.
+    '''
+    __slots__ = ()
+
+    @property
+    def a_states(self):
+        ''' nucleotides of list A on each position, separated by "/" '''
+        return ["/".join(mask_to_bases(m)) for m in self.a_masks]
+
+
+class WindowResult(namedtuple('WindowResult', 'start end n_mdcs n_potential')):
+    ''' Result for a window of consecutive positions
+
+    Parameters
+    ----------
+    start : int
+        first position of the window (zero based)
+    end : int
+        position following the last position of the window
+    n_mdcs : int
+        number of molecular diagnostic characters in the window
+    n_potential : int
+        number of potential molecular diagnostic characters in the window
+    '''
+    __slots__ = ()
+
+    @property
+    def width(self):
+        ''' number of positions of the window '''
+        return self.end - self.start
+
+
+class SoftMDCResult(namedtuple('SoftMDCResult', 'position base a_frequency b_frequency')):
+    ''' Result for a frequency-threshold ("soft") molecular diagnostic character
+
+    Parameters
+    ----------
+    position : int
+        position (zero based)
+    base : int
+        index in :data:`BASES` of the most frequent nucleotide of list A
+    a_frequency : float
+        frequency of the nucleotide in list A
+    b_frequency : float
+        frequency of the nucleotide in list B
+
+    Notes
+    -----
+    Frequencies are fractions of the unmasked characters on the position.
+    Ambiguous characters count for each of their nucleotides equally, for 
+    example, R adds 0.5 to the counts of A and G.
+    '''
+    __slots__ = ()
+
+    @property
+    def a_state(self):
+        ''' the most frequent nucleotide of list A '''
+        return BASES[self.base]
+
+    @property
+    def support(self):
+        ''' probability that a random sequence of list A has the nucleotide and a
+        random sequence of list B does not, 1 for a strict MDC '''
+        return self.a_frequency * (1 - self.b_frequency)
+
+
+class LeaveOneOutResult(namedtuple('LeaveOneOutResult', 'set_name index sequence lost gained')):
+    ''' Impact of leaving out a single sequence on the molecular diagnostic characters
+
+    Parameters
+    ----------
+    set_name : {'A', 'B'}
+        set of the sequence
+    index : int
+        index of the sequence in its set
+    sequence : :class:`Sequence`
+        the sequence left out
+    lost : tuple of int
+        positions (zero based) that are no longer MDCs without the sequence
+    gained : tuple of int
+        positions (zero based) that are MDCs only without the sequence
+    '''
+    __slots__ = ()
+
+    @property
+    def n_changes(self):
+        ''' number of positions that change '''
+        return len(self.lost) + len(self.gained)
+
+
+class StabilityResult(namedtuple('StabilityResult', 'position frequency is_mdc')):
+    ''' Resampling stability of a molecular diagnostic character
+
+    Parameters
+    ----------
+    position : int
+        position (zero based)
+    frequency : float
+        fraction of the replicates in which the position is a MDC
+    is_mdc : bool
+        True if the position is a MDC of the complete sets
+    '''
+    __slots__ = ()
+
+
+class PermutationResult(namedtuple('PermutationResult', 'observed null')):
+    ''' Result of a permutation test of the number of molecular diagnostic characters
+
+    Parameters
+    ----------
+    observed : int
+        number of MDCs of the sets
+    null : tuple of int
+        number of MDCs of each permutation
+    '''
+    __slots__ = ()
+
+    @property
+    def p_value(self):
+        ''' empirical p-value, the fraction of permutations (counting the observed 
+        sets as one) with at least the observed number of MDCs '''
+        return (1 + sum(1 for x in self.null if x >= self.observed)) / (1 + len(self.null))
+
+    @property
+    def mean(self):
+        ''' mean number of MDCs of the permutations '''
+        return sum(self.null) / max(1, len(self.null))
+
+
+class CharView(object):
+    ''' A read-only list-like view of the characters of a sequence
+
+    The characters are stored as bytes, and the :class:`Char` objects are
+    the shared flyweights returned by :meth:`Char.get`.
+
+    Parameters
+    ----------
+    sequence : :class:`Sequence`
+        the sequence to view
+    '''
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+    def __len__(self):
+        return len(self.sequence.encoded)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        n = len(self.sequence.encoded)
+        if i < 0:
+            i += n
+        c = self.sequence.encoded[i]
+        return Char.get(chr(c), self.sequence.is_masked_position(i))
+
+    def __iter__(self):
+        encoded = self.sequence.encoded
+        masked = self.sequence.get_masked_bytes()
+        for c, m in zip(encoded, masked):
+            yield Char.get(chr(c), m == 32)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+        
 class Sequence(UserList):
     ''' A class to hold the information of a single sequence 
     
@@ -119,23 +519,174 @@ class Sequence(UserList):
     sequences_chars : str
         ascii representation of the sequence
 
+    Attributes
+    ----------
+    encoded : bytes
+        ascii encoded sequence characters
+    masked_spans : list of tuple of (int, int)
+        start and end of the masked regions
+
+    Notes
+    -----
+    The sequence is stored as bytes, and its characters are presented as
+    (shared) :class:`Char` objects. The sequence cannot be modified.
     '''
-    PATTERNS = (re.compile('^[N]+'), re.compile('[N]+$'),
-                re.compile('^[X]+'), re.compile('[X]+$'),
-                re.compile('^[-]+'), re.compile('[-]+$'))
+    MASK_CHARS = 'NX-'
     
     def __init__(self, ID, species, sequence_chars):
-        super().__init__()
         self.ID, self.species = ID, species
-        self.sequence_chars = sequence_chars
-        self.masked_positions = self.get_masked_positions(sequence_chars)
-        for s, m in zip(sequence_chars, self.masked_positions):
-            self.append(Char(s, m))
-
+        self.encoded = self.encode(sequence_chars)
+        self.masked_spans = self.get_masked_spans(sequence_chars)
+        self.data = CharView(self)
 
     def __repr__(self):
         return "Sequence {}({}) {}".format(self.species, self.ID, self.sequence_chars)
 
+    @classmethod
+    def from_encoded(cls, ID, species, encoded, masked_spans):
+        ''' Create a sequence from already encoded and validated characters
+
+        Parameters
+        ----------
+        ID : str
+            ID or lab code
+        species : str
+            species name
+        encoded : bytes
+            ascii encoded sequence characters
+        masked_spans : list of tuple of (int, int)
+            start and end of the masked regions
+
+        Returns
+        -------
+        :class:`Sequence`
+        '''
+        self = cls.__new__(cls)
+        self.ID, self.species = ID, species
+        self.encoded = encoded
+        self.masked_spans = masked_spans
+        self.data = CharView(self)
+        return self
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    @property
+    def sequence_chars(self):
+        ''' ascii representation of the sequence '''
+        return self.encoded.decode('ascii')
+
+    @property
+    def masked_positions(self):
+        ''' list of bool, True for masked characters '''
+        m = [False]*len(self.encoded)
+        for start, end in self.masked_spans:
+            m[start:end] = [True]*(end-start)
+        return m
+
+    def encode(self, sequence_chars):
+        ''' Encode and validate the sequence characters
+
+        Parameters
+        ----------
+        sequence_chars : str
+            string of sequence characters
+
+        Returns
+        -------
+        bytes
+            ascii encoded sequence characters
+
+        Raises
+        ------
+        KeyError
+            if an invalid character is encountered. The character is the argument of the exception.
+        '''
+        try:
+            encoded = sequence_chars.encode('ascii')
+        except UnicodeEncodeError as e:
+            raise KeyError(e.object[e.start])
+        invalid = encoded.translate(None, Char.VALID)
+        if invalid:
+            raise KeyError(chr(invalid[0]))
+        return encoded
+
+    def is_masked_position(self, i):
+        ''' Check whether position i is masked
+
+        Parameters
+        ----------
+        i : int
+            position
+
+        Returns
+        -------
+        bool
+            True if position i falls within a masked region
+        '''
+        for start, end in self.masked_spans:
+            if start <= i < end:
+                return True
+        return False
+
+    def get_unmasked_range(self):
+        ''' Get the region between the leading and trailing masked characters
+
+        Returns
+        -------
+        tuple of (int, int)
+            start and end of the unmasked region. If all characters are masked,
+            start is not smaller than end.
+        '''
+        start, end = 0, len(self.encoded)
+        for span_start, span_end in self.masked_spans:
+            if span_start == 0:
+                start = max(start, span_end)
+            if span_end == len(self.encoded):
+                end = min(end, span_start)
+        return start, end
+
+    def get_masked_bytes(self):
+        ''' Get the encoded sequence with the masked characters replaced by spaces
+
+        Returns
+        -------
+        bytes
+        '''
+        if not self.masked_spans:
+            return self.encoded
+        b = bytearray(self.encoded)
+        for start, end in self.masked_spans:
+            b[start:end] = b' '*(end-start)
+        return bytes(b)
+
+    def get_masked_spans(self, sequence_chars):
+        ''' Get masked spans
+
+        Returns the regions where this sequences has a continuous block of N, X or - characters,
+        either leading, or trailing.
+
+        Parameters
+        ----------
+        sequence_chars : str
+            string of sequence characters
+        
+        Returns
+        -------
+        list of tuple of (int, int)
+            start and end of the masked regions.
+        '''
+        n = len(sequence_chars)
+        spans = []
+        if n and sequence_chars[0] in Sequence.MASK_CHARS:
+            spans.append((0, n - len(sequence_chars.lstrip(sequence_chars[0]))))
+        if n and sequence_chars[-1] in Sequence.MASK_CHARS:
+            spans.append((len(sequence_chars.rstrip(sequence_chars[-1])), n))
+        return spans
+
     def get_masked_positions(self, sequence_chars):
         ''' Get masked positions
 
@@ -153,77 +704,911 @@ class Sequence(UserList):
             True where masked N appears.
         '''
         m = [False]*len(sequence_chars)
-        for p in Sequence.PATTERNS:
-            match = p.search(sequence_chars)
-            if match:
-                for i in range(*match.span()):
-                    m[i]=True
+        for start, end in self.get_masked_spans(sequence_chars):
+            m[start:end] = [True]*(end-start)
         return m
         
         
 
-class SequenceLogic(object):
-    ''' Class for state comparison
+class Haplotype(Sequence):
+    ''' A group of identical sequences of the same species
+
+    Parameters
+    ----------
+    members : list of :class:`Sequence`
+        identical sequences
+
+    Attributes
+    ----------
+    members : list of :class:`Sequence`
+        the sequences represented by this haplotype
+    ID : str
+        the IDs of the members, separated by commas
+
+    Notes
+    -----
+    A haplotype behaves as a single sequence, so that the logic of 
+    :class:`SequenceLogic` is evaluated once for all its members. Use
+    :meth:`expand` and the expand methods of the result records to 
+    obtain per-sequence output.
     '''
-    
-    def mark_unit_length_states_within_set(self, aset):
-        ''' marks for each position whether this position has a unique character
-        
+    def __init__(self, members):
+        first = members[0]
+        self.members = members
+        self.ID = ",".join([_s.ID for _s in members])
+        self.species = first.species
+        self.encoded = first.encoded
+        self.masked_spans = first.masked_spans
+        self.data = CharView(self)
+
+    def __repr__(self):
+        return "Haplotype {}({}) {}".format(self.species, self.ID, self.sequence_chars)
+
+    @property
+    def weight(self):
+        ''' number of sequences represented by this haplotype '''
+        return len(self.members)
+
+    @staticmethod
+    def weights(aset):
+        ''' Get the number of sequences of each element of a set
+
         Parameters
         ----------
-        aset : list of :obj: Char
+        aset : list of :class:`Sequence` or :class:`Haplotype`
 
         Returns
         -------
-        list of tuple of (bool, :class:`State`)
-            a list of tuples with first element True for unique character, and 
-            second element the character(s) on this position of :class:`State`.
+        list of int
+            weight of each haplotype, 1 for plain sequences.
         '''
-        selection = []
-        for j, c in enumerate(zip(*aset)):
-            s = State(c)
-            condition =  len(s) == 1
-            selection.append((condition, s))
-        return selection
+        return [getattr(_s, 'weight', 1) for _s in aset]
 
-        
-    def list_non_unique_characters_in_set(self, aset):
-        ''' 
-        list non-unique characters in set.
+    @staticmethod
+    def expand(aset):
+        ''' Expand haplotypes into their member sequences
 
         Parameters
         ----------
-        aset: list of :class:`Char`
-            list of sequences
+        aset : list of :class:`Sequence` or :class:`Haplotype`
 
         Returns
         -------
-        list of tuple of (int, :class:`State`)
-            Returns list of tuples of position and characters, for which more 
-            than one different characters were found.
+        list of :class:`Sequence`
+            the members of the haplotypes, in the order of the haplotypes.
         '''
-        r = self.mark_unit_length_states_within_set(aset)
-        return [(j, s) for j, (c, s) in enumerate(r) if not c and len(s)]
+        sequences = []
+        for _s in aset:
+            sequences += getattr(_s, 'members', [_s])
+        return sequences
 
-    def list_unique_characters_in_set(self, aset):
-        ''' list where aset has unique characters
+    @staticmethod
+    def has_haplotypes(aset):
+        ''' Check whether a set contains haplotypes
 
         Parameters
         ----------
-        aset: list of :class:`Char`
-            list of sequences
+        aset : list of :class:`Sequence` or :class:`Haplotype`
 
         Returns
         -------
-        list of tuple of (int, :class:`State`)
-            Returns list of tuples of position and characters, for which only 
-            one characeter was found.
+        bool
         '''
-        r = self.mark_unit_length_states_within_set(aset)
-        return [(j, s) for j, (c, s) in enumerate(r) if c]
+        return any([isinstance(_s, Haplotype) for _s in aset])
 
     
-    def compute_mdcs(self, set_A, set_B, method = "MDC"):
+class Partition(object):
+    ''' A contiguous region (locus) of a concatenated alignment
+
+    Parameters
+    ----------
+    name : str
+        name of the partition, e.g. the gene
+    start : int
+        first position (zero based)
+    end : int
+        end position (exclusive)
+
+    Notes
+    -----
+    Results computed once for the whole alignment can be split into 
+    results per partition with :meth:`split`, which gives the same results
+    as computing them for the sequences sliced with :meth:`slice`.
+    '''
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "Partition {} ({}-{})".format(self.name, self.start+1, self.end)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __eq__(self, other):
+        return (self.name, self.start, self.end) == (other.name, other.start, other.end)
+
+    def slice_sequence(self, sequence):
+        ''' Get the part of a sequence that falls within this partition
+
+        Parameters
+        ----------
+        sequence : :class:`Sequence` or :class:`Haplotype`
+
+        Returns
+        -------
+        :class:`Sequence` or :class:`Haplotype`
+            sequence with the same ID and species.
+        '''
+        if isinstance(sequence, Haplotype):
+            return Haplotype([self.slice_sequence(_s) for _s in sequence.members])
+        spans = [(max(start, self.start) - self.start, min(end, self.end) - self.start)
+                 for start, end in sequence.masked_spans if start < self.end and end > self.start]
+        return Sequence.from_encoded(sequence.ID, sequence.species,
+                                     sequence.encoded[self.start:self.end], spans)
+
+    def slice(self, aset):
+        ''' Get the parts of a set of sequences that fall within this partition
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+
+        Returns
+        -------
+        list of :class:`Sequence`
+        '''
+        return [self.slice_sequence(_s) for _s in aset]
+
+    @staticmethod
+    def split(partitions, results):
+        ''' Split results by partition
+
+        Parameters
+        ----------
+        partitions : list of :class:`Partition`
+            non-overlapping partitions, ordered by position
+        results : iterable of :class:`MDCResult` or :class:`SiteResult`
+            results for the whole alignment
+
+        Returns
+        -------
+        list of tuple of (:class:`Partition`, list)
+            for each partition its results, with positions relative to the
+            start of the partition. Results outside all partitions are dropped.
+        '''
+        starts = [p.start for p in partitions]
+        groups = [(p, []) for p in partitions]
+        for r in results:
+            i = bisect_right(starts, r.position) - 1
+            if i >= 0 and r.position < partitions[i].end:
+                groups[i][1].append(r._replace(position=r.position - partitions[i].start))
+        return groups
+
+    
+class ColumnCounts(object):
+    ''' Per-column, per-nucleotide counts of a set of sequences
+
+    Parameters
+    ----------
+    length : int
+        number of positions (columns)
+
+    Attributes
+    ----------
+    counts : list of :class:`array.array`
+        for each nucleotide in :data:`BASES`, the number of unmasked characters
+        on each position that include this nucleotide. Ambiguous characters 
+        count for each of their nucleotides.
+    unmasked : :class:`array.array`
+        number of unmasked characters on each position
+    n_sequences : int
+        number of sequences counted
+    '''
+    def __init__(self, length):
+        self.length = length
+        self.counts = [array('l', [0])*length for _ in BASES]
+        self.unmasked = array('l', [0])*length
+        self.n_sequences = 0
+
+    @classmethod
+    def from_sequences(cls, aset, length=None):
+        ''' Count the nucleotides of a set of sequences
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+        length : int or None, optional
+            number of positions. If None, the length of the first sequence.
+
+        Returns
+        -------
+        :class:`ColumnCounts`
+        '''
+        if length is None:
+            length = len(aset[0]) if aset else 0
+        self = cls(length)
+        self.n_sequences = len(aset)
+        bits = list(enumerate(BASES))
+        for j, column in enumerate(zip(*[_s.get_masked_bytes() for _s in aset])):
+            for c, n in Counter(column).items():
+                m = BYTE_MASKS[c]
+                if not m:
+                    continue
+                self.unmasked[j] += n
+                for b, _ in bits:
+                    if m & (1<<b):
+                        self.counts[b][j] += n
+        return self
+
+    def add(self, sequence, sign=1):
+        ''' Add (or remove) a single sequence
+
+        Parameters
+        ----------
+        sequence : :class:`Sequence`
+            sequence to add
+        sign : {1, -1}, optional
+            1 to add the sequence, -1 to remove it.
+        '''
+        counts = self.counts
+        unmasked = self.unmasked
+        for j, c in enumerate(sequence.get_masked_bytes()):
+            m = BYTE_MASKS[c]
+            if not m:
+                continue
+            unmasked[j] += sign
+            b = 0
+            while m:
+                if m & 1:
+                    counts[b][j] += sign
+                m >>= 1
+                b += 1
+        self.n_sequences += sign
+
+    def __add__(self, other):
+        r = ColumnCounts(self.length)
+        r.counts = [array('l', [x+y for x, y in zip(c0, c1)]) for c0, c1 in zip(self.counts, other.counts)]
+        r.unmasked = array('l', [x+y for x, y in zip(self.unmasked, other.unmasked)])
+        r.n_sequences = self.n_sequences + other.n_sequences
+        return r
+
+    def __sub__(self, other):
+        r = ColumnCounts(self.length)
+        r.counts = [array('l', [x-y for x, y in zip(c0, c1)]) for c0, c1 in zip(self.counts, other.counts)]
+        r.unmasked = array('l', [x-y for x, y in zip(self.unmasked, other.unmasked)])
+        r.n_sequences = self.n_sequences - other.n_sequences
+        return r
+
+    def get_mask(self, j):
+        ''' Get the union of the nucleotides on a position
+
+        Parameters
+        ----------
+        j : int
+            position
+
+        Returns
+        -------
+        int
+            bit mask of the nucleotides with a non-zero count.
+        '''
+        mask = 0
+        for b, c in enumerate(self.counts):
+            if c[j] > 0:
+                mask |= 1<<b
+        return mask
+
+    def get_singleton_mask(self, j):
+        ''' Get the nucleotides that occur in a single character on a position
+
+        Parameters
+        ----------
+        j : int
+            position
+
+        Returns
+        -------
+        int
+            bit mask of the nucleotides with a count of one. These nucleotides
+            disappear from the position if the character is removed.
+        '''
+        mask = 0
+        for b, c in enumerate(self.counts):
+            if c[j] == 1:
+                mask |= 1<<b
+        return mask
+
+    def get_common_mask(self, j):
+        ''' Get the intersection of the nucleotides on a position
+
+        Parameters
+        ----------
+        j : int
+            position
+
+        Returns
+        -------
+        int
+            bit mask of the nucleotides shared by all unmasked characters.
+        '''
+        n = self.unmasked[j]
+        if not n:
+            return 0
+        mask = 0
+        for b, c in enumerate(self.counts):
+            if c[j] == n:
+                mask |= 1<<b
+        return mask
+
+
+class FrequencyCounts(object):
+    ''' Per-column, per-nucleotide fractional counts of a set of sequences
+
+    Parameters
+    ----------
+    length : int
+        number of positions (columns)
+
+    Attributes
+    ----------
+    counts : list of :class:`array.array`
+        for each nucleotide in :data:`BASES`, the count of the nucleotide on
+        each position. An ambiguous character of n nucleotides adds 1/n to 
+        the count of each of its nucleotides.
+    unmasked : :class:`array.array`
+        number of unmasked characters on each position
+    n_sequences : int
+        number of sequences counted
+
+    Notes
+    -----
+    Unlike :class:`ColumnCounts`, the counts of the nucleotides on a 
+    position add up to the number of unmasked characters.
+    '''
+    WEIGHTS = [[(b, 1/bin(m).count("1")) for b in range(len(BASES)) if m & (1<<b)] if m else []
+               for m in BYTE_MASKS]
+
+    def __init__(self, length):
+        self.length = length
+        self.counts = [array('d', [0])*length for _ in BASES]
+        self.unmasked = array('l', [0])*length
+        self.n_sequences = 0
+
+    @classmethod
+    def from_sequences(cls, aset, length=None):
+        ''' Count the nucleotides of a set of sequences
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+        length : int or None, optional
+            number of positions. If None, the length of the first sequence.
+
+        Returns
+        -------
+        :class:`FrequencyCounts`
+        '''
+        if length is None:
+            length = len(aset[0]) if aset else 0
+        self = cls(length)
+        self.n_sequences = len(aset)
+        weights = FrequencyCounts.WEIGHTS
+        counts = self.counts
+        for j, column in enumerate(zip(*[_s.get_masked_bytes() for _s in aset])):
+            for c, n in Counter(column).items():
+                if not weights[c]:
+                    continue
+                self.unmasked[j] += n
+                for b, w in weights[c]:
+                    counts[b][j] += n * w
+        return self
+
+    def __add__(self, other):
+        r = FrequencyCounts(self.length)
+        r.counts = [array('d', [x+y for x, y in zip(c0, c1)]) for c0, c1 in zip(self.counts, other.counts)]
+        r.unmasked = array('l', [x+y for x, y in zip(self.unmasked, other.unmasked)])
+        r.n_sequences = self.n_sequences + other.n_sequences
+        return r
+
+    def __sub__(self, other):
+        r = FrequencyCounts(self.length)
+        r.counts = [array('d', [x-y for x, y in zip(c0, c1)]) for c0, c1 in zip(self.counts, other.counts)]
+        r.unmasked = array('l', [x-y for x, y in zip(self.unmasked, other.unmasked)])
+        r.n_sequences = self.n_sequences - other.n_sequences
+        return r
+
+    def get_frequencies(self, j):
+        ''' Get the frequencies of the nucleotides on a position
+
+        Parameters
+        ----------
+        j : int
+            position
+
+        Returns
+        -------
+        list of float
+            frequency of each nucleotide in :data:`BASES`, all zero if
+            the position is masked in all sequences.
+        '''
+        n = self.unmasked[j]
+        if not n:
+            return [0.] * len(BASES)
+        return [c[j] / n for c in self.counts]
+
+
+class SetAccumulator(object):
+    ''' Per-column union and intersection of the nucleotides of a set of sequences
+
+    The sequences are folded in one at a time and are not stored, so that the 
+    memory required depends only on the number of positions and species.
+
+    Parameters
+    ----------
+    length : int
+        number of positions (columns)
+
+    Attributes
+    ----------
+    n_sequences : int
+        number of sequences added
+    species : dict of {str : list of (int, int)}
+        per species the union of the nucleotide masks (packed, see notes) and
+        the number of sequences.
+
+    Notes
+    -----
+    The masks of all positions are packed into a single integer, one byte per
+    position, so that a sequence is folded in with a single integer OR and AND.
+    '''
+    UNION_TABLE = bytes(BYTE_MASKS)
+    COMMON_TABLE = bytes([m or 0b11111 for m in BYTE_MASKS])
+
+    def __init__(self, length):
+        self.length = length
+        self.union = 0
+        self.common = int.from_bytes(b'\x1f'*length, 'little')
+        self.n_sequences = 0
+        self.species = {}
+
+    def add(self, sequence):
+        ''' Fold in a single sequence
+
+        Parameters
+        ----------
+        sequence : :class:`Sequence`
+        '''
+        masked_bytes = sequence.get_masked_bytes()
+        union = int.from_bytes(masked_bytes.translate(SetAccumulator.UNION_TABLE), 'little')
+        self.union |= union
+        self.common &= int.from_bytes(masked_bytes.translate(SetAccumulator.COMMON_TABLE), 'little')
+        self.n_sequences += 1
+        sp = self.species.setdefault(sequence.species, [0, 0])
+        sp[0] |= union
+        sp[1] += 1
+
+    def get_union(self):
+        ''' Get the union of the nucleotides on each position
+
+        Returns
+        -------
+        bytes
+            nucleotide mask of each position
+        '''
+        return self.union.to_bytes(self.length, 'little')
+
+    def get_common(self):
+        ''' Get the intersection of the nucleotides on each position
+
+        Returns
+        -------
+        bytes
+            mask of the nucleotides shared by all unmasked characters of each position
+        '''
+        union = self.get_union()
+        common = self.common.to_bytes(self.length, 'little')
+        return bytes([c if u else 0 for u, c in zip(union, common)])
+
+    def get_species_union(self, species):
+        ''' Get the union of the nucleotides of a single species on each position
+
+        Parameters
+        ----------
+        species : str
+            species name
+
+        Returns
+        -------
+        bytes
+            nucleotide mask of each position
+        '''
+        return self.species[species][0].to_bytes(self.length, 'little')
+
+    
+class SequenceLogic(object):
+    ''' Class for state comparison
+    '''
+
+    def iter_unit_length_states_within_set(self, aset):
+        ''' yields for each position whether this position has a unique character
+
+        Parameters
+        ----------
+        aset : list of :obj: Char
+
+        Yields
+        ------
+        tuple of (bool, :class:`State`)
+            a tuple with first element True for unique character, and
+            second element the character(s) on this position of :class:`State`.
+        '''
+        for c in zip(*aset):
+            s = State(c)
+            yield len(s) == 1, s
+
+    def mark_unit_length_states_within_set(self, aset):
+        ''' marks for each position whether this position has a unique character
+        
+        Parameters
+        ----------
+        aset : list of :obj: Char
+
+        Returns
+        -------
+        list of tuple of (bool, :class:`State`)
+            a list of tuples with first element True for unique character, and 
+            second element the character(s) on this position of :class:`State`.
+        '''
+        return list(self.iter_unit_length_states_within_set(aset))
+
+    def get_unmasked_range(self, aset):
+        ''' Get the range of positions where at least one sequence is not masked
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+
+        Returns
+        -------
+        tuple of (int, int)
+            start and end position. Outside this range, all characters are masked.
+        '''
+        ranges = [_s.get_unmasked_range() for _s in aset]
+        ranges = [r for r in ranges if r[0] < r[1]]
+        if not ranges:
+            return 0, 0
+        return min([r[0] for r in ranges]), max([r[1] for r in ranges])
+
+    def compress_patterns(self, aset, start=0, end=None):
+        ''' Compress the columns of a set of sequences into unique site patterns
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+        start : int, optional
+            first position
+        end : int or None, optional
+            end position (exclusive). If None, the end of the sequences.
+
+        Returns
+        -------
+        patterns : list of bytes
+            the unique columns, with a space for masked characters
+        index : list of int
+            for each position (from start) the index of its pattern in patterns.
+
+        Notes
+        -----
+        Alignments of closely related sequences have many invariant columns, or
+        columns that share the same pattern. The results for such columns need 
+        to be computed only once per pattern.
+        '''
+        lookup = {}
+        patterns = []
+        index = []
+        for column in zip(*[_s.get_masked_bytes()[start:end] for _s in aset]):
+            key = bytes(column)
+            try:
+                k = lookup[key]
+            except KeyError:
+                k = lookup[key] = len(patterns)
+                patterns.append(key)
+            index.append(k)
+        return patterns, index
+
+    def iter_columns(self, aset, start=0, end=None, compress=False):
+        ''' yields the columns of a set of sequences
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+        start : int, optional
+            first position
+        end : int or None, optional
+            end position (exclusive). If None, the end of the sequences.
+        compress : bool, optional
+            if True, the columns are compressed into site patterns first, 
+            see :meth:`compress_patterns`.
+
+        Yields
+        ------
+        tuple of (int, int, bytes)
+            position, pattern key and the characters of the column, with a 
+            space for masked characters. Columns with the same pattern key
+            are identical.
+        '''
+        if compress:
+            patterns, index = self.compress_patterns(aset, start, end)
+            for j, k in enumerate(index, start):
+                yield j, k, patterns[k]
+        else:
+            for j, column in enumerate(zip(*[_s.get_masked_bytes()[start:end] for _s in aset]), start):
+                yield j, j, bytes(column)
+
+    def get_column_masks(self, column):
+        ''' Get the character masks of a column
+
+        Parameters
+        ----------
+        column : bytes
+            characters of a column, with a space for masked characters
+
+        Returns
+        -------
+        tuple of (int, int)
+            union and intersection of the character masks of the unmasked characters.
+        '''
+        mask = 0
+        common_mask = 0b11111
+        for c in set(column):
+            m = BYTE_MASKS[c]
+            if m:
+                mask |= m
+                common_mask &= m
+        if not mask:
+            common_mask = 0
+        return mask, common_mask
+
+    def iter_column_masks(self, aset, start=0, end=None, compress=False):
+        ''' yields the character masks of each position of a set of sequences
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+        start : int, optional
+            first position
+        end : int or None, optional
+            end position (exclusive). If None, the end of the sequences.
+        compress : bool, optional
+            if True, the masks are computed once per site pattern.
+
+        Yields
+        ------
+        tuple of (int, int, bytes)
+            union and intersection of the character masks of the unmasked
+            characters, and the characters, with a space for masked characters.
+        '''
+        evaluated = {}
+        for j, k, column in self.iter_columns(aset, start, end, compress):
+            try:
+                masks = evaluated[k]
+            except KeyError:
+                masks = self.get_column_masks(column)
+                if compress:
+                    evaluated[k] = masks
+            yield masks[0], masks[1], column
+
+    def iter_variable_sites(self, aset, compress=False):
+        '''
+        yields non-unique characters in set, in position order.
+
+        Parameters
+        ----------
+        aset: list of :class:`Sequence`
+            list of sequences
+        compress : bool, optional
+            if True, each unique site pattern is evaluated once.
+
+        Yields
+        ------
+        :class:`SiteResult`
+            result for each position for which more than one different
+            characters were found.
+        '''
+        start, end = self.get_unmasked_range(aset)
+        for j, (mask, common_mask, chars) in enumerate(self.iter_column_masks(aset, start, end, compress), start):
+            if mask & (mask - 1):
+                yield SiteResult(j, mask, common_mask, chars)
+
+    def iter_unique_sites(self, aset, compress=False):
+        '''
+        yields unique characters in set, in position order.
+
+        Parameters
+        ----------
+        aset: list of :class:`Sequence`
+            list of sequences
+        compress : bool, optional
+            if True, each unique site pattern is evaluated once.
+
+        Yields
+        ------
+        :class:`SiteResult`
+            result for each position for which only one character was found.
+        '''
+        start, end = self.get_unmasked_range(aset)
+        for j, (mask, common_mask, chars) in enumerate(self.iter_column_masks(aset, start, end, compress), start):
+            if mask and not mask & (mask - 1):
+                yield SiteResult(j, mask, common_mask, chars)
+
+    def list_non_unique_characters_in_set(self, aset, compress=False):
+        ''' 
+        list non-unique characters in set.
+
+        Parameters
+        ----------
+        aset: list of :class:`Char`
+            list of sequences
+        compress : bool, optional
+            if True, each unique site pattern is evaluated once.
+
+        Returns
+        -------
+        list of :class:`SiteResult`
+            Returns list of results for positions for which more 
+            than one different characters were found.
+        '''
+        return list(self.iter_variable_sites(aset, compress))
+
+    def list_unique_characters_in_set(self, aset, compress=False):
+        ''' list where aset has unique characters
+
+        Parameters
+        ----------
+        aset: list of :class:`Char`
+            list of sequences
+        compress : bool, optional
+            if True, each unique site pattern is evaluated once.
+
+        Returns
+        -------
+        list of :class:`SiteResult`
+            Returns list of results for positions for which only 
+            one characeter was found.
+        '''
+        return list(self.iter_unique_sites(aset, compress))
+
+    def evaluate_mdc(self, a_chars, b_chars, method = "MDC"):
+        '''Evaluates whether a single position is a molecular diagnostic character
+
+        Parameters
+        ----------
+        a_chars : bytes
+            characters of list A on this position, a space for masked characters
+        b_chars : bytes
+            characters of list B on this position, a space for masked characters
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Returns
+        -------
+        tuple of (int, int) or None
+            the nucleotide masks of list A and list B if this position is a 
+            molecular diagnostic character, None otherwise.
+        '''
+        a_mask, _ = self.get_column_masks(a_chars)
+        if not a_mask or (not a_mask & (a_mask - 1)) != (method == "MDC"):
+            return None
+        b_mask, _ = self.get_column_masks(b_chars)
+        if not b_mask: # if either set is empty, there cannot be a MDC. 
+            return None
+        if a_mask & b_mask:
+            return None
+        return a_mask, b_mask
+
+    def iter_mdcs(self, set_A, set_B, method = "MDC", compress=False):
+        '''Yields molecular diagnostic characters, in position order
+
+        Parameters
+        ----------
+        set_A: list of :class:`Char`
+            list of sequences in list A
+        set_B: list of :class:`Char`
+            list of sequence in list B
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+        compress : bool, optional
+            if True, the columns of set A and set B are compressed into site
+            patterns first, and each pattern is evaluated once.
+
+        Yields
+        ------
+        :class:`MDCResult`
+            the position, the nucleotide masks and characters of list A and list B.
+
+        Notes
+        -----
+        Without compression, the columns are evaluated only when the next result 
+        is requested, so that the consumer can stop early. See :meth:`compute_mdcs` 
+        for a description of the methods.
+        '''
+        if method not in "MDC potential_MDC_only".split():
+            raise ValueError('Invalid method specified. Use either MDC or potential_MDC_only.')
+        # Outside the unmasked ranges of either set there cannot be a MDC.
+        start_A, end_A = self.get_unmasked_range(set_A)
+        start_B, end_B = self.get_unmasked_range(set_B)
+        start, end = max(start_A, start_B), min(end_A, end_B)
+        if start >= end:
+            return
+        n_A = len(set_A)
+        evaluated = {}
+        for j, k, column in self.iter_columns(list(set_A) + list(set_B), start, end, compress):
+            try:
+                r = evaluated[k]
+            except KeyError:
+                r = self.evaluate_mdc(column[:n_A], column[n_A:], method)
+                if r:
+                    r = MDCResult(j, r[0], r[1], column[:n_A], column[n_A:])
+                if compress:
+                    evaluated[k] = r
+            if r:
+                yield r if r.position == j else r._replace(position=j)
+
+    def first_mdcs(self, set_A, set_B, k, method = "MDC", compress=False):
+        '''Computes the first k molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_A: list of :class:`Char`
+            list of sequences in list A
+        set_B: list of :class:`Char`
+            list of sequence in list B
+        k : int
+            maximum number of molecular diagnostic characters to return
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+        compress : bool, optional
+            if True, each unique site pattern is evaluated once.
+
+        Returns
+        -------
+        list of :class:`MDCResult`
+            at most k molecular diagnostic characters, with the lowest positions.
+        '''
+        return list(islice(self.iter_mdcs(set_A, set_B, method, compress), k))
+
+    def has_mdcs(self, set_A, set_B, method = "MDC", compress=False):
+        '''Checks whether set A has any molecular diagnostic character
+
+        Parameters
+        ----------
+        set_A: list of :class:`Char`
+            list of sequences in list A
+        set_B: list of :class:`Char`
+            list of sequence in list B
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+        compress : bool, optional
+            if True, each unique site pattern is evaluated once.
+
+        Returns
+        -------
+        bool
+            True as soon as the first molecular diagnostic character is found.
+        '''
+        for _ in self.iter_mdcs(set_A, set_B, method, compress):
+            return True
+        return False
+    
+    def compute_mdcs(self, set_A, set_B, method = "MDC", compress=False):
         '''Computes molecular diagnostic characters
         
         Parameters
@@ -236,12 +1621,16 @@ class SequenceLogic(object):
         method: {"MDC", "potential_MDC_only"}
             method of comparison.
 
+        compress : bool, optional
+            if True, the columns are compressed into site patterns first, and
+            each unique pattern is evaluated once. This is faster for wide 
+            alignments with a low diversity.
 
         Returns
         -------
-        list of tuples of (int, :class:`State`, :class:`State`)
-            Each tuple contains the position, its state for list A, and its state for list B
-            sequences.
+        list of :class:`MDCResult`
+            Each result contains the position, and the nucleotide masks and characters 
+            of list A and list B sequences.
 
         
         This method computes molecular diagnostic characters by comparing the sequences in list 
@@ -254,18 +1643,853 @@ class SequenceLogic(object):
              * "potential_MDC_only" return MDCs only
                 condition 2 is honoured, condition 1 is violated. 
         '''
+        return list(self.iter_mdcs(set_A, set_B, method, compress))
+
+    def iter_mdcs_from_counts(self, set_A, set_B, total_counts, method = "MDC"):
+        '''Yields molecular diagnostic characters of set A against the rest of an alignment
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B. Together, set_A and set_B must be the
+            sequences counted in total_counts.
+        total_counts : :class:`ColumnCounts`
+            counts of the whole alignment
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Yields
+        ------
+        :class:`MDCResult`
+            the position, the nucleotide masks and characters of list A and list B.
+
+        Notes
+        -----
+        The nucleotides of set B on each position are derived from the 
+        counts of the whole alignment minus those of set A, so that only the 
+        sequences of set A are scanned. The sequences of set B are only 
+        accessed to report the characters on the molecular diagnostic characters.
+        The results are the same as those of :meth:`iter_mdcs`.
+        '''
         if method not in "MDC potential_MDC_only".split():
             raise ValueError('Invalid method specified. Use either MDC or potential_MDC_only.')
-        
-        selection = []
-        potential_CAs = self.mark_unit_length_states_within_set(set_A)
-        
-        for j, ((is_unique, state_a), b) in enumerate(zip(potential_CAs, zip(*set_B))):
-            if (method=="MDC" and is_unique) or (method=="potential_MDC_only" and not is_unique):
-                state_b = State(b)
-                if not state_a or not state_b: # if either set is empty, there cannot be a MDC. 
+        want_unique = method == "MDC"
+        counts_B = total_counts - ColumnCounts.from_sequences(set_A, total_counts.length)
+        start, end = self.get_unmasked_range(set_A)
+        for j, (a_mask, _, a_chars) in enumerate(self.iter_column_masks(set_A, start, end), start):
+            if not a_mask or (not a_mask & (a_mask - 1)) != want_unique:
+                continue
+            b_mask = counts_B.get_mask(j)
+            if not b_mask or a_mask & b_mask:
+                continue
+            b_chars = bytes([32 if _s.is_masked_position(j) else _s.encoded[j] for _s in set_B])
+            yield MDCResult(j, a_mask, b_mask, a_chars, b_chars)
+
+    def compute_mdcs_from_counts(self, set_A, set_B, total_counts, method = "MDC"):
+        '''Computes molecular diagnostic characters of set A against the rest of an alignment
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B, the complement of set_A.
+        total_counts : :class:`ColumnCounts`
+            counts of the whole alignment, see :meth:`fastachar.fasta_io.Alignment.get_column_counts`
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Returns
+        -------
+        list of :class:`MDCResult`
+            See :meth:`iter_mdcs_from_counts`.
+        '''
+        return list(self.iter_mdcs_from_counts(set_A, set_B, total_counts, method))
+
+    def iter_mdcs_from_accumulators(self, acc_A, acc_B, method = "MDC"):
+        '''Yields molecular diagnostic characters from streamed accumulators
+
+        Parameters
+        ----------
+        acc_A : :class:`SetAccumulator`
+            accumulator of the sequences in list A
+        acc_B : :class:`SetAccumulator`
+            accumulator of the sequences in list B
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Yields
+        ------
+        :class:`MDCResult`
+            the position and the nucleotide masks of list A and list B. As the 
+            sequences are not stored, the characters (a_chars and b_chars) are empty.
+        '''
+        if method not in "MDC potential_MDC_only".split():
+            raise ValueError('Invalid method specified. Use either MDC or potential_MDC_only.')
+        want_unique = method == "MDC"
+        for j, (a_mask, b_mask) in enumerate(zip(acc_A.get_union(), acc_B.get_union())):
+            if not a_mask or not b_mask or (not a_mask & (a_mask - 1)) != want_unique:
+                continue
+            if not a_mask & b_mask:
+                yield MDCResult(j, a_mask, b_mask, b'', b'')
+
+    def iter_variable_sites_from_accumulator(self, acc):
+        '''Yields non-unique characters from a streamed accumulator
+
+        Parameters
+        ----------
+        acc : :class:`SetAccumulator`
+            accumulator of a set of sequences
+
+        Yields
+        ------
+        :class:`SiteResult`
+            result for each position for which more than one different
+            characters were found. The characters (chars) are empty.
+        '''
+        for j, (mask, common_mask) in enumerate(zip(acc.get_union(), acc.get_common())):
+            if mask & (mask - 1):
+                yield SiteResult(j, mask, common_mask, b'')
+
+    def get_exclusion_sets(self, set_A, set_B):
+        '''Get for each position the sequences of set B that differ from all of set A
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+
+        Returns
+        -------
+        dict of {int : list of int}
+            for each distinct, non-empty exclusion set, the positions where it
+            occurs. An exclusion set is a bitset with bit i set if sequence i 
+            of set B has no nucleotide in common with the nucleotides of set A
+            on that position. As in :meth:`iter_mdcs`, masked characters of
+            set B do not count against a position, and are excluded.
+        a_masks : dict of {int : int}
+            bit mask of all nucleotides of set A on each position.
+        '''
+        exclusion_sets = {}
+        a_masks = {}
+        tables = {}
+        start, end = self.get_unmasked_range(set_A)
+        columns_B = self.iter_columns(set_B, start, end)
+        for j, (a_mask, _, _), (_, _, b_column) in zip(range(start, end), self.iter_column_masks(set_A, start, end), columns_B):
+            if not a_mask or not b_column.strip():
+                continue
+            try:
+                table = tables[a_mask]
+            except KeyError:
+                table = tables[a_mask] = bytes([48 if m & a_mask else 49 for m in BYTE_MASKS])
+            excluded = int(b_column[::-1].translate(table), 2)
+            if excluded:
+                exclusion_sets.setdefault(excluded, []).append(j)
+                a_masks[j] = a_mask
+        return exclusion_sets, a_masks
+
+    def iter_compound_mdcs(self, set_A, set_B, max_size=3, max_results=1000, max_time=10.):
+        '''Yields minimal combinations of positions that separate set A from set B
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        max_size : int, optional
+            maximum number of positions in a combination (1, 2 or 3)
+        max_results : int, optional
+            maximum number of combinations returned
+        max_time : float, optional
+            maximum time in seconds spent in the search
+
+        Yields
+        ------
+        :class:`CompoundMDCResult`
+            combinations of positions, in order of increasing size.
+
+        Notes
+        -----
+        A combination of positions separates the sets if each sequence in set B
+        is excluded (see :meth:`get_exclusion_sets`) on at least one of 
+        the positions. This is a set cover problem over the sequences of set B. 
+        Positions with the same exclusion set are searched once. Combinations 
+        are minimal: no subset of their positions separates the sets. Single 
+        positions are the molecular diagnostic characters, but may include 
+        positions on which set A has more than one nucleotide.
+
+        The search is pruned by ordering the exclusion sets by size; a
+        combination of k sets is not extended if the k largest remaining
+        sets cannot cover set B. The search stops when max_results 
+        combinations are found, or when max_time has elapsed.
+        '''
+        deadline = time.monotonic() + max_time
+        exclusion_sets, a_masks = self.get_exclusion_sets(set_A, set_B)
+        full = (1 << len(set_B)) - 1
+        n_B = len(set_B)
+        sets = sorted(exclusion_sets, key=lambda e: bin(e).count("1"), reverse=True)
+        sizes = [bin(e).count("1") for e in sets]
+        n_results = 0
+
+        def results(*covers):
+            for positions in product(*[exclusion_sets[e] for e in covers]):
+                positions = tuple(sorted(positions))
+                yield CompoundMDCResult(positions, tuple([a_masks[j] for j in positions]))
+
+        singles = [e for e in sets if e == full]
+        for e in singles:
+            for r in results(e):
+                yield r
+                n_results += 1
+                if n_results >= max_results:
+                    return
+        sets = [e for e in sets if e != full]
+        sizes = sizes[len(singles):]
+        n = len(sets)
+        if max_size >= 2:
+            for i in range(n):
+                if sizes[i] * 2 < n_B:
+                    break
+                missing = full & ~sets[i]
+                for k in range(i+1, n):
+                    if sizes[i] + sizes[k] < n_B:
+                        break
+                    if sets[k] & missing == missing:
+                        for r in results(sets[i], sets[k]):
+                            yield r
+                            n_results += 1
+                            if n_results >= max_results:
+                                return
+                if time.monotonic() > deadline:
+                    return
+        if max_size >= 3:
+            for i in range(n):
+                if sizes[i] * 3 < n_B:
+                    break
+                for k in range(i+1, n):
+                    if sizes[i] + 2*sizes[k] < n_B:
+                        break
+                    union = sets[i] | sets[k]
+                    if union == full:
+                        continue
+                    missing = full & ~union
+                    for m in range(k+1, n):
+                        if sizes[i] + sizes[k] + sizes[m] < n_B:
+                            break
+                        if sets[m] & missing != missing:
+                            continue
+                        # minimal: no pair of the three covers set B.
+                        if sets[i] | sets[m] == full or sets[k] | sets[m] == full:
+                            continue
+                        for r in results(sets[i], sets[k], sets[m]):
+                            yield r
+                            n_results += 1
+                            if n_results >= max_results:
+                                return
+                    if time.monotonic() > deadline:
+                        return
+
+    def compute_compound_mdcs(self, set_A, set_B, max_size=3, max_results=1000, max_time=10.):
+        '''Computes minimal combinations of positions that separate set A from set B
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        max_size : int, optional
+            maximum number of positions in a combination (1, 2 or 3)
+        max_results : int, optional
+            maximum number of combinations returned
+        max_time : float, optional
+            maximum time in seconds spent in the search
+
+        Returns
+        -------
+        list of :class:`CompoundMDCResult`
+
+        See also :meth:`iter_compound_mdcs`.
+        '''
+        return list(self.iter_compound_mdcs(set_A, set_B, max_size, max_results, max_time))
+
+    def count_windows(self, flags, width):
+        '''Counts the flagged positions in all windows of a given width
+
+        Parameters
+        ----------
+        flags : list of int
+            1 for each flagged position, 0 otherwise
+        width : int
+            number of positions of a window
+
+        Returns
+        -------
+        list of int
+            number of flagged positions in the window starting at each position.
+        '''
+        prefix = [0] + list(accumulate(flags))
+        return [b - a for a, b in zip(prefix, prefix[width:])]
+
+    def scan_windows(self, set_A, set_B, widths, k=5, total_counts=None):
+        '''Finds the windows with the highest density of molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        widths : int or list of int
+            number(s) of positions of the windows
+        k : int, optional
+            maximum number of windows returned per width
+        total_counts : :class:`ColumnCounts` or None, optional
+            counts of set_A and set_B together. If given, the molecular 
+            diagnostic characters are computed with :meth:`compute_mdcs_from_counts`.
+
+        Returns
+        -------
+        dict of {int : list of :class:`WindowResult`}
+            for each width, at most k non-overlapping windows, in order of 
+            decreasing number of MDCs and potential MDCs.
+
+        Notes
+        -----
+        The MDCs and potential MDCs are flagged in a single pass over the 
+        columns: a position with disjoint nucleotide masks is an MDC if the 
+        mask of set A has a single nucleotide, and a potential MDC otherwise. 
+        The number of (potential) MDCs in all windows of a width follows from
+        the prefix sums of the per-position flags, so that the cost per width
+        is linear in the length of the alignment. Windows without any 
+        (potential) MDCs are not returned.
+        '''
+        if isinstance(widths, int):
+            widths = [widths]
+        if not set_A:
+            raise ValueError('Set A must not be empty.')
+        length = len(set_A[0])
+        start, end = self.get_unmasked_range(set_A)
+        if total_counts is None:
+            b_masks = (b_mask for b_mask, _, _ in self.iter_column_masks(set_B, start, end))
+        else:
+            counts_B = total_counts - ColumnCounts.from_sequences(set_A, length)
+            b_masks = (counts_B.get_mask(j) for j in range(start, end))
+        flags = {"MDC": [0] * length, "potential_MDC_only": [0] * length}
+        for j, ((a_mask, _, _), b_mask) in enumerate(zip(self.iter_column_masks(set_A, start, end), b_masks), start):
+            if not a_mask or not b_mask or a_mask & b_mask:
+                continue
+            flags["potential_MDC_only" if a_mask & (a_mask - 1) else "MDC"][j] = 1
+        windows = {}
+        for width in widths:
+            if width < 1 or width > length:
+                raise ValueError('Window width must be between 1 and the length of the sequences.')
+            n_mdcs = self.count_windows(flags["MDC"], width)
+            n_potential = self.count_windows(flags["potential_MDC_only"], width)
+            starts = [j for j in range(len(n_mdcs)) if n_mdcs[j] or n_potential[j]]
+            starts.sort(key=lambda j: (-n_mdcs[j], -n_potential[j], j))
+            chosen = []
+            for j in starts:
+                if len(chosen) == k:
+                    break
+                i = bisect_right(chosen, j)
+                if (i and chosen[i-1] + width > j) or (i < len(chosen) and j + width > chosen[i]):
                     continue
-                if not state_a.intersection(state_b):
-                    selection.append((j, state_a, state_b))
-        return selection
+                chosen.insert(i, j)
+            chosen.sort(key=lambda j: (-n_mdcs[j], -n_potential[j], j))
+            windows[width] = [WindowResult(j, j + width, n_mdcs[j], n_potential[j]) for j in chosen]
+        return windows
+
+    def iter_species_windows(self, sequences, widths, k=5, species=None, total_counts=None):
+        '''Yields the windows with the highest density of MDCs for each species
+
+        Parameters
+        ----------
+        sequences : list of :class:`Sequence`
+            sequences of all species
+        widths : int or list of int
+            number(s) of positions of the windows
+        k : int, optional
+            maximum number of windows per width and species
+        species : list of str or None, optional
+            species to scan, each against all other sequences. If None, all species are scanned.
+        total_counts : :class:`ColumnCounts` or None, optional
+            counts of all sequences, computed if not given.
+
+        Yields
+        ------
+        tuple of (str, list of :class:`Sequence`, dict of {int : list of :class:`WindowResult`})
+            species, its sequences and its windows, see :meth:`scan_windows`.
+        '''
+        if total_counts is None:
+            total_counts = ColumnCounts.from_sequences(sequences)
+        groups = defaultdict(list)
+        for s in sequences:
+            groups[s.species].append(s)
+        for sp in (species if species is not None else sorted(groups)):
+            set_A = groups.get(sp)
+            if not set_A:
+                continue
+            set_B = [s for s in sequences if s.species != sp]
+            if not set_B:
+                continue
+            yield sp, set_A, self.scan_windows(set_A, set_B, widths, k, total_counts)
+
+    def get_soft_mdc_candidates(self, set_A, set_B, total_frequencies=None):
+        '''Computes the most frequent nucleotide of set A and its frequencies on each position
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        total_frequencies : :class:`FrequencyCounts` or None, optional
+            counts of set_A and set_B together. If given, the counts of set B
+            are derived from these, and set B is not scanned.
+
+        Returns
+        -------
+        list of :class:`SoftMDCResult`
+            one candidate for each position where both sets have unmasked characters.
+
+        Notes
+        -----
+        The candidates depend only on the sets, so that they can be filtered 
+        with :meth:`filter_soft_mdcs` for any number of thresholds. If two 
+        nucleotides are equally frequent in set A, the one that is less 
+        frequent in set B is chosen.
+        '''
+        if not set_A:
+            raise ValueError('Set A must not be empty.')
+        length = len(set_A[0])
+        counts_A = FrequencyCounts.from_sequences(set_A, length)
+        if total_frequencies is None:
+            counts_B = FrequencyCounts.from_sequences(set_B, length)
+        else:
+            counts_B = total_frequencies - counts_A
+        candidates = []
+        for j in range(length):
+            if not counts_A.unmasked[j] or not counts_B.unmasked[j]:
+                continue
+            f_A = counts_A.get_frequencies(j)
+            f_B = counts_B.get_frequencies(j)
+            b = max(range(len(BASES)), key=lambda i: (f_A[i], -f_B[i]))
+            candidates.append(SoftMDCResult(j, b, f_A[b], f_B[b]))
+        return candidates
+
+    def filter_soft_mdcs(self, candidates, min_a_frequency=0.95, max_b_frequency=0.05):
+        '''Selects the candidates that pass frequency thresholds
+
+        Parameters
+        ----------
+        candidates : list of :class:`SoftMDCResult`
+            candidates, see :meth:`get_soft_mdc_candidates`
+        min_a_frequency : float, optional
+            minimum frequency of the nucleotide in set A (0-1)
+        max_b_frequency : float, optional
+            maximum frequency of the nucleotide in set B (0-1)
+
+        Returns
+        -------
+        list of :class:`SoftMDCResult`
+        '''
+        # Allow for rounding of the fractional counts of ambiguous characters.
+        eps = 1e-9
+        return [r for r in candidates
+                if r.a_frequency >= min_a_frequency - eps and r.b_frequency <= max_b_frequency + eps]
+
+    def compute_soft_mdcs(self, set_A, set_B, min_a_frequency=0.95, max_b_frequency=0.05, total_frequencies=None):
+        '''Computes frequency-threshold ("soft") molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        min_a_frequency : float, optional
+            minimum frequency of the nucleotide in set A (0-1)
+        max_b_frequency : float, optional
+            maximum frequency of the nucleotide in set B (0-1)
+        total_frequencies : :class:`FrequencyCounts` or None, optional
+            counts of set_A and set_B together.
+
+        Returns
+        -------
+        list of :class:`SoftMDCResult`
+
+        Notes
+        -----
+        A position is a soft MDC if the most frequent nucleotide of set A has
+        at least frequency min_a_frequency in set A, and at most frequency 
+        max_b_frequency in set B. Unlike :meth:`compute_mdcs`, a few deviating
+        (for example mis-sequenced) sequences do not rule out a position. With 
+        min_a_frequency=1 and max_b_frequency=0, the results are the positions
+        of the MDCs of method "MDC".
+
+        To evaluate several thresholds, compute the candidates once with
+        :meth:`get_soft_mdc_candidates` and filter them with :meth:`filter_soft_mdcs`.
+        '''
+        candidates = self.get_soft_mdc_candidates(set_A, set_B, total_frequencies)
+        return self.filter_soft_mdcs(candidates, min_a_frequency, max_b_frequency)
+
+    def is_mdc_mask(self, a_mask, b_mask, method = "MDC"):
+        '''Evaluates whether the nucleotide masks of a position make a molecular diagnostic character
+
+        Parameters
+        ----------
+        a_mask : int
+            union of the nucleotides of list A on the position
+        b_mask : int
+            union of the nucleotides of list B on the position
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Returns
+        -------
+        bool
+
+        See also :meth:`evaluate_mdc`.
+        '''
+        if not a_mask or not b_mask or a_mask & b_mask:
+            return False
+        return (not a_mask & (a_mask - 1)) == (method == "MDC")
+
+    def iter_leave_one_out(self, set_A, set_B, method = "MDC"):
+        '''Yields the impact of leaving out each sequence on the molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Yields
+        ------
+        :class:`LeaveOneOutResult`
+            for each sequence of set A and then set B, the positions that are 
+            lost or gained as (potential) MDC if the sequence is left out.
+
+        Notes
+        -----
+        The per-column nucleotide counts of both sets are computed once. 
+        Leaving out a sequence only changes the nucleotide mask of its set on 
+        positions where it has a nucleotide that no other sequence of the set
+        has (see :meth:`ColumnCounts.get_singleton_mask`), so that each 
+        sequence is evaluated in a single pass over its characters, and the 
+        total cost is linear in the number of sequences times the number of
+        positions.
+
+        A gained position marks a sequence that is the only one preventing
+        an MDC, for example a contaminated or misidentified specimen. A lost
+        position is an MDC that depends on the only unmasked character of 
+        a set. Each element of a set is left out as a whole; a 
+        :class:`Haplotype` is left out with all its members.
+        '''
+        if method not in "MDC potential_MDC_only".split():
+            raise ValueError('Invalid method specified. Use either MDC or potential_MDC_only.')
+        if not set_A:
+            raise ValueError('Set A must not be empty.')
+        length = len(set_A[0])
+        counts_A = ColumnCounts.from_sequences(set_A, length)
+        counts_B = ColumnCounts.from_sequences(set_B, length)
+        a_masks = [counts_A.get_mask(j) for j in range(length)]
+        b_masks = [counts_B.get_mask(j) for j in range(length)]
+        current = [self.is_mdc_mask(a, b, method) for a, b in zip(a_masks, b_masks)]
+        for set_name, aset, counts in (('A', set_A, counts_A), ('B', set_B, counts_B)):
+            singletons = [counts.get_singleton_mask(j) for j in range(length)]
+            positions = [j for j in range(length) if singletons[j]]
+            for i, s in enumerate(aset):
+                data = s.get_masked_bytes()
+                lost = []
+                gained = []
+                for j in positions:
+                    m = BYTE_MASKS[data[j]] & singletons[j]
+                    if not m:
+                        continue
+                    if set_name == 'A':
+                        r = self.is_mdc_mask(a_masks[j] & ~m, b_masks[j], method)
+                    else:
+                        r = self.is_mdc_mask(a_masks[j], b_masks[j] & ~m, method)
+                    if r != current[j]:
+                        (gained if r else lost).append(j)
+                yield LeaveOneOutResult(set_name, i, s, tuple(lost), tuple(gained))
+
+    def compute_leave_one_out(self, set_A, set_B, method = "MDC"):
+        '''Computes the impact of leaving out each sequence on the molecular diagnostic characters
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+
+        Returns
+        -------
+        list of :class:`LeaveOneOutResult`
+            See :meth:`iter_leave_one_out`.
+        '''
+        return list(self.iter_leave_one_out(set_A, set_B, method))
+
+    def get_nucleotide_bitsets(self, aset):
+        '''Get for each nucleotide and position the sequences that have the nucleotide
+
+        Parameters
+        ----------
+        aset : list of :class:`Sequence`
+            list of sequences
+
+        Returns
+        -------
+        list of list of int
+            for each nucleotide in :data:`BASES`, a bitset per position with 
+            bit i set if (unmasked) sequence i has the nucleotide on the position.
+        '''
+        tables = [bytes([49 if m & (1<<b) else 48 for m in BYTE_MASKS]) for b in range(len(BASES))]
+        bitsets = [[] for _ in BASES]
+        for _, _, column in self.iter_columns(aset):
+            column = column[::-1]
+            for b, table in enumerate(tables):
+                bitsets[b].append(int(column.translate(table), 2))
+        return bitsets
+
+    def compute_mdc_stability(self, set_A, set_B, n_replicates=100, method = "MDC",
+                              scheme="bootstrap", fraction=0.5, seed=None, processes=None):
+        '''Computes how often positions are MDCs when the sequences are resampled
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        n_replicates : int, optional
+            number of replicates
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+        scheme : {"bootstrap", "jackknife"}, optional
+            "bootstrap" draws, within each species, as many sequences as the 
+            species has, with replacement. "jackknife" draws a fraction of the 
+            sequences of each species, without replacement.
+        fraction : float, optional
+            fraction of the sequences of each species drawn by the jackknife.
+            At least one sequence is drawn per species.
+        seed : int or None, optional
+            seed of the random number generator. The results for a seed do not
+            depend on the number of processes.
+        processes : int or None, optional
+            number of worker processes. If None, the number of cpus. If 1, the 
+            replicates are computed in this process.
+
+        Returns
+        -------
+        list of :class:`StabilityResult`
+            the positions that are MDCs in the complete sets or in at least one 
+            replicate, in position order.
+
+        Notes
+        -----
+        Species are resampled separately within set A and set B. Since the MDCs
+        only depend on which sequences are drawn, a replicate is a bitset of 
+        sequences. The nucleotide masks of both sets on all positions are then
+        derived from the bitsets of :meth:`get_nucleotide_bitsets`, which are 
+        computed once. Each replicate has its own seed, drawn from seed, and 
+        the replicates are computed in a process pool in chunks.
+        '''
+        if method not in "MDC potential_MDC_only".split():
+            raise ValueError('Invalid method specified. Use either MDC or potential_MDC_only.')
+        if scheme not in ("bootstrap", "jackknife"):
+            raise ValueError('Invalid scheme specified. Use either bootstrap or jackknife.')
+        aset = list(set_A) + list(set_B)
+        groups = []
+        for offset, s in ((0, set_A), (len(set_A), set_B)):
+            species = defaultdict(list)
+            for i, _s in enumerate(s, offset):
+                species[_s.species].append(i)
+            groups.append([species[sp] for sp in sorted(species)])
+        all_A = (1 << len(set_A)) - 1
+        all_B = ((1 << len(aset)) - 1) & ~all_A
+        data = (self.get_nucleotide_bitsets(aset), groups, method, scheme, fraction)
+        rng = random.Random(seed)
+        seeds = [rng.getrandbits(64) for _ in range(n_replicates)]
+        current = _count_mdcs(data, [(all_A, all_B)])
+        chunks = [seeds[i:i+16] for i in range(0, len(seeds), 16)]
+        if processes == 1:
+            results = [_stability_replicates(chunk, data) for chunk in chunks]
+        else:
+            with multiprocessing.Pool(processes, _pool_init, (data,)) as pool:
+                results = pool.map(_stability_replicates, chunks)
+        counts = [0] * len(current)
+        for r in results:
+            counts = [x + y for x, y in zip(counts, r)]
+        return [StabilityResult(j, n / max(1, n_replicates), bool(c))
+                for j, (n, c) in enumerate(zip(counts, current)) if n or c]
+
+    def compute_mdc_permutation_test(self, set_A, set_B, n_permutations=1000, method = "MDC",
+                                     seed=None, processes=None):
+        '''Computes the null distribution of the number of MDCs by permuting the species labels
+
+        Parameters
+        ----------
+        set_A: list of :class:`Sequence`
+            list of sequences in list A
+        set_B: list of :class:`Sequence`
+            list of sequence in list B
+        n_permutations : int, optional
+            number of permutations
+        method: {"MDC", "potential_MDC_only"}
+            method of comparison.
+        seed : int or None, optional
+            seed of the random number generator. The results for a seed do not
+            depend on the number of processes.
+        processes : int or None, optional
+            number of worker processes. If None, the number of cpus. If 1, the 
+            permutations are computed in this process.
+
+        Returns
+        -------
+        :class:`PermutationResult`
+            the observed number of MDCs, the numbers of the permutations and 
+            the empirical p-value.
+
+        Notes
+        -----
+        In each permutation, set A is a random selection of as many sequences
+        of set A and set B together as set A has, and set B is the rest. The 
+        numbers of MDCs are computed from the nucleotide bitsets of 
+        :meth:`get_nucleotide_bitsets`, limited to the positions with more than 
+        one nucleotide, as in :meth:`compute_mdc_stability`.
+        '''
+        if method not in "MDC potential_MDC_only".split():
+            raise ValueError('Invalid method specified. Use either MDC or potential_MDC_only.')
+        aset = list(set_A) + list(set_B)
+        bitsets = self.get_nucleotide_bitsets(aset)
+        # A position with a single nucleotide cannot be a MDC of any selection.
+        variable = [j for j in range(len(bitsets[0]))
+                    if sum(1 for bitset in bitsets if bitset[j]) > 1]
+        bitsets = [[bitset[j] for j in variable] for bitset in bitsets]
+        data = (bitsets, len(set_A), len(aset), method)
+        everything = (1 << len(aset)) - 1
+        all_A = (1 << len(set_A)) - 1
+        observed = sum(1 for _ in _iter_replicate_mdcs(bitsets, method, all_A, everything & ~all_A))
+        rng = random.Random(seed)
+        seeds = [rng.getrandbits(64) for _ in range(n_permutations)]
+        chunks = [seeds[i:i+16] for i in range(0, len(seeds), 16)]
+        if processes == 1:
+            null = [x for chunk in chunks for x in _permutation_replicates(chunk, data)]
+        else:
+            with multiprocessing.Pool(processes, _pool_init, (data,)) as pool:
+                null = [x for r in pool.imap(_permutation_replicates, chunks) for x in r]
+        return PermutationResult(observed, tuple(null))
+
+
+def _iter_replicate_mdcs(bitsets, method, sel_A, sel_B):
+    ''' Yield the positions that are MDCs of a selection of sequences
+
+    Parameters
+    ----------
+    bitsets : list of list of int
+        see :meth:`SequenceLogic.get_nucleotide_bitsets`
+    method: {"MDC", "potential_MDC_only"}
+        method of comparison.
+    sel_A : int
+        bitset of the sequences in set A
+    sel_B : int
+        bitset of the sequences in set B
+
+    Yields
+    ------
+    int
+        index of the position in the bitsets
+    '''
+    is_mdc_mask = SequenceLogic().is_mdc_mask
+    bits = list(enumerate(bitsets))
+    for j in range(len(bitsets[0])):
+        a_mask = b_mask = 0
+        for b, bitset in bits:
+            x = bitset[j]
+            if x & sel_A:
+                a_mask |= 1<<b
+            if x & sel_B:
+                b_mask |= 1<<b
+        if is_mdc_mask(a_mask, b_mask, method):
+            yield j
+
+
+def _count_mdcs(data, replicates):
+    ''' Count per position in how many replicates it is a MDC
+
+    Parameters
+    ----------
+    data : tuple
+        see :meth:`SequenceLogic.compute_mdc_stability`
+    replicates : list of tuple of (int, int)
+        bitsets of the sequences of set A and set B drawn in each replicate
+
+    Returns
+    -------
+    list of int
+    '''
+    bitsets, _, method, _, _ = data
+    counts = [0] * len(bitsets[0])
+    for sel_A, sel_B in replicates:
+        for j in _iter_replicate_mdcs(bitsets, method, sel_A, sel_B):
+            counts[j] += 1
+    return counts
+
+
+def _draw_replicate(rng, groups, scheme, fraction):
+    ''' Draw the sequences of a replicate, see :meth:`SequenceLogic.compute_mdc_stability` '''
+    selected = []
+    for species in groups:
+        sel = 0
+        for indices in species:
+            if scheme == "bootstrap":
+                drawn = [rng.choice(indices) for _ in indices]
+            else:
+                drawn = rng.sample(indices, max(1, int(round(fraction * len(indices)))))
+            for i in drawn:
+                sel |= 1 << i
+        selected.append(sel)
+    return tuple(selected)
+
+
+_pool_data = None
+
+
+def _pool_init(data):
+    global _pool_data
+    _pool_data = data
+
+
+def _stability_replicates(seeds, data=None):
+    ''' Compute the MDC counts of a chunk of replicates, one per seed '''
+    data = data or _pool_data
+    _, groups, _, scheme, fraction = data
+    replicates = [_draw_replicate(random.Random(seed), groups, scheme, fraction) for seed in seeds]
+    return _count_mdcs(data, replicates)
+
 
+def _permutation_replicates(seeds, data=None):
+    ''' Compute the number of MDCs of a chunk of permutations, one per seed '''
+    bitsets, n_A, n, method = data or _pool_data
+    counts = []
+    everything = (1 << n) - 1
+    for seed in seeds:
+        sel_A = 0
+        for i in random.Random(seed).sample(range(n), n_A):
+            sel_A |= 1 << i
+        counts.append(sum(1 for _ in _iter_replicate_mdcs(bitsets, method, sel_A, everything & ~sel_A)))
+    return counts
@@ -0,0 +1,675 @@
+''' Module providing a local HTTP analysis service
+
+The service keeps a number of named alignments loaded in memory, so that
+the fasta files are read and parsed only once, and many queries can be
+made against them by several users. The alignments are loaded when they
+are first used, and the least recently used alignment is dropped when
+more than a given number of alignments is resident.
+
+All requests and responses are JSON, except for the reports, which are
+returned as text or xlsx files. Sets of sequences are specified as JSON
+objects, either by a regular expression matching the species names::
+
+    {"regex": "Bankia.*", "invert": false, "exclude": null}
+
+or by a list of species names or a list of IDs::
+
+    {"species": ["Bankia_carinata"]}
+    {"ids": ["WBET129", "WBET131"]}
+
+If set B is omitted, it is the complement of set A.
+
+Only the alignments registered at start up, and fasta files in the data
+directory (if any), can be loaded. Errors while loading an alignment are
+logged by the server, and not returned to the client.
+
+Endpoints
+---------
+GET /alignments
+    list the registered alignments
+POST /alignments/<name>
+    register an alignment, with the body {"filename": ..., "header_format": ...,
+    "IDregex": ..., "SPECIESregex": ...}. Only filename is required. This is
+    only possible if the server has a data directory; the filename is taken
+    relative to it, and must not point outside it. The alignment is loaded
+    first, and only replaces an alignment of the same name if it loads. The
+    alignments registered at start up cannot be replaced.
+GET /alignments/<name>/species
+    list the species names and number of sequences
+POST /alignments/<name>/select
+    list the sequences of a set, with the body {"A": set}
+POST /alignments/<name>/mdcs
+    compute the MDCs, with the body {"A": set, "B": set, "method": "MDC"}
+POST /alignments/<name>/nucs
+    compute the non-unique characters, with the body {"A": set}
+POST /alignments/<name>/report
+    download a report, with the body {"A": set, "B": set, "operation": "MDC",
+    "format": "txt"}. The operation is one of MDC, potential_MDC_only or nucs,
+    the format txt or xlsx.
+'''
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from . import fasta_io, fasta_logic
+from .fasta_doc import ERRORS
+
+logger = logging.getLogger()
+
+
+class ServiceError(Exception):
+    '''
+    Error to be returned to the client
+
+    Parameters
+    ----------
+    status : int
+        HTTP status code
+    message : str
+        error message
+    '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AlignmentCache(object):
+    '''
+    Registry of named alignments, of which the most recently used are kept in memory
+
+    Parameters
+    ----------
+    max_alignments : int, optional
+        maximum number of alignments kept in memory
+
+    Notes
+    -----
+    When an alignment is loaded, its column counts are computed as well, so
+    that sets B that are the complement of set A need not be scanned (see
+    :meth:`fastachar.fasta_logic.SequenceLogic.compute_mdcs_from_counts`).
+    '''
+    def __init__(self, max_alignments=4):
+        self.max_alignments = max_alignments
+        self.registry = {}
+        self.alignments = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+        self.fixed = set()
+
+    @staticmethod
+    def get_hdr_fmt(header_format=None, IDregex=None, SPECIESregex=None):
+        '''
+        Get the header format options that are given, as keywords of
+        :meth:`fastachar.fasta_io.Alignment.set_fasta_hdr_fmt`
+        '''
+        hdr_fmt = dict(header_format=header_format, IDregex=IDregex, SPECIESregex=SPECIESregex)
+        return dict((k, v) for k, v in hdr_fmt.items() if v is not None)
+
+    def register(self, name, filename, header_format=None, IDregex=None, SPECIESregex=None, fixed=False):
+        '''
+        Register an alignment
+
+        Parameters
+        ----------
+        name : str
+            name of the alignment
+        filename : str
+            filename of the fasta file
+        header_format, IDregex, SPECIESregex : str or None, optional
+            regular expressions to parse the fasta headers, see
+            :meth:`fastachar.fasta_io.Alignment.set_fasta_hdr_fmt`. If None,
+            the default is used.
+        fixed : bool, optional
+            if True, the alignment cannot be replaced by :meth:`load_and_register`
+            (for the alignments registered at start up).
+
+        Notes
+        -----
+        If an alignment of the same name was loaded, it is dropped.
+        '''
+        hdr_fmt = self.get_hdr_fmt(header_format, IDregex, SPECIESregex)
+        with self.lock:
+            self.registry[name] = (filename, hdr_fmt)
+            self.alignments.pop(name, None)
+            self.load_locks.setdefault(name, threading.Lock())
+            if fixed:
+                self.fixed.add(name)
+
+    def load_and_register(self, name, filename, header_format=None, IDregex=None, SPECIESregex=None):
+        '''
+        Load an alignment, and register it if it loads
+
+        Parameters
+        ----------
+        name : str
+            name of the alignment
+        filename : str
+            filename of the fasta file
+        header_format, IDregex, SPECIESregex : str or None, optional
+            regular expressions to parse the fasta headers
+
+        Returns
+        -------
+        :class:`fastachar.fasta_io.Alignment`
+
+        Raises
+        ------
+        ServiceError
+            if the name is of an alignment registered at start up, or the
+            alignment cannot be loaded. An alignment registered under the
+            same name is then kept.
+        '''
+        hdr_fmt = self.get_hdr_fmt(header_format, IDregex, SPECIESregex)
+        with self.lock:
+            if name in self.fixed:
+                raise ServiceError(409, "Alignment {} cannot be replaced.".format(name))
+        alignment = self.load(name, filename, hdr_fmt)
+        with self.lock:
+            if name in self.fixed: # registered at start up meanwhile.
+                raise ServiceError(409, "Alignment {} cannot be replaced.".format(name))
+            self.registry[name] = (filename, hdr_fmt)
+            self.load_locks.setdefault(name, threading.Lock())
+            self.add(name, alignment)
+        return alignment
+
+    def load(self, name, filename, hdr_fmt):
+        '''
+        Load an alignment and compute its column counts
+
+        Raises
+        ------
+        ServiceError
+            if the alignment cannot be loaded.
+        '''
+        alignment = fasta_io.Alignment()
+        alignment.set_fasta_hdr_fmt(**hdr_fmt)
+        error, arg = alignment.load(filename)
+        if error:
+            logger.warning("Could not load alignment %s (%s): %s %s", name, filename,
+                           ERRORS.get(error, ERRORS[fasta_io.ERROR_UNKNOWN]), arg)
+            raise ServiceError(400, "Alignment {} could not be loaded.".format(name))
+        alignment.get_column_counts()
+        logger.info("Loaded alignment %s (%s)", name, filename)
+        return alignment
+
+    def add(self, name, alignment):
+        '''
+        Keep an alignment in memory, dropping the least recently used ones; call with the lock held
+        '''
+        self.alignments[name] = alignment
+        self.alignments.move_to_end(name)
+        while len(self.alignments) > self.max_alignments:
+            dropped, _ = self.alignments.popitem(last=False)
+            logger.info("Dropped alignment %s", dropped)
+
+    def get(self, name):
+        '''
+        Get an alignment, loading it if it is not in memory
+
+        Parameters
+        ----------
+        name : str
+            name of the alignment
+
+        Returns
+        -------
+        :class:`fastachar.fasta_io.Alignment`
+
+        Raises
+        ------
+        ServiceError
+            if the alignment is not registered, or cannot be loaded.
+        '''
+        with self.lock:
+            if name not in self.registry:
+                raise ServiceError(404, "Unknown alignment ({}).".format(name))
+            if name in self.alignments:
+                self.alignments.move_to_end(name)
+                return self.alignments[name]
+            load_lock = self.load_locks[name]
+        with load_lock:
+            with self.lock:
+                if name in self.alignments: # loaded by another request meanwhile.
+                    self.alignments.move_to_end(name)
+                    return self.alignments[name]
+                filename, hdr_fmt = self.registry[name]
+            alignment = self.load(name, filename, hdr_fmt)
+            with self.lock:
+                if self.registry.get(name) == (filename, hdr_fmt):
+                    self.add(name, alignment)
+        return alignment
+
+    def unregister(self, name):
+        '''
+        Remove an alignment from the registry
+
+        Parameters
+        ----------
+        name : str
+            name of the alignment
+        '''
+        with self.lock:
+            self.registry.pop(name, None)
+            self.alignments.pop(name, None)
+            self.fixed.discard(name)
+
+    def list(self):
+        '''
+        List the registered alignments
+
+        Returns
+        -------
+        list of dict
+            name, filename and whether the alignment is in memory.
+        '''
+        with self.lock:
+            return [dict(name=name, filename=filename, loaded=name in self.alignments)
+                    for name, (filename, _) in sorted(self.registry.items())]
+
+
+class AnalysisService(object):
+    '''
+    The analyses offered by the HTTP service
+
+    Parameters
+    ----------
+    cache : :class:`AlignmentCache`
+        the registered alignments
+    root : str or None, optional
+        data directory of the fasta files that clients may register. If None,
+        clients cannot register alignments.
+    '''
+    METHODS = ["MDC", "potential_MDC_only"]
+
+    def __init__(self, cache, root=None):
+        self.cache = cache
+        self.root = os.path.realpath(root) if root is not None else None
+        self.logic = fasta_logic.SequenceLogic()
+
+    def resolve(self, filename):
+        '''
+        Get the path of a fasta file in the data directory
+
+        Parameters
+        ----------
+        filename : str
+            filename relative to the data directory
+
+        Returns
+        -------
+        str
+            the real path of the file
+
+        Raises
+        ------
+        ServiceError
+            if there is no data directory, or the file is not in it.
+        '''
+        if self.root is None:
+            raise ServiceError(403, "Registering alignments is not enabled on this server.")
+        path = os.path.realpath(os.path.join(self.root, filename))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ServiceError(403, "Filename is not in the data directory.")
+        return path
+
+    def get_display_filename(self, path):
+        '''
+        Get the filename of an alignment as shown to clients
+
+        Parameters
+        ----------
+        path : str
+            filename of the fasta file on the server
+
+        Returns
+        -------
+        str
+            the filename relative to the data directory, or, for files outside
+            it (registered at start up), the base name.
+        '''
+        path = os.path.realpath(path)
+        if self.root is not None and os.path.commonpath([self.root, path]) == self.root:
+            return os.path.relpath(path, self.root)
+        return os.path.basename(path)
+
+    def select(self, alignment, spec):
+        '''
+        Select a set of sequences
+
+        Parameters
+        ----------
+        alignment : :class:`fastachar.fasta_io.Alignment`
+            alignment to select from
+        spec : dict
+            specification of the set, see the module documentation
+
+        Returns
+        -------
+        list of :class:`fastachar.fasta_logic.Sequence`
+        '''
+        if not isinstance(spec, dict):
+            raise ServiceError(400, "A set must be specified as a JSON object.")
+        if 'regex' in spec:
+            try:
+                return alignment.select_sequences(spec['regex'], invert=spec.get('invert', False),
+                                                  exclude=spec.get('exclude'))
+            except re.error as e:
+                raise ServiceError(400, "Invalid regular expression ({}).".format(e))
+        if 'species' in spec:
+            return alignment.select_sequences_from_list(spec['species'])
+        if 'ids' in spec:
+            ids = set(spec['ids'])
+            return [s for s in alignment.sequences if s.ID in ids]
+        raise ServiceError(400, "A set must be given by regex, species or ids.")
+
+    def select_sets(self, alignment, body):
+        '''
+        Select set A and B from a request body; set B defaults to the complement of A
+
+        Returns
+        -------
+        set_A, set_B : list of :class:`fastachar.fasta_logic.Sequence`
+        is_complement : bool
+            True if set B is the complement of set A
+        '''
+        set_A = self.select(alignment, body.get('A'))
+        if not set_A:
+            raise ServiceError(400, "Set A is empty.")
+        if body.get('B') is None:
+            selected = set(map(id, set_A))
+            return set_A, [s for s in alignment.sequences if id(s) not in selected], True
+        return set_A, self.select(alignment, body['B']), False
+
+    def get_method(self, body, key='method'):
+        '''
+        Get the MDC method from a request body
+        '''
+        method = body.get(key, "MDC")
+        if method not in AnalysisService.METHODS:
+            raise ServiceError(400, "Invalid method ({}). Use either MDC or potential_MDC_only.".format(method))
+        return method
+
+    def compute_mdcs(self, alignment, set_A, set_B, is_complement, method):
+        '''
+        Compute the MDCs, using the column counts of the alignment if set B is the complement of set A
+        '''
+        if is_complement:
+            return self.logic.compute_mdcs_from_counts(set_A, set_B, alignment.get_column_counts(), method)
+        return self.logic.compute_mdcs(set_A, set_B, method)
+
+    def list_alignments(self):
+        '''
+        List the registered alignments
+        '''
+        alignments = self.cache.list()
+        for a in alignments:
+            a['filename'] = self.get_display_filename(a['filename'])
+        return dict(alignments=alignments)
+
+    def register(self, name, body):
+        '''
+        Register and load an alignment
+        '''
+        if not body.get('filename') or not isinstance(body['filename'], str):
+            raise ServiceError(400, "No filename given.")
+        path = self.resolve(body['filename'])
+        self.cache.load_and_register(name, path, body.get('header_format'),
+                                     body.get('IDregex'), body.get('SPECIESregex'))
+        return dict(name=name, filename=self.get_display_filename(path))
+
+    def species(self, name):
+        '''
+        List the species of an alignment
+        '''
+        alignment = self.cache.get(name)
+        species, n_sequences = alignment.get_species_list()
+        return dict(species=[dict(name=s, n_sequences=n) for s, n in zip(species, n_sequences)])
+
+    def sequences(self, name, body):
+        '''
+        List the sequences of set A
+        '''
+        alignment = self.cache.get(name)
+        set_A = self.select(alignment, body.get('A'))
+        return dict(sequences=[dict(ID=s.ID, species=s.species) for s in set_A])
+
+    def mdcs(self, name, body):
+        '''
+        Compute the molecular diagnostic characters of set A
+        '''
+        alignment = self.cache.get(name)
+        method = self.get_method(body)
+        set_A, set_B, is_complement = self.select_sets(alignment, body)
+        mdcs = self.compute_mdcs(alignment, set_A, set_B, is_complement, method)
+        return dict(method=method,
+                    A=[dict(ID=s.ID, species=s.species) for s in set_A],
+                    B=[dict(ID=s.ID, species=s.species) for s in set_B],
+                    mdcs=[dict(position=mdc.position+1, state_A=mdc.a_state, state_B=mdc.b_state,
+                               A=list(mdc.a_values), B=list(mdc.b_values)) for mdc in mdcs])
+
+    def nucs(self, name, body):
+        '''
+        Compute the non-unique characters of set A
+        '''
+        alignment = self.cache.get(name)
+        set_A = self.select(alignment, body.get('A'))
+        nucs = self.logic.list_non_unique_characters_in_set(set_A)
+        return dict(A=[dict(ID=s.ID, species=s.species) for s in set_A],
+                    nucs=[dict(position=nuc.position+1, state=nuc.state, chars=list(nuc.values),
+                               potentially_unique=nuc.is_potentially_unique) for nuc in nucs])
+
+    def report(self, name, body):
+        '''
+        Create a report
+
+        Returns
+        -------
+        content : bytes
+            the report
+        content_type : str
+            MIME type of the report
+        filename : str
+            suggested filename
+        '''
+        alignment = self.cache.get(name)
+        operation = body.get('operation', 'MDC')
+        fmt = body.get('format', 'txt')
+        if fmt not in ('txt', 'xlsx'):
+            raise ServiceError(400, "Invalid format ({}). Use either txt or xlsx.".format(fmt))
+        filename = self.get_display_filename(self.cache.registry[name][0])
+        memofile = io.StringIO()
+        reportxls = fasta_io.ReportXLSX() if fmt == 'xlsx' else None
+        report = fasta_io.Report(filename, output_filename=memofile, reportxls=reportxls)
+        if operation == 'nucs':
+            set_A = self.select(alignment, body.get('A'))
+            report.report_header(set_A, [], "nucs")
+            report.report_nucs("List A", set_A, self.logic.list_non_unique_characters_in_set(set_A))
+        else:
+            method = self.get_method(body, 'operation')
+            set_A, set_B, is_complement = self.select_sets(alignment, body)
+            mdcs = self.compute_mdcs(alignment, set_A, set_B, is_complement, method)
+            report.report_header(set_A, set_B, method)
+            report.report_mdcs("List A", set_A, set_B, mdcs, method)
+        report.report_footer()
+        if fmt == 'txt':
+            return memofile.getvalue().encode(), "text/plain; charset=utf-8", "{}.txt".format(name)
+        fd, tmp = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            reportxls.save(tmp)
+            with open(tmp, 'rb') as fp:
+                content = fp.read()
+        finally:
+            reportxls.clear()
+            os.unlink(tmp)
+        return (content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                "{}.xlsx".format(name))
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    Handler dispatching HTTP requests to the :class:`AnalysisService` of the server
+    '''
+    ROUTES = [('GET', re.compile(r"^/alignments/?$"), 'list_alignments'),
+              ('POST', re.compile(r"^/alignments/([^/]+)/?$"), 'register'),
+              ('GET', re.compile(r"^/alignments/([^/]+)/species/?$"), 'species'),
+              ('POST', re.compile(r"^/alignments/([^/]+)/select/?$"), 'sequences'),
+              ('POST', re.compile(r"^/alignments/([^/]+)/mdcs/?$"), 'mdcs'),
+              ('POST', re.compile(r"^/alignments/([^/]+)/nucs/?$"), 'nucs'),
+              ('POST', re.compile(r"^/alignments/([^/]+)/report/?$"), 'report')]
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ServiceError(400, "Invalid Content-Length header.")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length).decode())
+        except ValueError:
+            raise ServiceError(400, "Request body is not valid JSON.")
+        if not isinstance(body, dict):
+            raise ServiceError(400, "Request body must be a JSON object.")
+        return body
+
+    def dispatch(self, command):
+        path = self.path.split("?")[0]
+        try:
+            for route_command, regex, action in RequestHandler.ROUTES:
+                m = regex.match(path)
+                if m and route_command == command:
+                    break
+            else:
+                raise ServiceError(404, "Not found ({} {}).".format(command, path))
+            args = list(m.groups())
+            if command == 'POST':
+                args.append(self.read_body())
+            result = getattr(self.server.service, action)(*args)
+        except ServiceError as e:
+            self.send_json(dict(error=e.message), e.status)
+        except Exception:
+            logger.exception("Error handling %s %s", command, path)
+            self.send_json(dict(error="Internal error."), 500)
+        else:
+            if action == 'report':
+                self.send_content(*result)
+            else:
+                self.send_json(result)
+
+    def send_json(self, result, status=200):
+        self.send_content(json.dumps(result).encode(), "application/json", status=status)
+
+    def send_content(self, content, content_type, filename=None, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        if filename:
+            self.send_header("Content-Disposition", 'attachment; filename="{}"'.format(filename))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format%args)
+
+
+class AnalysisServer(HTTPServer):
+    '''
+    HTTP server handling requests in a pool of worker threads
+
+    Parameters
+    ----------
+    address : tuple of (str, int)
+        host and port to listen on
+    max_alignments : int, optional
+        maximum number of alignments kept in memory
+    workers : int, optional
+        number of worker threads
+    root : str or None, optional
+        data directory of the fasta files that clients may register
+
+    Attributes
+    ----------
+    cache : :class:`AlignmentCache`
+        the registered alignments
+    service : :class:`AnalysisService`
+        the analyses
+
+    Notes
+    -----
+    The workers share the alignments in memory. Requests are queued when all
+    workers are busy.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, max_alignments=4, workers=4, root=None):
+        super().__init__(address, RequestHandler)
+        self.cache = AlignmentCache(max_alignments)
+        self.service = AnalysisService(self.cache, root)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def serve(alignments, host="127.0.0.1", port=8000, max_alignments=4, workers=4, root=None, **hdr_fmt):
+    '''
+    Run the analysis service until interrupted
+
+    Parameters
+    ----------
+    alignments : dict of {str : str}
+        names and filenames of the alignments to register at start up
+    host : str, optional
+        host name or address to listen on
+    port : int, optional
+        port to listen on
+    max_alignments : int, optional
+        maximum number of alignments kept in memory
+    workers : int, optional
+        number of worker threads
+    root : str or None, optional
+        data directory of the fasta files that clients may register. If None,
+        only the alignments registered at start up are served.
+    hdr_fmt : dict
+        header_format, IDregex and SPECIESregex used for the alignments registered
+        at start up.
+    '''
+    server = AnalysisServer((host, port), max_alignments, workers, root)
+    for name, filename in alignments.items():
+        server.cache.register(name, filename, fixed=True, **hdr_fmt)
+    logger.info("Serving on http://%s:%d/", host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,358 @@
+''' Module to re-run case files when their fasta files change
+
+A :class:`Watcher` polls the fasta files referenced by a number of case
+files (see :class:`fastachar.fasta_io.Case`). When a fasta file changes,
+only the records that were appended or changed are parsed, and the
+per-species column counts (profiles) are updated for the sequences that
+were added or removed. The cases that select any of the affected species
+are recomputed and their reports are written again.
+
+The reports of a case file are written next to it, with the same name
+and the extension .txt (and .xlsx, if requested). The MDC, potential MDC
+and barcode gap operations are supported; the windows operation is not,
+as its widths are not stored in the case file.
+'''
+from collections import Counter
+import hashlib
+import io
+import logging
+import os
+import time
+
+from . import fasta_distance, fasta_io, fasta_logic
+from .fasta_doc import ERRORS
+from .fasta_logic import ColumnCounts
+
+logger = logging.getLogger()
+
+OPERATIONS = {'1': 'MDC', '2': 'potential_MDC_only', '4': 'barcode gap'}
+
+
+class WatchedFasta(object):
+    '''
+    A fasta file of which the parsed records are cached and updated incrementally
+
+    Parameters
+    ----------
+    filename : str
+        filename of the fasta file
+    hdr_fmt : tuple of (str, str, str)
+        header format, ID and species regular expressions
+
+    Attributes
+    ----------
+    alignment : :class:`fastachar.fasta_io.Alignment`
+        the sequences of the file
+    profiles : dict of {str : :class:`fastachar.fasta_logic.ColumnCounts`}
+        column counts per species
+    error : int
+        error code of the last update
+    arg : str
+        error message of the last update
+    '''
+    def __init__(self, filename, hdr_fmt):
+        self.filename = filename
+        self.alignment = fasta_io.Alignment()
+        self.alignment.set_fasta_hdr_fmt(*hdr_fmt)
+        self.records = {}
+        self.profiles = {}
+        self.stat = None
+        self.error = fasta_io.OK
+        self.arg = ''
+
+    def read(self):
+        '''
+        Read the (decompressed) contents of the file
+
+        Returns
+        -------
+        bytes
+        '''
+        if fasta_io.get_compression(self.filename):
+            with fasta_io.open_fasta(self.filename) as fp:
+                return fp.read().encode()
+        with open(self.filename, 'rb') as fp:
+            return fp.read()
+
+    def iter_raw_records(self, data):
+        '''
+        Split the contents of a fasta file into records, without parsing them
+
+        Parameters
+        ----------
+        data : bytes
+            contents of the file
+
+        Yields
+        ------
+        tuple of (int, bytes)
+            line number of the header and the text of the record.
+        '''
+        pos = 0
+        lineno = 0
+        while pos < len(data):
+            i = data.find(b'\n>', pos)
+            end = len(data) if i == -1 else i + 1
+            if data.startswith(b'>', pos):
+                yield lineno, data[pos:end]
+            lineno += data.count(b'\n', pos, end)
+            pos = end
+
+    def parse_record(self, lineno, raw):
+        '''
+        Parse a single record
+
+        Returns
+        -------
+        errorcode : int
+        arg : str
+        sequence : :class:`fastachar.fasta_logic.Sequence` or None
+        '''
+        lines = raw.decode().split("\n")
+        hdr = lines[0].strip()
+        data = "".join([line.strip() for line in lines[1:]])
+        return self.alignment.make_sequence(hdr, data, lineno + len(lines) - 1)
+
+    def update(self):
+        '''
+        Update the sequences and profiles if the file has changed
+
+        Returns
+        -------
+        set of str or None
+            the species of which sequences were added, removed or changed, or
+            None if the file did not change. If the length of the sequences
+            changed, all species are returned.
+
+        Notes
+        -----
+        Records are identified by a hash of their text. The records of which
+        the text is unchanged are not parsed again, and the profiles are only
+        updated for the records that were removed or added.
+        '''
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            st = None
+        stat = st and (st.st_size, st.st_mtime_ns)
+        if stat == self.stat and self.stat is not None:
+            return None
+        self.stat = stat
+        if st is None:
+            self.error, self.arg = fasta_io.ERROR_FILE_NOT_FOUND, self.filename
+            return set(self.profiles)
+        records = {}
+        sequences = []
+        occurrences = Counter()
+        self.error, self.arg = fasta_io.OK, ''
+        for lineno, raw in self.iter_raw_records(self.read()):
+            digest = hashlib.blake2b(raw, digest_size=16).digest()
+            # Identical records are distinguished by their occurrence.
+            key = digest, occurrences[digest]
+            occurrences[digest] += 1
+            sequence = self.records.get(key)
+            if sequence is None:
+                error, arg, sequence = self.parse_record(lineno, raw)
+                if error:
+                    self.error, self.arg = error, arg
+                    break
+            records[key] = sequence
+            sequences.append(sequence)
+        if not self.error and not sequences:
+            self.error, self.arg = fasta_io.ERROR_FILE_INVALID, "Error: Invalid header/file.\n"
+        if not self.error and not self.alignment.are_sequences_of_equal_lengths(sequences):
+            self.error = fasta_io.ERROR_UNEQUAL_SEQS
+        if self.error:
+            changed = set(self.profiles)
+            self.records = {}
+            self.profiles = {}
+            self.alignment.sequences = []
+            return changed
+        length = len(sequences[0])
+        if self.profiles and next(iter(self.profiles.values())).length != length:
+            changed = set(self.profiles)
+            self.profiles = {}
+            removed = []
+            added = sequences
+        else:
+            changed = set()
+            removed = [s for key, s in self.records.items() if key not in records]
+            added = [s for key, s in records.items() if key not in self.records]
+        for sign, group in ((-1, removed), (1, added)):
+            for s in group:
+                profile = self.profiles.setdefault(s.species, ColumnCounts(length))
+                profile.add(s, sign)
+                changed.add(s.species)
+        for species in list(self.profiles):
+            if not self.profiles[species].n_sequences:
+                del self.profiles[species]
+        self.records = records
+        self.alignment.sequences = sequences
+        logger.info("%s: %d records parsed, %d removed", self.filename, len(added), len(removed))
+        return changed
+
+
+class WatchedCase(object):
+    '''
+    A case file of which the reports are regenerated when its sequences change
+
+    Parameters
+    ----------
+    case_file : str
+        filename of the case file
+    formats : list of str, optional
+        formats of the reports, 'txt' and/or 'xlsx'
+    '''
+    def __init__(self, case_file, formats=('txt',)):
+        self.case_file = case_file
+        self.formats = formats
+        self.case = fasta_io.Case()
+        error, arg = self.case.load(case_file)
+        if error:
+            raise ValueError("{}: {} {}".format(case_file, ERRORS.get(error, ''), arg))
+        data = self.case.data
+        # Relative fasta filenames are relative to the case file.
+        self.filename = os.path.join(os.path.dirname(os.path.abspath(case_file)), data['filename'])
+        self.hdr_fmt = (data['regex_header_format'], data['regex_id'], data['regex_species'])
+        self.species = set(data['setA']) | set(data['setB'])
+        self.logic = fasta_logic.SequenceLogic()
+
+    def is_affected(self, changed):
+        '''
+        Check whether the case selects any of the changed species
+
+        Parameters
+        ----------
+        changed : set of str
+            changed species
+
+        Returns
+        -------
+        bool
+        '''
+        return bool(self.species & changed)
+
+    def get_report_filename(self, fmt):
+        '''
+        Get the filename of the report in format fmt
+        '''
+        return os.path.splitext(self.case_file)[0] + "." + fmt
+
+    def run(self, fasta):
+        '''
+        Compute the case and write its reports
+
+        Parameters
+        ----------
+        fasta : :class:`WatchedFasta`
+            the fasta file of the case, up to date
+        '''
+        memofile = io.StringIO()
+        reportxls = fasta_io.ReportXLSX() if 'xlsx' in self.formats else None
+        report = fasta_io.Report(self.filename, output_filename=memofile, reportxls=reportxls)
+        data = self.case.data
+        if fasta.error:
+            memofile.write("{}\n{}\n".format(ERRORS.get(fasta.error, ERRORS[fasta_io.ERROR_UNKNOWN]), fasta.arg))
+        else:
+            alignment = fasta.alignment
+            set_A = alignment.select_sequences_from_list(data['setA'])
+            set_B = alignment.select_sequences_from_list(data['setB'])
+            method = OPERATIONS.get(str(data.get('operation')))
+            if method is None:
+                logger.warning("%s: operation %s is not supported in watch mode.", self.case_file, data.get('operation'))
+                memofile.write("Operation {} is not supported in watch mode.\n".format(data.get('operation')))
+            elif set_A and set_B and method == 'barcode gap':
+                report.report_header(set_A, set_B, method)
+                engine = fasta_distance.DistanceEngine(set_A + set_B)
+                report.report_barcode_gaps("List A and B", engine.compute_barcode_gaps())
+                report.report_footer()
+            elif set_A and set_B:
+                profiles = [fasta.profiles[sp] for sp in self.species if sp in fasta.profiles]
+                counts = profiles[0]
+                for profile in profiles[1:]:
+                    counts = counts + profile
+                mdcs = self.logic.compute_mdcs_from_counts(set_A, set_B, counts, method)
+                report.report_header(set_A, set_B, method)
+                report.report_mdcs("List A", set_A, set_B, mdcs, method)
+                report.report_footer()
+            else:
+                memofile.write("No sequences found for list A and/or list B.\n")
+        with open(self.get_report_filename('txt'), 'w') as fp:
+            fp.write(memofile.getvalue())
+        if reportxls is not None:
+            reportxls.save(self.get_report_filename('xlsx'))
+            reportxls.clear()
+        logger.info("Report of %s written.", self.case_file)
+
+
+class Watcher(object):
+    '''
+    Poll the fasta files of a number of case files and re-run the affected cases
+
+    Parameters
+    ----------
+    case_files : list of str
+        filenames of the case files
+    formats : list of str, optional
+        formats of the reports, 'txt' and/or 'xlsx'
+    interval : float, optional
+        polling interval in seconds
+    '''
+    def __init__(self, case_files, formats=('txt',), interval=2.):
+        self.interval = interval
+        self.cases = [WatchedCase(fn, formats) for fn in case_files]
+        self.fasta_files = {}
+        for case in self.cases:
+            key = (case.filename, case.hdr_fmt)
+            if key not in self.fasta_files:
+                self.fasta_files[key] = WatchedFasta(case.filename, case.hdr_fmt)
+
+    def poll(self):
+        '''
+        Check all fasta files once, and re-run the affected cases
+
+        Returns
+        -------
+        list of :class:`WatchedCase`
+            the cases that were re-run
+        '''
+        changed = {}
+        for key, fasta in self.fasta_files.items():
+            species = fasta.update()
+            if species is not None:
+                changed[key] = species
+        updated = []
+        for case in self.cases:
+            key = (case.filename, case.hdr_fmt)
+            if key in changed and (case.is_affected(changed[key]) or self.fasta_files[key].error):
+                case.run(self.fasta_files[key])
+                updated.append(case)
+        return updated
+
+    def run_all(self):
+        '''
+        Update all fasta files and run all cases
+        '''
+        for fasta in self.fasta_files.values():
+            fasta.update()
+        for case in self.cases:
+            case.run(self.fasta_files[(case.filename, case.hdr_fmt)])
+
+    def run(self, max_polls=None):
+        '''
+        Run all cases, and keep polling until interrupted
+
+        Parameters
+        ----------
+        max_polls : int or None, optional
+            number of polls after which to stop. If None, poll forever.
+        '''
+        self.run_all()
+        n = 0
+        try:
+            while max_polls is None or n < max_polls:
+                time.sleep(self.interval)
+                self.poll()
+                n += 1
+        except KeyboardInterrupt:
+            pass
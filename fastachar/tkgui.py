@@ -20,7 +20,7 @@ import tkinter.ttk as ttk
 
 import configparser
 
-from . import fasta_logic, fasta_io, fasta_doc
+from . import fasta_logic, fasta_io, fasta_doc, fasta_distance
 
 
 CONFIG = dict(linux = dict(INIFILE = 'fastacharrc',
@@ -150,151 +150,6 @@ class ConfigFastachar(object):
 
     
           
-class Case(object):
-    '''
-    Class to hold the information for case files
-    
-    Attributes
-    ----------
-    data : dict
-         dictionary containing all information to write to file.
-    '''
-    LIST_KWDS = "species setA setB".split()
-    
-    def __init__(self):
-        self.clear()
-        
-    def clear(self):
-        ''' 
-        Clear :attr:`data`
-        '''
-        self.data = {}
-        
-    def populate(self, filename,
-                 species,
-                 setA,
-                 setB,
-                 operation,
-                 regex_header_format,
-                 regex_id,
-                 regex_species):
-        '''
-        Write the case information into data dictionary
-        
-        Parameters
-        ----------
-        filename : str
-            Name of input fasta file
-        species : list of str
-            Names of all species read
-        setA : list of :class:`fastachar.fasta_logic.Sequence`
-            list of sequences in list A
-        setB : list of :class:`fastachar.fasta_logic.Sequence`
-            list of sequences in list B
-        operation : int
-            operation of comparison
-        regex_header_format : str
-            regular expression for the header format
-        regex_id : str
-            regular expression for matching the ID or lab codes
-        regex_species : str
-            regular expression for matching the name of the species.
-        '''
-        self.data = dict(filename=filename,
-                         species=species,
-                         setA=setA,
-                         setB=setB,
-                         operation=operation,
-                         regex_header_format=regex_header_format,
-                         regex_id=regex_id,
-                         regex_species=regex_species)
-
-    def parse_line(self, line):
-        '''
-        Parse a line read from the case file
-        
-        Parameters
-        ----------
-        line : str
-            header string
-        
-        Returns
-        -------
-        kwd : str
-            attribute of the configuration
-        value : str or list of str
-            the value of the attribute
-        '''
-        kwd, value = line.split("=")
-        kwd=kwd.strip()
-        value=value.strip()
-        if kwd in Case.LIST_KWDS:
-            if value:
-                value=[i.strip() for i in value.split(",")]
-            else:
-                value = []
-            value.sort()
-        return kwd, value
-    
-    def load(self, filename):
-        '''
-        Load a case file
-        
-        Parameters
-        ----------
-        filename : str
-            name of cae file
-
-        Returns
-        -------
-        error: int
-            error code
-        arg : str
-            error message
-        '''
-        if not os.path.exists(filename):
-            error = fasta.ERROR_FILE_NOT_FOUND
-            arg = filename
-            return error, arg
-        # file exists, now open it.
-        error = fasta_io.OK
-        arg = ''
-        lineno = 0
-        with open(filename,'r') as fp:
-            while True:
-                line = fp.readline()
-                lineno+=1
-                if not line:
-                    break
-                try:
-                    kwd, value = self.parse_line(line)
-                except ValueError:
-                    error = fasta_io.ERROR_CASE
-                    arg = "{} (line no: {}".format(line, lineno)
-                else:
-                    self.data[kwd]=value
-        return error, arg
-    
-    def save(self, filename):
-        '''
-        Save a case file
-
-        Parameters
-        ----------
-        filename : str
-             Name of the case file
-        '''
-        with open(filename,'w') as fp:
-            fp.write("filename = {}\n".format(self.data['filename']))
-            fp.write("species = {}\n".format(" , ".join(self.data['species'])))
-            fp.write("setA = {}\n".format(" , ".join(self.data['setA'])))
-            fp.write("setB = {}\n".format(" , ".join(self.data['setB'])))
-            fp.write("operation = {}\n".format(self.data['operation']))
-            fp.write("regex_header_format = {}\n".format(self.data['regex_header_format']))
-            fp.write("regex_id = {}\n".format(self.data['regex_id']))
-            fp.write("regex_species = {}\n".format(self.data['regex_species']))
-        
-
 class Gui():
     ''' Class defining the grahical user interface
 
@@ -312,10 +167,10 @@ class Gui():
     alignment : :class:`fasta_io.Alignment`
         aligned sequences.
 
-    case : :class:`Case`
+    case : :class:`fasta_io.Case`
         Case object
     
-    reportxls : :class:`fasta_io.ReportXLS`
+    reportxls : :class:`fasta_io.ReportXLSX`
         object for reporting results as excel work sheets.
     '''
     def __init__(self):
@@ -330,8 +185,8 @@ class Gui():
                                              self.config.config['REGEX']['species'])
         except KeyError:
             pass # use default setting
-        self.case = Case()
-        self.reportxls = fasta_io.ReportXLS()
+        self.case = fasta_io.Case()
+        self.reportxls = fasta_io.ReportXLSX()
 
     def getcwd(self):
         '''
@@ -384,7 +239,7 @@ class Gui():
 
         
         self.fasta_file = self.fasta_file or filedialog.askopenfilename(defaultextension=".fas",
-                                                                        filetypes=[('fasta files', '.fas'), ('all files', '.*')],
+                                                                        filetypes=[('fasta files', '.fas'), ('compressed fasta files', ('.gz', '.bgz', '.zst')), ('all files', '.*')],
                                                                         initialdir=self.cwd,
                                                                         #initialfile,
                                                                         multiple=False,
@@ -393,7 +248,7 @@ class Gui():
                                                                         title="Open fasta file")
         lines=[]
         if self.fasta_file:
-            with open(self.fasta_file, 'r') as fp:
+            with fasta_io.open_fasta(self.fasta_file) as fp:
                 while True:
                     l = fp.readline()
                     if l and l.strip().startswith('>'):
@@ -626,6 +481,7 @@ class Gui():
         filemenu = Tk.Menu(menubar, tearoff=0)
         filemenu.add_command(label="Open fasta file", command=self.cb_open_fasta_file)
         filemenu.add_command(label="Open fasta file /w preview", command=self.cb_set_regex)
+        filemenu.add_command(label="Open partition file", command=self.cb_open_partition_file)
         filemenu.add_command(label="Open case file", command=self.cb_open_case_file)
         filemenu.add_command(label="Save case file", command=self.cb_save_case_file)
 
@@ -642,7 +498,7 @@ class Gui():
         menubar.add_cascade(label="Help",  menu=helpmenu)
         outputmenu = Tk.Menu(menubar, tearoff=0)
         outputmenu.add_command(label="Save report (txt)", command=self.cb_save_report)
-        outputmenu.add_command(label="Save report (xls)", command=self.cb_save_report_xls)
+        outputmenu.add_command(label="Save report (xlsx)", command=self.cb_save_report_xls)
         menubar.add_cascade(label="Output", menu=outputmenu)
         # display the menu
         self.root.config(menu=menubar)
@@ -735,6 +591,19 @@ class Gui():
                        variable=self.operation_method, value=1).pack(anchor=Tk.W)
         Tk.Radiobutton(frame, text="Determine potential MDCs for species list A",
                        variable=self.operation_method, value=2).pack(anchor=Tk.W)
+        frame_windows = Tk.Frame(frame)
+        frame_windows.pack(anchor=Tk.W)
+        Tk.Radiobutton(frame_windows, text="Find windows with most MDCs per species in list A, widths:",
+                       variable=self.operation_method, value=3).pack(side=Tk.LEFT)
+        self.window_widths = Tk.StringVar()
+        self.window_widths.set("100")
+        Tk.Entry(frame_windows, textvariable=self.window_widths, width=12).pack(side=Tk.LEFT)
+        Tk.Radiobutton(frame, text="Determine barcode gap per species in lists A and B",
+                       variable=self.operation_method, value=4).pack(anchor=Tk.W)
+        self.permutation_test = Tk.IntVar()
+        self.permutation_test.set(0)
+        Tk.Checkbutton(frame, text="Permutation test of the number of MDCs (1000 permutations)",
+                       variable=self.permutation_test).pack(anchor=Tk.W)
         
         bt_run = Tk.Button(root, text="Process", command=self.cb_run)
         bt_run.grid(row=3, column=1, **cnf)
@@ -835,7 +704,7 @@ class Gui():
         Callback top open a fasta file.
         '''
         self.fasta_file = filedialog.askopenfilename(defaultextension=".fas",
-                                                     filetypes=[('fasta files', '.fas'), ('all files', '.*')],
+                                                     filetypes=[('fasta files', '.fas'), ('compressed fasta files', ('.gz', '.bgz', '.zst')), ('all files', '.*')],
                                                      initialdir=self.cwd,
                                                      #initialfile,
                                                      multiple=False,
@@ -855,6 +724,20 @@ class Gui():
                 arg = fn
             self.error_window(r, arg=arg)
             
+    def cb_open_partition_file(self):
+        '''
+        Callback to open a partition definition for the loaded fasta file.
+        '''
+        partition_file = filedialog.askopenfilename(filetypes=[('partition files', ('.txt', '.part', '.nex')), ('all files', '.*')],
+                                                    initialdir=self.cwd,
+                                                    multiple=False,
+                                                    parent=self.root,
+                                                    title="Open partition file")
+        if partition_file:
+            r, arg = self.alignment.load_partition_definition(partition_file)
+            if r != fasta_io.OK:
+                self.error_window(r, arg=arg)
+
     def cb_open_case_file(self):
         '''
         Callback to open case file.
@@ -1010,19 +893,18 @@ class Gui():
 
     def cb_save_report_xls(self):
         '''
-        Callback to save report as xls file.
+        Callback to save report as xlsx file.
         '''
         error = fasta_io.OK
-        out_file = filedialog.asksaveasfilename(defaultextension=".xls",
-                                                filetypes=[('xls files', '.xls'), ('all files', '.*')],
+        out_file = filedialog.asksaveasfilename(defaultextension=".xlsx",
+                                                filetypes=[('xlsx files', '.xlsx'), ('all files', '.*')],
                                                 initialdir=self.cwd,
                                                 #initialfile,
                                                 #message,
                                                 parent=self.root,
-                                                title="Save output as xls")
+                                                title="Save output as xlsx")
         if not out_file:
             return # Cancel clicked, ignore silently
-        self.reportxls.save(out_file)
         try:
             self.reportxls.save(out_file)
         except FileNotFoundError:
@@ -1046,7 +928,7 @@ class Gui():
         self.report.config(state=Tk.NORMAL)
         self.report.delete(1.0,Tk.END)
         self.report.config(state=Tk.DISABLED)
-        self.reportxls = fasta_io.ReportXLS()
+        self.reportxls = fasta_io.ReportXLSX()
         
     def cb_run(self):
         '''
@@ -1079,12 +961,54 @@ class Gui():
             result = logic.compute_mdcs(set_A, set_B,
                                         method=mdc_method[operation])
             report.report_header(set_A, set_B, method=mdc_method[operation])
-            report.report_mdcs("List A", set_A, set_B, result, method=mdc_method[operation])
+            if self.alignment.partitions:
+                report.report_mdcs_by_partition("List A", set_A, set_B, result, mdc_method[operation],
+                                                self.alignment.partitions)
+            else:
+                report.report_mdcs("List A", set_A, set_B, result, method=mdc_method[operation])
+            if self.permutation_test.get():
+                # In this process: worker processes would re-import the GUI on spawn platforms.
+                permutations = logic.compute_mdc_permutation_test(set_A, set_B, 1000, mdc_method[operation],
+                                                                  processes=1)
+                report.report_permutation_test("List A", permutations, mdc_method[operation])
+            if operation == 1 and not result:
+                # No single MDCs, so look for combinations of positions.
+                cdcs = logic.compute_compound_mdcs(set_A, set_B, max_results=100, max_time=5.)
+                report.report_compound_mdcs("List A", set_A, set_B, cdcs)
+            report.report_footer()
+            self.report.config(state=Tk.NORMAL)
+            self.report.insert(Tk.END, memofile.getvalue())
+            self.report.config(state=Tk.DISABLED)
+        elif operation == 3:
+            try:
+                widths = [int(w) for w in self.window_widths.get().replace(",", " ").split()]
+            except ValueError:
+                widths = []
+            if not widths:
+                self.error_window(fasta_io.ERROR_UNKNOWN, arg="Window widths should be a list of integers.")
+                return
+            report.report_header(set_A, set_B, method="MDC windows")
+            # Each species of list A is compared with all other selected sequences.
+            species = sorted(set([s.species for s in set_A]))
+            try:
+                for sp, sp_A, windows in logic.iter_species_windows(set_A + set_B, widths, species=species):
+                    report.report_windows("{} ({} sequences)".format(sp, len(sp_A)), windows)
+            except ValueError as e:
+                self.error_window(fasta_io.ERROR_UNKNOWN, arg=e.args[0])
+                return
+            report.report_footer()
+            self.report.config(state=Tk.NORMAL)
+            self.report.insert(Tk.END, memofile.getvalue())
+            self.report.config(state=Tk.DISABLED)
+        elif operation == 4:
+            report.report_header(set_A, set_B, method="barcode gap")
+            engine = fasta_distance.DistanceEngine(set_A + set_B)
+            report.report_barcode_gaps("List A and B", engine.compute_barcode_gaps(processes=1))
             report.report_footer()
             self.report.config(state=Tk.NORMAL)
             self.report.insert(Tk.END, memofile.getvalue())
             self.report.config(state=Tk.DISABLED)
-        # elif operation == 3:
+        # elif operation == 5:
         #     result = logic.list_non_unique_characters_in_set(set_A)
         #     report.report_header(set_A, [])
         #     report.report_differences_in_set("List A", set_A, result)
@@ -30,10 +30,11 @@ setup(name="fastachar",
       version=fastachar.__version__,
       packages = ['fastachar'],
       py_modules = [],
-      entry_points = {'console_scripts':[],
+      entry_points = {'console_scripts':['fastachar-cli = fastachar.fasta_cli:main'],
                       'gui_scripts':['fastachar = fastachar.tkgui:main']
                       },
       install_requires = 'sphinx-rtd-theme xlwt'.split(),
+      extras_require = {'parquet':['pyarrow'], 'zstd':['zstandard']},
       author="Lucas Merckelbach",
       author_email="lucas.merckelbach@hzg.de",
       description="A simple program with GUI to compare dna sequences",
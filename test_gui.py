@@ -1,4 +1,6 @@
 import sys
 sys.path.insert(0,'.')
 import fastachar.tkgui
-fastachar.tkgui.main()
+
+if __name__ == "__main__":
+    fastachar.tkgui.main()
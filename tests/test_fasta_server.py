@@ -0,0 +1,80 @@
+''' Round trip tests of the HTTP analysis service on localhost '''
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from fastachar import fasta_server
+
+FASTA = os.path.join(os.path.dirname(__file__), '..', 'data', 'COI_sequences_MUSCLE.fas')
+
+
+class TestAnalysisServer(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        shutil.copy(FASTA, os.path.join(self.root, 'coi.fas'))
+        self.server = fasta_server.AnalysisServer(('127.0.0.1', 0), root=self.root)
+        self.server.cache.register('reference', FASTA, fixed=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+    def request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1])
+        try:
+            data = body if body is None or isinstance(body, bytes) else json.dumps(body).encode()
+            connection.request(method, path, data, headers or {})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read().decode())
+        finally:
+            connection.close()
+
+    def test_register_and_compute(self):
+        status, result = self.request('POST', '/alignments/coi', {'filename': 'coi.fas'})
+        self.assertEqual(status, 200)
+        self.assertEqual(result['filename'], 'coi.fas')
+        # A failed re-registration keeps the alignment.
+        status, _ = self.request('POST', '/alignments/coi', {'filename': 'nonexistent.fas'})
+        self.assertEqual(status, 400)
+        status, result = self.request('GET', '/alignments')
+        self.assertEqual(status, 200)
+        self.assertEqual([(a['name'], a['filename']) for a in result['alignments']],
+                         [('coi', 'coi.fas'), ('reference', 'COI_sequences_MUSCLE.fas')])
+        status, result = self.request('POST', '/alignments/coi/mdcs', {'A': {'regex': 'Bankia'}})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['mdcs']), 41)
+        self.assertTrue(all(s['species'].startswith('Bankia') for s in result['A']))
+
+    def test_start_up_alignments_are_kept(self):
+        status, _ = self.request('POST', '/alignments/reference', {'filename': 'coi.fas'})
+        self.assertEqual(status, 409)
+        status, _ = self.request('POST', '/alignments/reference', {'filename': 'nonexistent.fas'})
+        self.assertEqual(status, 409)
+        status, result = self.request('POST', '/alignments/reference/mdcs', {'A': {'regex': 'Bankia'}})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['mdcs']), 41)
+
+    def test_files_outside_root(self):
+        status, result = self.request('POST', '/alignments/x', {'filename': os.path.abspath(FASTA)})
+        self.assertEqual(status, 403)
+        status, result = self.request('POST', '/alignments/x', {'filename': '../coi.fas'})
+        self.assertEqual(status, 403)
+
+    def test_invalid_content_length(self):
+        status, result = self.request('POST', '/alignments/reference/mdcs', b'{}',
+                                      {'Content-Length': 'abc'})
+        self.assertEqual(status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()